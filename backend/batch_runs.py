@@ -0,0 +1,326 @@
+"""
+Batch runs: a saved workflow over many queries (regression tests, bulk Q&A, evals).
+
+A batch runs in the background, in windows of BATCH_WINDOW queries. Before
+a window's queries are executed, every KB node's retrieval is done for the
+whole window at once (query_vector_store_batch: one embedding call and one
+multi-query Chroma call per collection), which fills the retrieval cache the
+nodes then read from. Queries go through the normal executor with at most
+`concurrency` in flight, and the next window is prefetched while the last
+queries of the previous one finish. One plan and the pooled LLM clients
+serve the whole batch.
+
+Results are appended as NDJSON lines to BATCH_RESULTS_DIR/<batch id>.ndjson,
+next to <batch id>.json holding the workflow, query count and hash of the
+queries file. A batch keeps running when the client that started it goes
+away. Resuming a batch (after a restart or a cancel) with the same queries
+file only runs the queries without an "ok" result, a later line for a
+query replaces an earlier one.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from tracing import finish_run
+from vector_store import query_vector_store_batch
+from workflow_engine import KB_N_RESULTS, WorkflowExecutor, WorkflowGraph, kb_search_targets
+
+load_dotenv()
+
+BATCH_RESULTS_DIR = os.getenv("BATCH_RESULTS_DIR", os.path.join(os.path.dirname(__file__), "batch_runs"))
+# Queries run at the same time per batch (default, and the most a request may ask for)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+# Queries whose retrieval is batched together
+BATCH_WINDOW = int(os.getenv("BATCH_WINDOW", "64"))
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "100000"))
+# Finished batches kept in memory for the status endpoint (older ones are read from disk)
+BATCH_HISTORY = int(os.getenv("BATCH_HISTORY", "100"))
+
+_BATCH_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class BatchInputError(Exception):
+    """Raised when a queries file can't be used"""
+
+
+class BatchNotFoundError(Exception):
+    """Raised for an unknown batch id"""
+
+
+class BatchConflictError(Exception):
+    """Raised when a batch is resumed while it runs, or with different queries"""
+
+
+def read_queries(source) -> Tuple[List[Tuple[Any, str]], str]:
+    """
+    Parse a JSONL queries file: one query per line, either a JSON string or
+    an object with "query" and an optional "id". Returns ([(id, query)], sha256).
+    """
+    digest = hashlib.sha256()
+    queries = []
+    for number, raw in enumerate(source, 1):
+        digest.update(raw)
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            raise BatchInputError(f"Line {number} is not valid JSON")
+        if isinstance(item, dict):
+            item_id, query = item.get("id"), item.get("query")
+        else:
+            item_id, query = None, item
+        if not isinstance(query, str) or not query.strip():
+            raise BatchInputError(f'Line {number} needs a query string or an object with a "query"')
+        queries.append((item_id, query))
+        if len(queries) > BATCH_MAX_QUERIES:
+            raise BatchInputError(f"More than {BATCH_MAX_QUERIES} queries")
+    if not queries:
+        raise BatchInputError("The queries file is empty")
+    return queries, digest.hexdigest()
+
+
+async def prefetch_retrieval(graph: WorkflowGraph, queries: List[str]):
+    """Batched retrieval of every KB node in the plan for these queries, see query_vector_store_batch"""
+    lookups = set()
+    for node_id in graph.order:
+        if node_id in graph.required and graph.node_type(node_id) == "knowledgeBase":
+            data = graph.node_data(node_id)
+            for collection, doc_ids in kb_search_targets(data):
+                lookups.add((collection, tuple(doc_ids) if doc_ids else None, data.get("retrievalMode")))
+    try:
+        await asyncio.gather(*[
+            asyncio.to_thread(query_vector_store_batch, queries, KB_N_RESULTS, collection, doc_ids, mode)
+            for collection, doc_ids, mode in lookups
+        ])
+    except Exception as e:
+        # The KB nodes then search for each query on their own
+        print(f"Batch retrieval prefetch failed: {e}")
+
+
+class BatchRun:
+    """One batch: its files, per-query outcome and the task running it"""
+
+    def __init__(self, batch_id: str, workflow_id: str, total: int, digest: str):
+        self.id = batch_id
+        self.workflow_id = workflow_id
+        self.total = total
+        self.digest = digest
+        # Latest status ("ok"/"error") per query index
+        self.outcomes: Dict[int, str] = {}
+        self.skipped = 0
+        self.status = "stopped"
+        self.started = time.time()
+        self.ran = 0
+        self.run_started: Optional[float] = None
+        # Size of the results file when the current run started, its results follow
+        self.start_offset = 0
+        self._task: Optional[asyncio.Task] = None
+        self._results = None
+        # Replaced (after being set) on every new result, followers wait on it
+        self._changed = asyncio.Event()
+
+    @property
+    def results_path(self) -> str:
+        return os.path.join(BATCH_RESULTS_DIR, f"{self.id}.ndjson")
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(BATCH_RESULTS_DIR, f"{self.id}.json")
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @classmethod
+    def load(cls, batch_id: str) -> "BatchRun":
+        """A batch from its files, with the outcome of every query that has a result"""
+        if not _BATCH_ID.fullmatch(batch_id or ""):
+            raise BatchNotFoundError(f"Unknown batch: {batch_id}")
+        batch = cls(batch_id, "", 0, "")
+        try:
+            with open(batch.meta_path) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise BatchNotFoundError(f"Unknown batch: {batch_id}")
+        batch.workflow_id, batch.total, batch.digest = meta["workflow_id"], meta["total"], meta["digest"]
+        batch.started = meta.get("created_at", batch.started)
+        with open(batch.results_path, "rb") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash, that query runs again
+                    continue
+                batch.outcomes[result["index"]] = result["status"]
+        return batch
+
+    def create_files(self):
+        os.makedirs(BATCH_RESULTS_DIR, exist_ok=True)
+        with open(self.meta_path, "w") as f:
+            json.dump({"workflow_id": self.workflow_id, "total": self.total, "digest": self.digest,
+                       "created_at": self.started}, f)
+        open(self.results_path, "wb").close()
+
+    def start(self, graph: WorkflowGraph, queries: List[Tuple[Any, str]], concurrency: int, timeout: Optional[float]):
+        todo = [i for i in range(self.total) if self.outcomes.get(i) != "ok"]
+        self.skipped = self.total - len(todo)
+        self.status = "running"
+        self.ran = 0
+        self.run_started = time.perf_counter()
+        self._results = open(self.results_path, "ab")
+        if self._results.tell():
+            # Whatever a crash left half-written is ignored, make sure it doesn't run into the next line
+            with open(self.results_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._results.write(b"\n")
+        self.start_offset = self._results.tell()
+        self._task = asyncio.create_task(self._run(graph, queries, todo, concurrency, timeout))
+
+    async def cancel(self):
+        if self.running:
+            self._task.cancel()
+            await asyncio.wait({self._task})
+
+    async def _run(self, graph, queries, todo: List[int], concurrency: int, timeout: Optional[float]):
+        semaphore = asyncio.Semaphore(concurrency)
+        in_flight = set()
+
+        def finished(task):
+            in_flight.discard(task)
+            semaphore.release()
+
+        try:
+            for start in range(0, len(todo), BATCH_WINDOW):
+                window = todo[start:start + BATCH_WINDOW]
+                await prefetch_retrieval(graph, [queries[i][1] for i in window])
+                for index in window:
+                    await semaphore.acquire()
+                    task = asyncio.create_task(self._run_one(graph, index, *queries[index], timeout))
+                    in_flight.add(task)
+                    task.add_done_callback(finished)
+            await asyncio.gather(*list(in_flight))
+            self.status = "completed"
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+            for task in list(in_flight):
+                task.cancel()
+            raise
+        except Exception as e:
+            print(f"Batch {self.id} failed: {e}")
+            self.status = "failed"
+        finally:
+            self._results.close()
+            self._notify()
+
+    async def _run_one(self, graph, index: int, item_id, query: str, timeout: Optional[float]):
+        started = time.perf_counter()
+        # Batch queries aren't conversation turns: no workflow_id, so no memory and nothing recorded
+        executor = WorkflowExecutor(graph, query, timeout=timeout)
+        result = {"type": "result", "index": index, "id": item_id, "query": query}
+        try:
+            response, sources = await executor.run()
+            result.update(status="ok", response=response, sources=sources)
+            finish_run(executor.trace, "batch", "ok")
+        except Exception as e:
+            result.update(status="error", error=str(e))
+            finish_run(executor.trace, "batch", "error")
+        result["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        self._results.write(json.dumps(result, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._results.flush()
+        self.outcomes[index] = result["status"]
+        self.ran += 1
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def follow(self, offset: int = 0) -> AsyncGenerator[bytes, None]:
+        """Result lines from a file offset on, including those still to come, until the batch stops"""
+        with open(self.results_path, "rb") as f:
+            f.seek(offset)
+            pending = b""
+            while True:
+                changed = self._changed
+                data = f.read()
+                if data:
+                    pending += data
+                    *lines, pending = pending.split(b"\n")
+                    for line in lines:
+                        if line.strip():
+                            yield line + b"\n"
+                elif not self.running:
+                    return
+                else:
+                    await changed.wait()
+
+    def progress(self) -> Dict[str, Any]:
+        failed = sum(1 for status in self.outcomes.values() if status != "ok")
+        progress = {
+            "batch_id": self.id,
+            "workflow_id": self.workflow_id,
+            "status": self.status,
+            "total": self.total,
+            "completed": len(self.outcomes),
+            "failed": failed,
+            "skipped": self.skipped,
+        }
+        if self.run_started is not None:
+            elapsed = time.perf_counter() - self.run_started
+            progress["elapsed_s"] = round(elapsed, 2)
+            progress["queries_per_second"] = round(self.ran / elapsed, 2) if elapsed else 0.0
+        return progress
+
+
+batch_runs: "OrderedDict[str, BatchRun]" = OrderedDict()
+
+
+def _trim_history():
+    finished = [batch_id for batch_id, batch in batch_runs.items() if not batch.running]
+    for batch_id in finished[:max(0, len(finished) - BATCH_HISTORY)]:
+        del batch_runs[batch_id]
+
+
+def get_batch(batch_id: str) -> BatchRun:
+    batch = batch_runs.get(batch_id)
+    return batch if batch is not None else BatchRun.load(batch_id)
+
+
+def start_batch(workflow_id: str, graph: WorkflowGraph, queries: List[Tuple[Any, str]], digest: str,
+                concurrency: Optional[int] = None, timeout: Optional[float] = None,
+                resume: Optional[str] = None) -> BatchRun:
+    """Start a new batch, or resume one with the same workflow and queries"""
+    concurrency = max(1, min(concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    if resume:
+        batch = get_batch(resume)
+        if batch.running:
+            raise BatchConflictError(f"Batch {resume} is still running")
+        if batch.workflow_id != workflow_id or batch.digest != digest:
+            raise BatchConflictError(f"Batch {resume} ran another workflow or queries file")
+    else:
+        batch = BatchRun(uuid.uuid4().hex, workflow_id, len(queries), digest)
+        batch.create_files()
+    batch_runs[batch.id] = batch
+    batch_runs.move_to_end(batch.id)
+    _trim_history()
+    batch.start(graph, queries, concurrency, timeout)
+    return batch
+
+
+async def batch_stream(batch: BatchRun) -> AsyncGenerator[bytes, None]:
+    """NDJSON of a started batch: a "batch" header, its new results, then a "summary" line"""
+    header = {"type": "batch", **batch.progress()}
+    yield json.dumps(header).encode("utf-8") + b"\n"
+    async for line in batch.follow(batch.start_offset):
+        yield line
+    yield json.dumps({"type": "summary", **batch.progress()}).encode("utf-8") + b"\n"
@@ -0,0 +1,166 @@
+"""
+Throughput of a saved workflow over a set of queries: one /run_workflow
+request per query versus one /run_workflow_batch upload.
+
+Seeds a knowledge base with --chunks chunks (fake embedder with a
+FAKE_EMBED_LATENCY round-trip per embedding request), saves a KB -> LLM
+workflow against the local fake OpenRouter and runs --queries distinct
+queries both ways at the same concurrency. Reports queries per second and
+how many embedding requests and Chroma lookups were made (from /metrics).
+Finally cancels a batch halfway and resumes it, checking that only the
+missing queries ran again.
+
+Usage (from backend/): python -m benchmarks.bench_batch [--queries 1000 --concurrency 16]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from benchmarks.common import BACKEND_DIR, run_server
+
+FAKE_PORT = 8900
+APP_PORT = 8901
+COLLECTION = "bench-batch"
+WORDS = ("warranty battery charger screen hinge keyboard firmware update reset pairing bluetooth speaker "
+         "return refund shipping invoice serial model repair replacement overheating noise cable adapter").split()
+
+def seed(chunks: int):
+    """Runs in its own process before the API starts, Chroma data is then read by the API"""
+    from vector_store import add_chunks_to_vector_store, collection_name
+    rng = random.Random(7)
+    texts = [" ".join(rng.choice(WORDS) for _ in range(60)) + f" part QX-{i}" for i in range(chunks)]
+
+    async def add():
+        for start in range(0, chunks, 500):
+            await add_chunks_to_vector_store(f"doc{start}", texts[start:start + 500], {"filename": f"manual-{start}.pdf"},
+                                             collection=collection_name(COLLECTION))
+    asyncio.run(add())
+
+def metric(text: str, name: str, call: str) -> float:
+    match = re.search(rf'{name}_count{{call="{call}",status="ok"}} (\S+)', text)
+    return float(match.group(1)) if match else 0.0
+
+def upstream_calls(client: httpx.Client):
+    text = client.get("/metrics").text
+    return metric(text, "upstream_call_seconds", "embedding"), metric(text, "upstream_call_seconds", "vector_query")
+
+async def one_by_one(base_url: str, workflow_id: int, queries, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        async def one(query):
+            async with semaphore:
+                response = await client.post("/run_workflow", json={"workflow_id": str(workflow_id), "query": query})
+                response.raise_for_status()
+        await asyncio.gather(*[one(query) for query in queries])
+
+def batch(client: httpx.Client, workflow_id: int, body: bytes, concurrency: int, resume: str = None, stop_after: int = None):
+    """Upload a batch and read its NDJSON, returns (batch id, result lines, summary)"""
+    form = {"workflow_id": str(workflow_id), "concurrency": str(concurrency)}
+    if resume:
+        form["resume"] = resume
+    results, summary, batch_id = [], None, None
+    with client.stream("POST", "/run_workflow_batch", data=form, files={"file": ("queries.jsonl", body)}) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            item = json.loads(line)
+            if item["type"] == "batch":
+                batch_id = item["batch_id"]
+            elif item["type"] == "result":
+                results.append(item)
+                if stop_after and len(results) >= stop_after:
+                    client.delete(f"/run_workflow_batch/{batch_id}")
+            else:
+                summary = item
+    return batch_id, results, summary
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--seed", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.seed:
+        seed(args.chunks)
+        return
+
+    work_dir = tempfile.mkdtemp()
+    env = {
+        "EMBEDDING_PROVIDER": "fake", "EMBEDDING_CACHE": "0", "FAKE_EMBED_LATENCY": str(args.embed_latency),
+        "CHROMA_DB_DIR": os.path.join(work_dir, "chroma"), "LEXICAL_INDEX_PATH": os.path.join(work_dir, "lexical.db"),
+        "NUMPY_INDEX_DIR": os.path.join(work_dir, "vector_index"),
+        "DATABASE_URL": f"sqlite:///{os.path.join(work_dir, 'bench.db')}", "BATCH_RESULTS_DIR": os.path.join(work_dir, "batches"),
+        "OPENROUTER_API_KEY": "bench-key", "RETRIEVAL_MODE": "vector",
+    }
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "benchmarks.bench_batch", "--seed", "--chunks", str(args.chunks)],
+                   cwd=BACKEND_DIR, env={**os.environ, **env, "FAKE_EMBED_LATENCY": "0"}, check=True, stdout=subprocess.DEVNULL)
+    print(f"Seeded {args.chunks} chunks in {time.perf_counter() - start:.1f}s")
+
+    rng = random.Random(11)
+    queries = [f"{' '.join(rng.sample(WORDS, 4))} question {i}" for i in range(args.queries)]
+    body = "".join(json.dumps({"id": f"q{i}", "query": query}) + "\n" for i, query in enumerate(queries)).encode()
+    graph = {
+        "nodes": [
+            {"id": "kb", "type": "knowledgeBase", "data": {"collection": COLLECTION}},
+            {"id": "llm", "type": "llmEngine", "data": {"model": "fake/model", "temperature": 0}},
+            {"id": "out", "type": "output", "data": {}},
+        ],
+        "edges": [{"source": "kb", "target": "llm"}, {"source": "llm", "target": "out"}],
+    }
+
+    fake_env = {"FAKE_LLM_LATENCY": str(args.llm_latency), "FAKE_LLM_TOKENS": "20", "FAKE_LLM_TOKEN_DELAY": "0"}
+    try:
+        with run_server("benchmarks.fake_openrouter:app", FAKE_PORT, fake_env) as fake_url, \
+             run_server("main:app", APP_PORT, {**env, "OPENROUTER_BASE_URL": fake_url}) as app_url, \
+             httpx.Client(base_url=app_url, timeout=600) as client:
+            workflow_id = client.post("/workflows/", json={"name": "bench batch", "data": graph}).json()["id"]
+            print(f"\n{args.queries} queries, {args.concurrency} concurrent, embedding round-trip {args.embed_latency * 1000:.0f} ms, "
+                  f"LLM {args.llm_latency * 1000:.0f} ms:")
+
+            calls = upstream_calls(client)
+            start = time.perf_counter()
+            asyncio.run(one_by_one(app_url, workflow_id, queries, args.concurrency))
+            elapsed = time.perf_counter() - start
+            after = upstream_calls(client)
+            print(f"  /run_workflow per query  {args.queries / elapsed:7.1f} queries/s  "
+                  f"{after[0] - calls[0]:5.0f} embedding requests  {after[1] - calls[1]:5.0f} Chroma lookups")
+
+            # Different queries than the first pass, so nothing comes from the caches
+            batch_queries = [query.replace("question", "batch question") for query in queries]
+            batch_body = "".join(json.dumps({"id": f"q{i}", "query": query}) + "\n" for i, query in enumerate(batch_queries)).encode()
+            calls = after
+            start = time.perf_counter()
+            _, results, summary = batch(client, workflow_id, batch_body, args.concurrency)
+            elapsed = time.perf_counter() - start
+            after = upstream_calls(client)
+            assert summary["status"] == "completed" and len(results) == args.queries, summary
+            assert all(result["status"] == "ok" for result in results)
+            print(f"  /run_workflow_batch      {args.queries / elapsed:7.1f} queries/s  "
+                  f"{after[0] - calls[0]:5.0f} embedding requests  {after[1] - calls[1]:5.0f} Chroma lookups")
+
+            # Cancel a batch after a third of its results, then resume it
+            resume_body = body.replace(b"question", b"resumed question")
+            batch_id, first, summary = batch(client, workflow_id, resume_body, args.concurrency, stop_after=args.queries // 3)
+            assert summary["status"] == "cancelled", summary
+            _, second, summary = batch(client, workflow_id, resume_body, args.concurrency, resume=batch_id)
+            indexes = sorted({result["index"] for result in first} | {result["index"] for result in second})
+            assert indexes == list(range(args.queries)) and summary["status"] == "completed", summary
+            assert summary["skipped"] == len(first) and len(second) == args.queries - len(first)
+            print(f"  cancel + resume: {len(first)} results before the cancel, {len(second)} after resuming "
+                  f"(skipped {summary['skipped']}), all {args.queries} queries answered")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Chat history recording and paging against a throwaway SQLite database.
+
+1. Hot path: the time a request spends recording a turn, a synchronous
+   INSERT + commit per turn (run in a worker thread, as the app would have
+   to) versus ChatRecorder.record() with the batched write-behind writer.
+   Turns are recorded by concurrent "requests" on the event loop.
+2. Paging: fetching a 20-turn history page deep into a long conversation
+   with OFFSET versus the keyset cursor of GET /workflows/{id}/history.
+3. Memory: loading the last turns of a conversation for an LLM node.
+
+Usage (from backend/): python -m benchmarks.bench_chat_history [--turns 500 --history 100000]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--history", type=int, default=100000)
+    parser.add_argument("--page", type=int, default=20)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'chat.db')}"
+    from fastapi import HTTPException
+    import models
+    from database import AsyncSessionLocal, Base, SessionLocal, async_engine, engine
+    from chat_history import ChatRecorder, _insert_rows, load_memory
+    from pagination import encode_cursor
+    from routers.workflows import read_workflow_history
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add_all([models.Workflow(id=1, name="bench", data={}), models.Workflow(id=2, name="long", data={})])
+    db.commit()
+    answer = "The warranty covers parts and labour for two years from the date of purchase. " * 6
+
+    def record_sync(i):
+        db = SessionLocal()
+        try:
+            db.add(models.ChatHistory(workflow_id=1, conversation_id=f"chat {i % 10}", user_query=f"question {i}",
+                                      ai_response=answer))
+            db.commit()
+        finally:
+            db.close()
+
+    async def hot_path(record):
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+
+        async def one(i):
+            async with semaphore:
+                start = time.perf_counter()
+                await record(i)
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one(i) for i in range(args.turns)])
+        return latencies, time.perf_counter() - start
+
+    async def run_sync():
+        return await hot_path(lambda i: asyncio.to_thread(record_sync, i))
+
+    async def run_write_behind():
+        recorder = ChatRecorder()
+
+        async def record(i):
+            recorder.record(1, f"chat {i % 10}", f"question {i}", answer)
+
+        latencies, elapsed = await hot_path(record)
+        await recorder.close()
+        return latencies, elapsed, recorder.stats()
+
+    print(f"Recording {args.turns} turns from {args.concurrency} concurrent requests:")
+    latencies, elapsed = asyncio.run(run_sync())
+    print(f"  sync insert+commit  per turn p50 {statistics.median(latencies) * 1000:8.3f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:8.3f} ms, all turns durable in {elapsed * 1000:7.0f} ms")
+    latencies, elapsed, stats = asyncio.run(run_write_behind())
+    print(f"  write-behind        per turn p50 {statistics.median(latencies) * 1000:8.3f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:8.3f} ms, written {stats['written']}/{stats['recorded']} on close")
+
+    # A long conversation to page through
+    start_time = datetime.now(timezone.utc) - timedelta(days=30)
+    for offset in range(0, args.history, 5000):
+        rows = [
+            {"workflow_id": 2, "conversation_id": "long", "user_query": f"q{i}", "ai_response": f"a{i}",
+             "created_at": start_time + timedelta(seconds=i)}
+            for i in range(offset, min(offset + 5000, args.history))
+        ]
+        assert _insert_rows(rows) == ([], [])
+
+    def offset_page(skip):
+        return (db.query(models.ChatHistory).filter(models.ChatHistory.workflow_id == 2)
+                .order_by(models.ChatHistory.created_at.desc(), models.ChatHistory.id.desc())
+                .offset(skip).limit(args.page).all())
+
+    async def keyset_page(cursor):
+        async with AsyncSessionLocal() as session:
+            return await read_workflow_history(2, limit=args.page, cursor=cursor, db=session)
+
+    async def paging():
+        depth = args.history - args.page
+        print(f"\nPaging {args.page}-turn pages of a {args.history}-turn conversation:")
+        for label, skip in (("first page", 0), ("middle page", depth // 2), ("last page", depth)):
+            start = time.perf_counter()
+            for _ in range(20):
+                offset_page(skip)
+            offset_ms = (time.perf_counter() - start) / 20 * 1000
+            # The keyset cursor for the same position
+            cursor = None
+            if skip:
+                previous = offset_page(skip - 1)[0]
+                cursor = encode_cursor(previous.created_at, previous.id)
+            start = time.perf_counter()
+            for _ in range(20):
+                page = await keyset_page(cursor)
+            keyset_ms = (time.perf_counter() - start) / 20 * 1000
+            assert [chat.id for chat in page.items] == [chat.id for chat in offset_page(skip)]
+            print(f"  {label:11}  offset {offset_ms:7.2f} ms   keyset {keyset_ms:7.2f} ms")
+
+        try:
+            await keyset_page("not-a-cursor")
+        except HTTPException as e:
+            assert e.status_code == 400
+        await async_engine.dispose()
+
+    asyncio.run(paging())
+
+    async def memory():
+        start = time.perf_counter()
+        for _ in range(50):
+            messages = await load_memory(2, "long", 10, 1000)
+        return (time.perf_counter() - start) / 50 * 1000, messages
+
+    elapsed, messages = asyncio.run(memory())
+    print(f"\nMemory (last 10 turns): {elapsed:.2f} ms per load, {len(messages) // 2} turns, newest "
+          f"{messages[-2]['content']!r}")
+    db.close()
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Retrieval quality and prompt size: fixed 1000-character splitter vs the token-based chunker.
+
+Builds a synthetic multi-page manual where each "fact" sentence answers one
+question, indexes it both ways with the local FakeEmbedder into a throwaway
+Chroma directory and reports, for several n_results, how often the
+retrieved chunks contain the complete answer sentence and how many tokens
+those chunks would add to the LLM prompt.
+
+Usage (from backend/): python -m benchmarks.bench_chunker [--pages 60 --facts 120]
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+
+def made_up_word(rng: random.Random) -> str:
+    return "".join(rng.choice("bcdfghjklmnprstvz") + rng.choice("aeiou") for _ in range(3))
+
+def build_document(pages: int, facts: int, rng: random.Random):
+    filler = [made_up_word(rng) for _ in range(3000)]
+    # Each controller gets a distinctive three-word name the question repeats
+    names = {fact: " ".join(made_up_word(rng) for _ in range(3)) for fact in range(facts)}
+    answers = {}
+    page_texts = []
+    fact_ids = list(range(facts))
+    rng.shuffle(fact_ids)
+    per_page = max(1, facts // pages)
+    for page in range(pages):
+        paragraphs = []
+        for _ in range(rng.randint(3, 6)):
+            sentences = []
+            for _ in range(rng.randint(2, 5)):
+                words = [rng.choice(filler) for _ in range(rng.randint(10, 25))]
+                sentences.append(" ".join(words).capitalize() + ".")
+            if fact_ids and rng.random() < per_page / 4:
+                fact = fact_ids.pop()
+                sentence = f"The reset code for the {names[fact]} controller is {rng.randint(1000, 9999)}."
+                answers[names[fact]] = sentence
+                sentences.insert(rng.randrange(len(sentences) + 1), sentence)
+            paragraphs.append(" ".join(sentences))
+        page_texts.append("\n\n".join(paragraphs))
+    return page_texts, answers
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=60)
+    parser.add_argument("--facts", type=int, default=120)
+    args = parser.parse_args()
+
+    chroma_dir = tempfile.mkdtemp()
+    os.environ.update(EMBEDDING_PROVIDER="fake", EMBEDDING_CACHE="0", CHROMA_DB_DIR=chroma_dir)
+    import vector_store
+    from chunker import chunk_pages
+    from embeddings import FakeEmbedder
+    from tokens import count_tokens
+
+    page_texts, answers = build_document(args.pages, args.facts, random.Random(0))
+    # Wider than the default fake embedder so chunk-sized texts don't saturate the hashed dimensions
+    embedder = FakeEmbedder(dimensions=4096)
+    splitters = {
+        "1000 chars": vector_store.chunk_text("".join(page_texts)),
+        "token chunker": [chunk.text for chunk in chunk_pages(enumerate(page_texts))],
+    }
+    try:
+        for name, chunks in splitters.items():
+            collection = vector_store.get_client().get_or_create_collection(name.replace(" ", "_"), embedding_function=None)
+            for start in range(0, len(chunks), 500):
+                part = chunks[start:start + 500]
+                collection.add(ids=[f"c{start + i}" for i in range(len(part))], documents=part,
+                               embeddings=embedder.embed(part))
+            print(f"{name}: {len(chunks)} chunks")
+            for n_results in (1, 3, 5):
+                found = 0
+                prompt_tokens = 0
+                for controller, sentence in answers.items():
+                    query = f"{controller} reset code"
+                    results = collection.query(query_embeddings=embedder.embed([query]), n_results=n_results)
+                    retrieved = results["documents"][0]
+                    found += any(sentence in doc for doc in retrieved)
+                    prompt_tokens += sum(count_tokens(doc) for doc in retrieved)
+                print(f"  n_results={n_results}: answer retrieved {found / len(answers):6.1%}, "
+                      f"{prompt_tokens / len(answers):6.0f} context tokens per prompt")
+    finally:
+        shutil.rmtree(chroma_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
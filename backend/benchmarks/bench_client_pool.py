@@ -0,0 +1,66 @@
+"""
+Per-request client construction vs the pooled client registry.
+
+Sends requests for many tenants (each with its own API key) to the local
+fake OpenRouter server, once building a fresh AsyncOpenAI client per
+request as the old code did and once going through llm_clients.client_registry.
+
+Usage (from backend/): python -m benchmarks.bench_client_pool [--requests 400] [--tenants 50]
+"""
+import argparse
+import asyncio
+import os
+import time
+from openai import AsyncOpenAI
+from benchmarks.common import run_server
+
+FAKE_PORT = 8900
+MESSAGES = [{"role": "user", "content": "ping"}]
+
+async def fresh_client(base_url: str, api_key: str):
+    client = AsyncOpenAI(base_url=base_url, api_key=api_key)
+    try:
+        await client.chat.completions.create(model="fake/model", messages=MESSAGES)
+    finally:
+        await client.close()
+
+async def pooled_client(registry, base_url: str, api_key: str):
+    client = registry.get(api_key, base_url)
+    await client.chat.completions.create(model="fake/model", messages=MESSAGES)
+
+async def run(label, call, total, tenants, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await call(f"tenant-key-{i % tenants}")
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = sorted(await asyncio.gather(*[bounded(i) for i in range(total)]))
+    elapsed = time.perf_counter() - start
+    print(f"{label:16s} {total / elapsed:8.1f} req/s, mean {sum(latencies) / total * 1000:6.2f} ms, "
+          f"p99 {latencies[int(total * 0.99) - 1] * 1000:6.2f} ms")
+
+async def main_async(base_url, args):
+    from llm_clients import ClientRegistry
+    registry = ClientRegistry()
+    await run("fresh client", lambda key: fresh_client(base_url, key), args.requests, args.tenants, args.concurrency)
+    await run("pooled registry", lambda key: pooled_client(registry, base_url, key), args.requests, args.tenants, args.concurrency)
+    print(f"registry stats: {registry.stats()}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    env = {"FAKE_LLM_LATENCY": "0", "FAKE_LLM_TOKENS": "1", "FAKE_LLM_TOKEN_DELAY": "0"}
+    with run_server("benchmarks.fake_openrouter:app", FAKE_PORT, env) as fake_url:
+        os.environ["OPENROUTER_BASE_URL"] = fake_url
+        asyncio.run(main_async(fake_url, args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Concurrent-request throughput of /run_workflow and /run_workflow_stream on a
+single uvicorn worker, against the local fake OpenRouter server.
+
+Usage (from backend/): python -m benchmarks.bench_concurrency [--requests 50] [--concurrency 25]
+"""
+import argparse
+import asyncio
+import time
+import httpx
+from benchmarks.common import run_server
+
+FAKE_PORT = 8900
+APP_PORT = 8901
+
+WORKFLOW = {
+    "workflow_id": "bench",
+    "query": "What is the warranty period?",
+    "nodes": [
+        {"id": "llm-1", "type": "llmEngine", "data": {"model": "fake/model", "temperature": 0}},
+    ],
+    "edges": [],
+}
+
+async def run_one(client: httpx.AsyncClient, path: str):
+    start = time.perf_counter()
+    if path.endswith("_stream"):
+        async with client.stream("POST", path, json=WORKFLOW) as response:
+            async for _ in response.aiter_bytes():
+                pass
+    else:
+        response = await client.post(path, json=WORKFLOW)
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+async def run_load(base_url: str, path: str, total: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        async def bounded():
+            async with semaphore:
+                return await run_one(client, path)
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*[bounded() for _ in range(total)])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{path:22s} {total} requests, concurrency {concurrency}: "
+          f"{total / elapsed:7.2f} req/s, p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:7.1f} ms, wall {elapsed:.2f} s")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=25)
+    args = parser.parse_args()
+
+    with run_server("benchmarks.fake_openrouter:app", FAKE_PORT) as fake_url:
+        env = {"OPENROUTER_BASE_URL": fake_url, "OPENROUTER_API_KEY": "bench-key"}
+        with run_server("main:app", APP_PORT, env) as app_url:
+            for path in ("/run_workflow", "/run_workflow_stream"):
+                asyncio.run(run_load(app_url, path, args.requests, args.concurrency))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Context assembly time for large retrievals.
+
+Builds overlapping chunks (as chunker.py produces them) from several
+documents plus web results and times assemble_context() for growing
+numbers of candidates. Also prints how much of the budget was used and how
+many tokens deduplication and trimming saved.
+
+Usage (from backend/): python -m benchmarks.bench_context_assembly [--budget 2000]
+"""
+import argparse
+import random
+import time
+
+def make_chunks(doc: str, count: int, rng: random.Random, words_per_chunk: int = 180, overlap_words: int = 25):
+    words = [f"{rng.choice(['valve', 'pump', 'sensor', 'reset', 'firmware', 'pressure', 'manual'])}{rng.randint(0, 99)}"
+             for _ in range(count * (words_per_chunk - overlap_words) + overlap_words)]
+    chunks = []
+    for i in range(count):
+        start = i * (words_per_chunk - overlap_words)
+        sentence_words = words[start:start + words_per_chunk]
+        chunks.append(". ".join(" ".join(sentence_words[j:j + 15]) for j in range(0, len(sentence_words), 15)) + ".")
+    return [(doc, chunk) for chunk in chunks]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    from context_assembly import ContextItem, assemble_context
+    from tokens import count_tokens
+
+    rng = random.Random(0)
+    query = "How do I reset pump12 after a pressure7 fault?"
+    for candidates in (10, 50, 200, 1000):
+        docs = max(1, candidates // 50)
+        chunks = []
+        for d in range(docs):
+            chunks.extend(make_chunks(f"doc-{d}.pdf", candidates // docs, rng))
+        # Retrieval returns neighbouring (overlapping) chunks and repeats across KB nodes
+        rng.shuffle(chunks)
+        chunks += chunks[:candidates // 10]
+        kb_items = [ContextItem(text, doc, "kb", i) for i, (doc, text) in enumerate(chunks)]
+        web_items = [ContextItem(f"Title: result {i}\nSnippet: {text[:300]}\nLink: https://example.com/{i}", f"Web: result {i}", "web", i)
+                     for i, (_, text) in enumerate(chunks[:10])]
+        raw_tokens = sum(count_tokens(item.text) for item in kb_items + web_items)
+
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            assembled = assemble_context(query, kb_items, web_items, "", args.budget)
+        elapsed = (time.perf_counter() - start) / args.repeats
+        print(f"{len(kb_items) + len(web_items):5d} candidates ({raw_tokens:7d} tokens): {elapsed * 1000:7.2f} ms, "
+              f"{assembled.tokens}/{args.budget} tokens used, {len(assembled.usage)} sources, {assembled.dropped} dropped")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Critical-path latency of the DAG executor.
+
+Runs a fan-in workflow (three KB nodes and web search feeding one LLM, plus a
+second LLM branch, both feeding the answering LLM) with simulated vector
+query and search latency against the local fake OpenRouter server, and
+compares wall time with the sum of all node times.
+
+Usage (from backend/): python -m benchmarks.bench_dag
+"""
+import asyncio
+import os
+import time
+from benchmarks.common import run_server
+
+FAKE_PORT = 8900
+KB_LATENCY = 0.3
+SEARCH_LATENCY = 0.4
+LLM_LATENCY = 0.5
+
+NODES = [
+    {"id": "query", "type": "userQuery", "data": {}},
+    {"id": "kb-1", "type": "knowledgeBase", "data": {"file": {"id": "1", "name": "a.pdf"}}},
+    {"id": "kb-2", "type": "knowledgeBase", "data": {"file": {"id": "2", "name": "b.pdf"}}},
+    {"id": "kb-3", "type": "knowledgeBase", "data": {"file": {"id": "3", "name": "c.pdf"}}},
+    {"id": "llm-research", "type": "llmEngine", "data": {"model": "fake/model", "useWebSearch": True, "serpApiKey": "bench"}},
+    {"id": "llm-summary", "type": "llmEngine", "data": {"model": "fake/model"}},
+    {"id": "llm-answer", "type": "llmEngine", "data": {"model": "fake/model"}},
+    {"id": "output", "type": "output", "data": {}},
+]
+EDGES = [
+    {"source": "query", "target": "kb-1"},
+    {"source": "query", "target": "kb-2"},
+    {"source": "query", "target": "kb-3"},
+    {"source": "kb-1", "target": "llm-research"},
+    {"source": "kb-2", "target": "llm-research"},
+    {"source": "kb-3", "target": "llm-summary"},
+    {"source": "llm-research", "target": "llm-answer"},
+    {"source": "llm-summary", "target": "llm-answer"},
+    {"source": "llm-answer", "target": "output"},
+]
+
+async def fake_query_collections(query_text, targets, n_results=5, mode=None):
+    await asyncio.sleep(KB_LATENCY)
+    doc_id = targets[0][1][0]
+    return [{"document": f"chunk from doc {doc_id}", "metadata": {"filename": f"doc-{doc_id}.pdf"}, "distance": 0.1}]
+
+async def run(executor_cls, graph_cls, runs: int):
+    from web_search import StubProvider, set_search_provider
+    timings = []
+    for _ in range(runs):
+        # A fresh stub each run also clears the search cache, so every run waits for the search
+        provider = StubProvider()
+        provider.latency = SEARCH_LATENCY
+        set_search_provider(provider)
+        start = time.perf_counter()
+        await executor_cls(graph_cls(NODES, EDGES), "How do I reset the device?").run()
+        timings.append(time.perf_counter() - start)
+        assert provider.requests == 1, "the web search branch did not run"
+    return min(timings)
+
+def main():
+    env = {"FAKE_LLM_LATENCY": str(LLM_LATENCY), "FAKE_LLM_TOKENS": "1", "FAKE_LLM_TOKEN_DELAY": "0"}
+    with run_server("benchmarks.fake_openrouter:app", FAKE_PORT, env) as fake_url:
+        os.environ["OPENROUTER_BASE_URL"] = fake_url
+        os.environ["OPENROUTER_API_KEY"] = "bench-key"
+        import workflow_engine
+        workflow_engine.query_collections = fake_query_collections
+
+        wall = asyncio.run(run(workflow_engine.WorkflowExecutor, workflow_engine.WorkflowGraph, runs=3))
+
+    serial = 3 * KB_LATENCY + SEARCH_LATENCY + 3 * LLM_LATENCY
+    critical = max(KB_LATENCY, SEARCH_LATENCY) + 2 * LLM_LATENCY
+    print(f"sum of node times:  {serial * 1000:7.1f} ms")
+    print(f"critical path:      {critical * 1000:7.1f} ms")
+    print(f"executor wall time: {wall * 1000:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
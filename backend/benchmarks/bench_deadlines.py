@@ -0,0 +1,93 @@
+"""
+Deadlines and cancellation against slow local upstreams.
+
+Starts the fake OpenRouter server (about 2 s per answer) and a fake SerpAPI
+that takes FAKE_SEARCH_LATENCY seconds, then checks that:
+  - a web search slower than its node's webSearchTimeout is skipped and
+    the run still answers
+  - a run whose deadline (request "timeout") expires before the LLM answers
+    returns promptly with a timeout message instead of waiting
+  - a streamed answer is cut off at the deadline, keeping the partial text
+  - a streaming client that disconnects makes the app abandon the provider
+    stream (counted by the fake server)
+  - a non-streaming client that disconnects gets its run cancelled (the app
+    logs "Client disconnected, cancelled the run")
+
+Usage (from backend/): python -m benchmarks.bench_deadlines [--search-latency 5]
+"""
+import argparse
+import json
+import time
+import httpx
+from benchmarks.common import run_server
+
+FAKE_LLM_PORT = 8900
+APP_PORT = 8901
+FAKE_SEARCH_PORT = 8902
+
+def workflow(timeout=None, web_search_timeout=None):
+    llm_data = {"model": "fake/model", "temperature": 0}
+    if web_search_timeout:
+        llm_data.update(useWebSearch=True, serpApiKey="bench-key", webSearchTimeout=web_search_timeout)
+    body = {"workflow_id": "bench-deadlines", "query": "What is covered?",
+            "nodes": [{"id": "llm-1", "type": "llmEngine", "data": llm_data}], "edges": []}
+    if timeout:
+        body["timeout"] = timeout
+    return body
+
+def timed_run(client: httpx.Client, body):
+    start = time.perf_counter()
+    result = client.post("/run_workflow", json=body).json()
+    return time.perf_counter() - start, result
+
+def stream_frames(client: httpx.Client, body, stop_after_content: bool = False):
+    start = time.perf_counter()
+    frames = []
+    with client.stream("POST", "/run_workflow_stream", json=body) as response:
+        for line in response.iter_lines():
+            if line.startswith("data: "):
+                frames.append(json.loads(line[6:]))
+                if stop_after_content and frames[-1]["type"] == "content":
+                    break
+    return time.perf_counter() - start, frames
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--search-latency", type=float, default=5.0)
+    args = parser.parse_args()
+
+    llm_env = {"FAKE_LLM_LATENCY": "0.2", "FAKE_LLM_TOKENS": "100", "FAKE_LLM_TOKEN_DELAY": "0.02"}
+    with run_server("benchmarks.fake_openrouter:app", FAKE_LLM_PORT, llm_env) as llm_url, \
+         run_server("benchmarks.fake_serpapi:app", FAKE_SEARCH_PORT, {"FAKE_SEARCH_LATENCY": str(args.search_latency)}) as search_url:
+        env = {"OPENROUTER_BASE_URL": llm_url, "OPENROUTER_API_KEY": "bench-key", "SERPAPI_URL": f"{search_url}/search.json"}
+        with run_server("main:app", APP_PORT, env) as app_url, httpx.Client(base_url=app_url, timeout=60) as client:
+            elapsed, result = timed_run(client, workflow())
+            print(f"baseline run:                       {elapsed:5.2f} s  {result['response'][:40]!r}")
+
+            elapsed, result = timed_run(client, workflow(web_search_timeout=1))
+            print(f"search takes {args.search_latency:.0f} s, webSearchTimeout 1: {elapsed:5.2f} s  {result['response'][:40]!r}")
+
+            elapsed, result = timed_run(client, workflow(timeout=1))
+            print(f"run timeout 1 s:                    {elapsed:5.2f} s  {result['response'][:40]!r}")
+
+            elapsed, frames = stream_frames(client, workflow(timeout=1))
+            text = "".join(frame["content"] for frame in frames if frame["type"] == "content")
+            last = frames[-1]
+            print(f"streamed, run timeout 1 s:          {elapsed:5.2f} s  {len(text.split())}/100 tokens, "
+                  f"last event {last['type']}: {last.get('content', '')!r}")
+
+            before = httpx.get(f"{llm_url}/stats").json()
+            elapsed, frames = stream_frames(client, workflow(), stop_after_content=True)
+            time.sleep(0.5)
+            after = httpx.get(f"{llm_url}/stats").json()
+            print(f"streaming client disconnects:       {elapsed:5.2f} s  provider streams abandoned: "
+                  f"{after['cancelled'] - before['cancelled']}, completed: {after['completed'] - before['completed']}")
+
+            try:
+                httpx.post(f"{app_url}/run_workflow", json=workflow(web_search_timeout=30), timeout=0.5)
+            except httpx.TimeoutException:
+                print("non-streaming client disconnects after 0.5 s (see the app log)")
+            time.sleep(0.5)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Embedding cache effect on re-ingesting a lightly edited document.
+
+Embeds a document's chunks once, then re-embeds a copy where only a share of
+the chunks changed (the usual "re-upload after a small edit" case), with and
+without the content-addressed cache in front of the FakeEmbedder.
+
+Usage (from backend/): python -m benchmarks.bench_embedding_cache [--chunks 2000 --changed 0.05]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--changed", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    cache_path = os.path.join(tempfile.mkdtemp(), "embedding_cache.db")
+    os.environ.update(EMBEDDING_PROVIDER="fake", FAKE_EMBED_LATENCY=str(args.latency))
+    from embedding_cache import CachedEmbedder, EmbeddingCache
+    from embeddings import EmbeddingWriter, FakeEmbedder, pack_batches
+
+    words = ["valve", "pressure", "reset", "controller", "pump", "error", "manual", "sensor", "firmware"]
+    rng = random.Random(0)
+    original = [" ".join(rng.choice(words) for _ in range(160))[:1000] for _ in range(args.chunks)]
+    edited = list(original)
+    for i in rng.sample(range(args.chunks), int(args.chunks * args.changed)):
+        edited[i] = f"revised section {i} " + edited[i][:980]
+
+    async def embed_all(writer, chunks):
+        # Same token-budgeted batches as ingestion, without the Chroma write
+        await asyncio.gather(*(writer.embed([chunks[i] for i in batch]) for batch in pack_batches(chunks)))
+
+    for label, use_cache in (("no cache", False), ("cache", True)):
+        fake = FakeEmbedder()
+        sent = []
+        provider_embed = fake.embed
+        fake.embed = lambda texts: sent.append(len(texts)) or provider_embed(texts)
+        embedder = CachedEmbedder(fake, EmbeddingCache(cache_path)) if use_cache else fake
+        writer = EmbeddingWriter(embedder)
+        asyncio.run(embed_all(writer, original))
+        first_requests = fake.requests
+        sent.clear()
+
+        start = time.perf_counter()
+        asyncio.run(embed_all(writer, edited))
+        elapsed = time.perf_counter() - start
+        line = f"{label:>8}: re-ingest {elapsed:.2f} s, {fake.requests - first_requests} provider requests, {sum(sent)} texts embedded"
+        if use_cache:
+            line += f", hit rate {embedder.cache.stats()['hit_rate']:.0%} overall"
+        print(line)
+
+if __name__ == "__main__":
+    main()
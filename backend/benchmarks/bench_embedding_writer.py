@@ -0,0 +1,53 @@
+"""
+Embedding writer throughput with a simulated slow, rate-limited provider.
+
+Uses the local FakeEmbedder (FAKE_EMBED_LATENCY per request and a share of
+429 responses) and a throwaway Chroma directory, and compares concurrency
+levels of EmbeddingWriter.
+
+Usage (from backend/): python -m benchmarks.bench_embedding_writer [--chunks 2000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--rate-limit", type=float, default=0.1)
+    parser.add_argument("--batch-tokens", type=int, default=20000)
+    args = parser.parse_args()
+
+    chroma_dir = tempfile.mkdtemp()
+    os.environ.update(EMBEDDING_PROVIDER="fake", CHROMA_DB_DIR=chroma_dir,
+                      FAKE_EMBED_LATENCY=str(args.latency), FAKE_EMBED_429_RATE=str(args.rate_limit))
+    import vector_store
+    from embeddings import EmbeddingWriter, FakeEmbedder
+
+    words = ["valve", "pressure", "reset", "controller", "pump", "error", "manual", "sensor", "firmware"]
+    rng = random.Random(0)
+    chunks = [" ".join(rng.choice(words) for _ in range(160))[:1000] for _ in range(args.chunks)]
+    try:
+        for concurrency in (1, 2, 4, 8):
+            embedder = FakeEmbedder()
+            writer = EmbeddingWriter(embedder, batch_tokens=args.batch_tokens, concurrency=concurrency)
+            collection = vector_store.get_client().get_or_create_collection(f"bench_{concurrency}", embedding_function=None)
+            ids = [f"doc_{i}" for i in range(len(chunks))]
+            metadatas = [{"doc_id": "doc"} for _ in chunks]
+
+            start = time.perf_counter()
+            asyncio.run(writer.write(collection, ids, chunks, metadatas))
+            elapsed = time.perf_counter() - start
+            assert collection.count() == len(chunks)
+            print(f"concurrency {concurrency}: {len(chunks) / elapsed:8.1f} chunks/s, "
+                  f"{embedder.requests} requests ({writer.retries} retried after 429), {elapsed:.2f} s")
+    finally:
+        shutil.rmtree(chroma_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Retrieval quality and latency: vector-only vs hybrid (BM25 + vector) vs lexical-only.
+
+Indexes synthetic catalogue chunks, each naming a part number (e.g.
+"QX-4821") and a made-up component, into a throwaway Chroma directory and
+lexical index with the local FakeEmbedder. Then asks two kinds of
+questions: by part number, where embeddings are weakest, and by component
+description, where keywords alone may not be enough. Reports recall@n
+(the answering chunk is among the results), median latency and how many
+embedding calls each mode made. FAKE_EMBED_LATENCY (default 0.05s here)
+stands in for the embedding API round-trip the lexical fast path avoids.
+
+Usage (from backend/): python -m benchmarks.bench_hybrid [--chunks 5000 --queries 200]
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+def made_up_word(rng: random.Random) -> str:
+    return "".join(rng.choice("bcdfghjklmnprstvz") + rng.choice("aeiou") for _ in range(3))
+
+def build_catalogue(chunks: int, rng: random.Random):
+    filler = [made_up_word(rng) for _ in range(2000)]
+    texts, codes, names = [], [], []
+    for i in range(chunks):
+        code = f"{rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ')}{rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ')}-{1000 + i}"
+        name = " ".join(made_up_word(rng) for _ in range(2))
+        words = " ".join(rng.choice(filler) for _ in range(rng.randint(60, 120)))
+        texts.append(f"Part {code} is the {name} assembly. {words.capitalize()}.")
+        codes.append(code)
+        names.append(name)
+    return texts, codes, names
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=5)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    os.environ.update(
+        EMBEDDING_PROVIDER="fake", EMBEDDING_CACHE="0", CHROMA_DB_DIR=os.path.join(work_dir, "chroma"),
+        NUMPY_INDEX_DIR=os.path.join(work_dir, "vector_index"),
+        LEXICAL_INDEX_PATH=os.path.join(work_dir, "lexical.db"),
+    )
+    os.environ.setdefault("FAKE_EMBED_LATENCY", "0.05")
+    from query_cache import query_embedding_cache, retrieval_cache
+    from embeddings import FakeEmbedder, set_embedder
+    from vector_store import add_chunks_to_vector_store, query_vector_store
+
+    rng = random.Random(0)
+    texts, codes, names = build_catalogue(args.chunks, rng)
+    # Wider than the default fake embedder so chunk-sized texts don't saturate the hashed dimensions
+    embedder = FakeEmbedder(dimensions=4096)
+    set_embedder(embedder)
+    latency = embedder.latency
+    # Indexing isn't what is measured, skip the simulated round-trips
+    embedder.latency = 0
+    for start in range(0, len(texts), 500):
+        asyncio.run(add_chunks_to_vector_store("catalogue", texts[start:start + 500], {"filename": "catalogue.pdf"},
+                                               start, collection="kb_bench"))
+    embedder.latency = latency
+
+    picked = rng.sample(range(args.chunks), args.queries)
+    question_sets = {
+        "part number": [(f"What is part {codes[i]}?", i) for i in picked],
+        "description": [(f"Which part is the {names[i]} assembly?", i) for i in picked],
+    }
+    try:
+        for label, questions in question_sets.items():
+            print(f"{label} questions ({len(questions)}, {args.chunks} chunks, n_results={args.n_results}):")
+            for mode in ("vector", "hybrid", "lexical"):
+                query_embedding_cache.clear()
+                retrieval_cache.clear()
+                requests_before = embedder.requests
+                hits = 0
+                timings = []
+                for question, answer in questions:
+                    start = time.perf_counter()
+                    result = query_vector_store(question, args.n_results, collection="kb_bench", mode=mode)
+                    timings.append(time.perf_counter() - start)
+                    hits += f"catalogue_{answer}" in result["ids"][0]
+                print(f"  {mode:8s} recall {hits / len(questions):6.1%}  median {statistics.median(timings) * 1000:7.2f} ms  "
+                      f"embedding calls {embedder.requests - requests_before:4d}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Knowledge base retrieval latency: one shared, filtered collection vs per-knowledge-base collections.
+
+The corpus is split into knowledge bases of --docs-per-kb documents. For
+growing corpus sizes it compares, per query:
+  - shared:  the global collection filtered to one knowledge base's doc_ids
+  - per-KB:  that knowledge base's own collection, unfiltered
+and for a query spanning --fanout knowledge bases:
+  - shared:  one global query filtered to all their doc_ids
+  - fan-out: concurrent queries to each knowledge base collection, merged by rank
+
+Uses random vectors in a throwaway Chroma directory, no embedding API needed.
+
+Usage (from backend/): python -m benchmarks.bench_kb_fanout [--sizes 2000 10000 30000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+DIMENSIONS = 256
+
+def random_vectors(rng: random.Random, count: int):
+    return [[rng.gauss(0, 1) for _ in range(DIMENSIONS)] for _ in range(count)]
+
+def timed(fn, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 10000, 30000])
+    parser.add_argument("--chunks-per-doc", type=int, default=50)
+    parser.add_argument("--docs-per-kb", type=int, default=20)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    chroma_dir = tempfile.mkdtemp()
+    os.environ.update(EMBEDDING_PROVIDER="fake", EMBEDDING_CACHE="0", CHROMA_DB_DIR=chroma_dir, RETRIEVAL_MODE="vector")
+    import vector_store
+    from vector_store import query_collections
+
+    rng = random.Random(0)
+    query = random_vectors(rng, 1)[0]
+    # query_collections embeds the query text, answer it from the query embedding cache
+    vector_store.embed_query = lambda text: query
+    try:
+        for size in args.sizes:
+            docs = size // args.chunks_per_doc
+            kbs = max(args.fanout, docs // args.docs_per_kb)
+            shared = vector_store.get_client().create_collection(f"shared_{size}", embedding_function=None)
+            for doc in range(docs):
+                kb = doc % kbs
+                ids = [f"{doc}_{i}" for i in range(args.chunks_per_doc)]
+                vectors = random_vectors(rng, args.chunks_per_doc)
+                metadatas = [{"doc_id": str(doc)} for _ in ids]
+                shared.add(ids=ids, embeddings=vectors, metadatas=metadatas, documents=ids)
+                vector_store.get_collection(f"kb_{size}_{kb}").add(ids=ids, embeddings=vectors, metadatas=metadatas, documents=ids)
+
+            def kb_docs(kb):
+                return [str(doc) for doc in range(docs) if doc % kbs == kb]
+            one_kb = kb_docs(0)
+            many_kbs = [doc for kb in range(args.fanout) for doc in kb_docs(kb)]
+
+            single_shared = timed(lambda: shared.query(query_embeddings=[query], n_results=5,
+                                                       where={"doc_id": {"$in": one_kb}}), args.repeats)
+            single_kb = timed(lambda: vector_store.get_collection(f"kb_{size}_0").query(query_embeddings=[query], n_results=5),
+                              args.repeats)
+            fan_shared = timed(lambda: shared.query(query_embeddings=[query], n_results=5,
+                                                    where={"doc_id": {"$in": many_kbs}}), args.repeats)
+            targets = [(f"kb_{size}_{kb}", None) for kb in range(args.fanout)]
+            fan_out = timed(lambda: asyncio.run(query_collections(f"q{time.perf_counter()}", targets, 5)), args.repeats)
+
+            print(f"{size:6d} chunks, {kbs} knowledge bases of {len(one_kb)} docs:")
+            print(f"  1 KB:  shared filtered {single_shared:7.2f} ms | own collection {single_kb:7.2f} ms")
+            print(f"  {args.fanout} KBs: shared filtered {fan_shared:7.2f} ms | fan-out         {fan_out:7.2f} ms")
+    finally:
+        shutil.rmtree(chroma_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
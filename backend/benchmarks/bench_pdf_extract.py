@@ -0,0 +1,69 @@
+"""
+Serial page loop vs process-pool extraction (pdf_extract.iter_pdf_pages)
+on a generated PDF.
+
+Usage (from backend/): python -m benchmarks.bench_pdf_extract [--pages 1000]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import fitz  # PyMuPDF
+import pdf_extract
+
+LINE = "Error E-{n:04d}: check the pressure valve and reset the controller before restarting. "
+
+def generate_pdf(path: str, pages: int):
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        text = "\n".join(LINE.format(n=p * 40 + i) for i in range(40))
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=7)
+    doc.save(path)
+    doc.close()
+
+def serial_extract(path: str) -> int:
+    # The original upload_document loop
+    text_content = ""
+    with fitz.open(path) as doc:
+        for page in doc:
+            text_content += page.get_text()
+    return len(text_content)
+
+async def parallel_extract(path: str) -> int:
+    total = 0
+    async for _, text in pdf_extract.iter_pdf_pages(path):
+        total += len(text)
+    return total
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=1000)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        generate_pdf(path, args.pages)
+        # Warm the pool so process start-up isn't counted against a single run
+        asyncio.run(parallel_extract(path))
+
+        start = time.perf_counter()
+        serial_chars = serial_extract(path)
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parallel_chars = asyncio.run(parallel_extract(path))
+        parallel = time.perf_counter() - start
+
+        assert serial_chars == parallel_chars
+        print(f"{args.pages} pages, {pdf_extract.PDF_EXTRACT_PROCESSES} processes, {pdf_extract.PDF_SHARD_PAGES} pages/shard")
+        print(f"serial loop:  {args.pages / serial:8.1f} pages/s ({serial:.2f} s)")
+        print(f"process pool: {args.pages / parallel:8.1f} pages/s ({parallel:.2f} s)")
+    finally:
+        pdf_extract.shutdown_process_pool()
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
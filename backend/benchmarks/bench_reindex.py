@@ -0,0 +1,135 @@
+"""
+Re-indexing a revised document: uploading it again as a new document
+versus replacing the existing one (PUT /documents/{id}).
+
+Builds a --pages page manual, uploads it, then a revision with
+--changed-pages pages edited, one page inserted at the front and the last
+page dropped. Each revision is applied twice (as a fresh upload, the old
+way, and as a replace) and the script reports the ingestion time, how many
+chunks were embedded and how many chunks the collection holds afterwards.
+Then it deletes the documents and checks that /documents/compact finds
+nothing left behind, and that it removes chunks orphaned on purpose.
+
+The fake embedder takes --embed-latency per embedding request, the
+embedding cache is off (EMBEDDING_CACHE=0) unless --embedding-cache.
+
+Usage (from backend/): python -m benchmarks.bench_reindex [--pages 200 --changed-pages 5]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import httpx
+from benchmarks.common import run_server
+
+APP_PORT = 8901
+WORDS = ("warranty battery charger screen hinge keyboard firmware update reset pairing bluetooth speaker "
+         "return refund shipping invoice serial model repair replacement overheating noise cable adapter").split()
+
+def page_text(rng: random.Random, page: int, revision: int = 0) -> str:
+    paragraphs = []
+    for paragraph in range(6):
+        words = " ".join(rng.choice(WORDS) for _ in range(70))
+        paragraphs.append(f"Section {page}.{paragraph} (rev {revision}): {words}.")
+    return "\n\n".join(paragraphs)
+
+def build_pdf(path: str, pages):
+    import fitz
+    doc = fitz.open()
+    for text in pages:
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, 560, 800), text, fontsize=8)
+    doc.save(path)
+
+def wait_for_job(client: httpx.Client, job_id: str):
+    while True:
+        job = client.get(f"/documents/jobs/{job_id}").json()
+        if job["status"] in ("completed", "failed"):
+            assert job["status"] == "completed", job
+            return job
+        time.sleep(0.05)
+
+def collection_size(client: httpx.Client) -> int:
+    return sum(c["count"] for c in client.get("/documents/collections").json() if c["name"] == "documents")
+
+def send(client: httpx.Client, method: str, url: str, path: str):
+    with open(path, "rb") as f:
+        response = client.request(method, url, files={"file": ("manual.pdf", f, "application/pdf")})
+    response.raise_for_status()
+    return response.json()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--changed-pages", type=int, default=5)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-cache", action="store_true")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    rng = random.Random(3)
+    original = [page_text(rng, page) for page in range(args.pages)]
+    revised = list(original)
+    for page in rng.sample(range(args.pages), args.changed_pages):
+        revised[page] = page_text(rng, page, revision=1)
+    revised = [page_text(rng, -1, revision=1)] + revised[:-1]
+    original_path, revised_path = os.path.join(work_dir, "v1.pdf"), os.path.join(work_dir, "v2.pdf")
+    build_pdf(original_path, original)
+    build_pdf(revised_path, revised)
+
+    db_path = os.path.join(work_dir, "bench.db")
+    env = {
+        "EMBEDDING_PROVIDER": "fake", "EMBEDDING_CACHE": "1" if args.embedding_cache else "0",
+        "FAKE_EMBED_LATENCY": str(args.embed_latency), "EMBED_BATCH_TOKENS": "4000",
+        "DATABASE_URL": f"sqlite:///{db_path}", "CHROMA_DB_DIR": os.path.join(work_dir, "chroma"),
+        "NUMPY_INDEX_DIR": os.path.join(work_dir, "vector_index"),
+        "LEXICAL_INDEX_PATH": os.path.join(work_dir, "lexical.db"), "R2_BUCKET_NAME": "", "STARTUP_WARMUP": "0",
+    }
+    try:
+        with run_server("main:app", APP_PORT, env) as app_url, httpx.Client(base_url=app_url, timeout=300) as client:
+            start = time.perf_counter()
+            first = send(client, "POST", "/documents/upload", original_path)
+            job = wait_for_job(client, first["job_id"])
+            print(f"{args.pages} page manual: {job['chunks_total']} chunks indexed in {time.perf_counter() - start:.1f}s, "
+                  f"collection holds {collection_size(client)} chunks")
+            print(f"Revision: {args.changed_pages} pages edited, one page inserted at the front, the last one dropped\n")
+
+            start = time.perf_counter()
+            again = send(client, "POST", "/documents/upload", revised_path)
+            job = wait_for_job(client, again["job_id"])
+            print(f"  upload as a new document  {time.perf_counter() - start:6.1f}s  {job['chunks_total']:5d} chunks embedded  "
+                  f"collection: {collection_size(client)} chunks (the old version stays)")
+            client.delete(f"/documents/{again['id']}").raise_for_status()
+
+            start = time.perf_counter()
+            replaced = send(client, "PUT", f"/documents/{first['id']}", revised_path)
+            job = wait_for_job(client, replaced["job_id"])
+            stats = job["reindex"]
+            print(f"  replace (PUT)             {time.perf_counter() - start:6.1f}s  {stats['added']:5d} chunks embedded  "
+                  f"collection: {collection_size(client)} chunks "
+                  f"({stats['unchanged']} unchanged, {stats['updated']} metadata only, {stats['removed']} removed)")
+            assert collection_size(client) == job["chunks_total"]
+
+            unchanged = send(client, "PUT", f"/documents/{first['id']}", revised_path)
+            print(f"  same file again           status {unchanged['status']!r}, no job")
+
+            report = client.post("/documents/compact").json()
+            print(f"\nCompaction after the delete: {report['chunks_removed']} orphaned chunks")
+            # Drop a document's row behind the API's back, its chunks become orphans
+            connection = sqlite3.connect(db_path)
+            connection.execute("DELETE FROM documents WHERE id = ?", (first["id"],))
+            connection.commit()
+            connection.close()
+            dry_run = client.post("/documents/compact", params={"dry_run": True}).json()
+            report = client.post("/documents/compact").json()
+            assert dry_run["chunks_removed"] == report["chunks_removed"] == job["chunks_total"], (dry_run, report)
+            print(f"Compaction after dropping a row: {report['chunks_removed']} orphaned chunks of "
+                  f"{report['documents_removed']} document removed, collection: {collection_size(client)} chunks")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
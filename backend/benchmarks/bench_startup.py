@@ -0,0 +1,143 @@
+"""
+Cold start: how long importing the app takes and how soon a fresh API
+process serves requests.
+
+1. Import: --runs fresh interpreters each time `import main`, reports the
+   median and which heavy packages (chromadb, openai, boto3, fitz) the
+   import loaded, plus the slowest imports of main (python -X importtime).
+   With --budget-ms the script exits 1 when the median is over budget, so CI
+   can catch import-time regressions.
+2. Startup: spawns uvicorn and measures the time until it accepts requests
+   (GET /health) and until it is ready (GET /health/ready), then the latency
+   of the first workflow run (KB + LLM nodes, fake embedder and the local
+   fake OpenRouter) and of a second one, with STARTUP_WARMUP=1 and =0.
+
+Usage (from backend/): python -m benchmarks.bench_startup [--runs 5 --budget-ms 1500]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from benchmarks.common import BACKEND_DIR, run_server
+
+FAKE_PORT = 8900
+APP_PORT = 8901
+HEAVY = ("chromadb", "openai", "boto3", "fitz")
+
+IMPORT_SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+import main
+print(json.dumps({{"seconds": time.perf_counter() - start, "heavy": [m for m in {HEAVY!r} if m in sys.modules]}}))
+"""
+
+WORKFLOW = {
+    "workflow_id": "bench-startup",
+    "query": "What does the warranty cover?",
+    "nodes": [
+        {"id": "kb-1", "type": "knowledgeBase", "data": {"collection": "bench-startup"}},
+        {"id": "llm-1", "type": "llmEngine", "data": {"model": "fake/model", "temperature": 0}},
+        {"id": "out", "type": "output", "data": {}},
+    ],
+    "edges": [{"source": "kb-1", "target": "llm-1"}, {"source": "llm-1", "target": "out"}],
+}
+
+def measure_import(runs: int, env: dict):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=BACKEND_DIR, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return statistics.median(result["seconds"] for result in results), results[-1]["heavy"]
+
+def slowest_imports(env: dict, top: int = 8):
+    """Modules imported directly by main (one level below it), by cumulative import time"""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stderr
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if len(name) - len(name.lstrip()) == 3:
+            modules[name.strip()] = int(cumulative) / 1000
+    return sorted(modules.items(), key=lambda item: -item[1])[:top]
+
+def wait_for(client: httpx.Client, url: str, deadline: float):
+    while time.perf_counter() < deadline:
+        try:
+            if client.get(url, timeout=0.5).status_code == 200:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{url} did not answer in time")
+
+def measure_startup(env: dict):
+    """Seconds until /health answers, until /health/ready is 200, first and second run latency"""
+    # One client for the polling, building one per request would take longer than the poll interval
+    client = httpx.Client(base_url=f"http://127.0.0.1:{APP_PORT}", timeout=60)
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(APP_PORT), "--workers", "1", "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    try:
+        deadline = start + 60
+        live = wait_for(client, "/health", deadline) - start
+        ready = wait_for(client, "/health/ready", deadline) - start
+        runs = []
+        for _ in range(2):
+            run_start = time.perf_counter()
+            client.post("/run_workflow", json=WORKFLOW).raise_for_status()
+            runs.append(time.perf_counter() - run_start)
+        components = client.get("/health/ready").json()["components"]
+        return live, ready, runs, components
+    finally:
+        client.close()
+        proc.terminate()
+        proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail when the median import takes longer")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    env = {
+        **os.environ, "EMBEDDING_PROVIDER": "fake", "OPENROUTER_API_KEY": "bench-key",
+        "DATABASE_URL": f"sqlite:///{os.path.join(work_dir, 'bench.db')}", "CHROMA_DB_DIR": os.path.join(work_dir, "chroma"),
+        "NUMPY_INDEX_DIR": os.path.join(work_dir, "vector_index"),
+        "LEXICAL_INDEX_PATH": os.path.join(work_dir, "lexical.db"), "BATCH_RESULTS_DIR": os.path.join(work_dir, "batches"),
+    }
+    try:
+        median, heavy = measure_import(args.runs, env)
+        print(f"import main: median {median * 1000:.0f} ms over {args.runs} runs, "
+              f"heavy packages loaded: {', '.join(heavy) or 'none'}")
+        print("  slowest imports of main: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in slowest_imports(env)))
+
+        with run_server("benchmarks.fake_openrouter:app", FAKE_PORT, {"FAKE_LLM_LATENCY": "0"}) as fake_url:
+            for warmup in ("1", "0"):
+                live, ready, runs, components = measure_startup({**env, "OPENROUTER_BASE_URL": fake_url,
+                                                                 "STARTUP_WARMUP": warmup})
+                print(f"\nSTARTUP_WARMUP={warmup}: accepting requests after {live * 1000:.0f} ms, "
+                      f"ready after {ready * 1000:.0f} ms")
+                print(f"  first run {runs[0] * 1000:.0f} ms, second run {runs[1] * 1000:.0f} ms")
+                if components:
+                    print("  warm-up: " + ", ".join(f"{name} {c['status']} {c.get('ms', 0):.0f} ms"
+                                                    for name, c in components.items()))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.budget_ms is not None and median * 1000 > args.budget_ms:
+        raise SystemExit(f"import main took {median * 1000:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Time-to-first-byte and bytes on the wire of /run_workflow_stream.
+
+Runs a two-step workflow (an upstream LLM node feeding the answering one,
+plus a knowledge base node) against the local fake OpenRouter server and
+reports, per request, when the first byte and the first answer token
+arrived, the total time, how many SSE events were sent and how many bytes
+they took. Many small deltas (FAKE_LLM_TOKENS) show the effect of
+coalescing them into frames.
+
+Usage (from backend/): python -m benchmarks.bench_stream [--requests 10 --tokens 400]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import httpx
+from benchmarks.common import run_server
+
+FAKE_PORT = 8900
+APP_PORT = 8901
+
+WORKFLOW = {
+    "workflow_id": "bench-stream",
+    "query": "Summarize the warranty terms",
+    "nodes": [
+        {"id": "kb-1", "type": "knowledgeBase", "data": {"collection": "bench-stream"}},
+        {"id": "llm-1", "type": "llmEngine", "data": {"model": "fake/model", "temperature": 0}},
+        {"id": "llm-2", "type": "llmEngine", "data": {"model": "fake/model", "temperature": 0}},
+        {"id": "out", "type": "output", "data": {}},
+    ],
+    "edges": [
+        {"source": "kb-1", "target": "llm-1"},
+        {"source": "llm-1", "target": "llm-2"},
+        {"source": "llm-2", "target": "out"},
+    ],
+}
+
+async def run_one(client: httpx.AsyncClient):
+    start = time.perf_counter()
+    first_byte = first_token = None
+    size = events = 0
+    buffer = b""
+    async with client.stream("POST", "/run_workflow_stream", json=WORKFLOW) as response:
+        async for data in response.aiter_raw():
+            now = time.perf_counter() - start
+            first_byte = first_byte if first_byte is not None else now
+            size += len(data)
+            buffer += data
+            *frames, buffer = buffer.split(b"\n\n")
+            for frame in frames:
+                if not frame.startswith(b"data: "):
+                    continue
+                events += 1
+                if first_token is None and json.loads(frame[6:]).get("type") == "content":
+                    first_token = now
+    return first_byte, first_token, time.perf_counter() - start, events, size
+
+async def run(base_url: str, requests: int):
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        results = [await run_one(client) for _ in range(requests)]
+    first_byte, first_token, total, events, size = (statistics.median(column) for column in zip(*results))
+    print(f"{requests} streamed runs (median): first byte {first_byte * 1000:7.1f} ms, first token {first_token * 1000:7.1f} ms, "
+          f"total {total * 1000:7.1f} ms, {events:.0f} events, {size:.0f} bytes")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--tokens", type=int, default=400)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    args = parser.parse_args()
+
+    fake_env = {"FAKE_LLM_LATENCY": "0.3", "FAKE_LLM_TOKENS": str(args.tokens), "FAKE_LLM_TOKEN_DELAY": str(args.token_delay)}
+    with run_server("benchmarks.fake_openrouter:app", FAKE_PORT, fake_env) as fake_url:
+        env = {"OPENROUTER_BASE_URL": fake_url, "OPENROUTER_API_KEY": "bench-key", "EMBEDDING_PROVIDER": "fake"}
+        with run_server("main:app", APP_PORT, env) as app_url:
+            asyncio.run(run(app_url, args.requests))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Overhead of tracing workflow runs.
+
+1. Per span: the cost of tracing.span() and node_finished() with and
+   without a run being traced, against an empty `with` block.
+2. /metrics: time to render every metric with a realistic number of series.
+3. End to end: --requests /run_workflow runs (KB + web search + LLM nodes,
+   against the fake OpenRouter and the stub search provider) with
+   --concurrency in flight, the API started with TRACING_ENABLED=0 and =1.
+
+Usage (from backend/): python -m benchmarks.bench_tracing [--requests 300 --concurrency 20]
+"""
+import argparse
+import asyncio
+import contextlib
+import statistics
+import time
+import httpx
+from benchmarks.common import run_server
+
+FAKE_PORT = 8900
+APP_PORT = 8901
+
+WORKFLOW = {
+    "workflow_id": "bench-tracing",
+    "query": "Summarize the warranty terms",
+    "nodes": [
+        {"id": "kb-1", "type": "knowledgeBase", "data": {"collection": "bench-tracing"}},
+        {"id": "web-1", "type": "webSearch", "data": {}},
+        {"id": "llm-1", "type": "llmEngine", "data": {"model": "fake/model", "temperature": 0}},
+        {"id": "out", "type": "output", "data": {}},
+    ],
+    "edges": [
+        {"source": "kb-1", "target": "llm-1"},
+        {"source": "web-1", "target": "llm-1"},
+        {"source": "llm-1", "target": "out"},
+    ],
+}
+
+def per_call_us(function, repeat=200000):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def micro():
+    import tracing
+
+    def empty():
+        with contextlib.nullcontext():
+            pass
+
+    def one_span():
+        with tracing.span("bench"):
+            pass
+
+    def one_node():
+        tracing.node_finished("node-1", "knowledgeBase", "done", time.perf_counter())
+
+    baseline = per_call_us(empty)
+    print("Per call (microseconds, including the loop):")
+    print(f"  empty with-block              {baseline:6.2f}")
+    print(f"  span(), no run traced         {per_call_us(one_span):6.2f}")
+    print(f"  node_finished(), no run       {per_call_us(one_node):6.2f}")
+    tracing.TRACE_MAX_SPANS = 10 ** 9
+    tracing.start_run()
+    print(f"  span(), run traced            {per_call_us(one_span):6.2f}")
+    print(f"  node_finished(), run traced   {per_call_us(one_node):6.2f}")
+
+    # A busy server: every call type/status and 20 models
+    for i in range(20):
+        tracing.record_ttft(f"model-{i}", 0.2)
+        tracing.record_llm_usage(f"model-{i}", 1000, 200)
+    for call in ("embedding", "vector_query", "lexical_search", "web_search", "web_fetch", "llm", "chat_memory"):
+        for status in ("ok", "error", "timeout", "cancelled"):
+            tracing.call_seconds.observe(0.1, call, status)
+    start = time.perf_counter()
+    for _ in range(100):
+        text = tracing.render_metrics({"cache": {"hits": 1, "misses": 2, "entries": 3}}, {"db": {"size": 10}})
+    print(f"\n/metrics render: {(time.perf_counter() - start) / 100 * 1000:.2f} ms for {len(text.splitlines())} lines")
+
+async def load(base_url: str, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        await client.post("/run_workflow", json=WORKFLOW)
+
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/run_workflow", json=WORKFLOW)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one() for _ in range(requests)])
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1], requests / elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    micro()
+
+    print(f"\n{args.requests} runs, {args.concurrency} concurrent (fake LLM, stub web search):")
+    with run_server("benchmarks.fake_openrouter:app", FAKE_PORT, {"FAKE_LLM_LATENCY": "0.05"}) as fake_url:
+        for enabled in ("0", "1"):
+            env = {"OPENROUTER_BASE_URL": fake_url, "OPENROUTER_API_KEY": "bench-key", "EMBEDDING_PROVIDER": "fake",
+                   "WEB_SEARCH_PROVIDER": "stub", "TRACING_ENABLED": enabled}
+            with run_server("main:app", APP_PORT, env) as app_url:
+                p50, p99, rate = asyncio.run(load(app_url, args.requests, args.concurrency))
+                spans = httpx.get(f"{app_url}/metrics").text.count("_count{")
+            label = "tracing on " if enabled == "1" else "tracing off"
+            print(f"  {label}  p50 {p50 * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms  {rate:7.1f} runs/s  ({spans} metric series)")
+
+if __name__ == "__main__":
+    main()
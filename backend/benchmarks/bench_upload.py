@@ -0,0 +1,111 @@
+"""
+Peak memory of the API process while large PDFs are uploaded and ingested.
+
+Starts a local S3-compatible stand-in (moto's server, `pip install
+"moto[server]"`) as the R2 endpoint and the API against it, then uploads
+--uploads copies of a generated --size-mb PDF concurrently and waits for
+their ingestion jobs to finish. Reports the API process's peak RSS (the
+PDF extraction worker processes are not included), the upload time, and
+checks that each object arrived whole: size, sha256 metadata and, above
+the multipart threshold, a multipart ETag ("<hash>-<parts>").
+
+Usage (from backend/): python -m benchmarks.bench_upload [--size-mb 200 --uploads 4]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import boto3
+import httpx
+from benchmarks.common import peak_rss_mb, run_server, server_pids
+
+S3_PORT = 8903
+APP_PORT = 8901
+BUCKET = "bench-uploads"
+
+def build_pdf(path: str, size_mb: int):
+    """A PDF of about size_mb, each page a short text plus an incompressible image"""
+    import fitz
+    doc = fitz.open()
+    side = 300
+    for i in range(max(1, size_mb * 1024 * 1024 // (side * side * 3))):
+        page = doc.new_page()
+        page.insert_text((36, 36), f"Page {i + 1}: warranty terms for part QX-{1000 + i}.", fontsize=10)
+        image = fitz.Pixmap(fitz.csRGB, side, side, os.urandom(side * side * 3), False)
+        page.insert_image(fitz.Rect(36, 60, 36 + side, 60 + side), pixmap=image)
+    doc.save(path)
+
+async def upload(client: httpx.AsyncClient, path: str, i: int):
+    with open(path, "rb") as f:
+        # httpx streams the file object into the multipart body
+        response = await client.post("/documents/upload", files={"file": (f"manual-{i}.pdf", f, "application/pdf")})
+    response.raise_for_status()
+    return response.json()
+
+async def run(base_url: str, path: str, uploads: int):
+    async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+        start = time.perf_counter()
+        documents = await asyncio.gather(*[upload(client, path, i) for i in range(uploads)])
+        accepted = time.perf_counter() - start
+        while True:
+            jobs = [(await client.get(f"/documents/jobs/{doc['job_id']}")).json() for doc in documents]
+            if all(job["status"] in ("completed", "failed") for job in jobs):
+                break
+            await asyncio.sleep(0.2)
+        return documents, jobs, accepted, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--uploads", type=int, default=4)
+    args = parser.parse_args()
+
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        raise SystemExit('bench_upload needs moto\'s server: pip install "moto[server]"')
+
+    work_dir = tempfile.mkdtemp()
+    pdf_path = os.path.join(work_dir, "upload.pdf")
+    build_pdf(pdf_path, args.size_mb)
+    size = os.path.getsize(pdf_path)
+
+    s3_server = ThreadedMotoServer(port=S3_PORT, verbose=False)
+    s3_server.start()
+    endpoint = f"http://127.0.0.1:{S3_PORT}"
+    credentials = {"aws_access_key_id": "bench", "aws_secret_access_key": "bench", "region_name": "us-east-1"}
+    s3 = boto3.client("s3", endpoint_url=endpoint, **credentials)
+    s3.create_bucket(Bucket=BUCKET)
+    try:
+        env = {
+            "R2_ENDPOINT_URL": endpoint, "R2_ACCESS_KEY_ID": "bench", "R2_SECRET_ACCESS_KEY": "bench",
+            "R2_BUCKET_NAME": BUCKET, "AWS_DEFAULT_REGION": "us-east-1", "R2_PUBLIC_URL_BASE": "",
+            "EMBEDDING_PROVIDER": "fake", "EMBEDDING_CACHE": "0",
+            "DATABASE_URL": f"sqlite:///{os.path.join(work_dir, 'bench.db')}",
+            "CHROMA_DB_DIR": os.path.join(work_dir, "chroma"), "LEXICAL_INDEX_PATH": os.path.join(work_dir, "lexical.db"),
+            "NUMPY_INDEX_DIR": os.path.join(work_dir, "vector_index"),
+        }
+        with run_server("main:app", APP_PORT, env) as app_url:
+            baseline = peak_rss_mb(server_pids[app_url])
+            documents, jobs, accepted, total = asyncio.run(run(app_url, pdf_path, args.uploads))
+            peak = peak_rss_mb(server_pids[app_url])
+
+        print(f"{args.uploads} concurrent uploads of {size / 2**20:.0f} MiB ({args.uploads * size / 2**20:.0f} MiB in total)")
+        print(f"  accepted in {accepted:.1f}s, stored + ingested in {total:.1f}s, "
+              f"statuses: {', '.join(sorted(set(job['status'] for job in jobs)))}")
+        print(f"  API process peak RSS: {peak:.0f} MiB (after startup: {baseline:.0f} MiB, growth {peak - baseline:.0f} MiB)")
+
+        for document in documents:
+            head = s3.head_object(Bucket=BUCKET, Key=document["file_path"])
+            assert head["ContentLength"] == size, head["ContentLength"]
+            assert head["Metadata"].get("sha256") == document["sha256"]
+        print(f"  stored objects: {len(documents)} x {size} bytes, sha256 metadata matches, "
+              f"ETag {head['ETag']} ({'multipart' if '-' in head['ETag'] else 'single part'})")
+    finally:
+        s3_server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Vector store backends: Chroma versus the NumPy index (float16 and int8).
+
+Builds one collection of --chunks chunks from --docs documents (random
+embeddings clustered per document, --dimensions wide like
+text-embedding-3-small), written in batches of --batch chunks like the
+ingestion pipeline does. Then, for each backend, a fresh process opens the
+collection and runs --queries searches over the whole collection and
+--queries limited to one document (a per-document knowledge base). It
+reports:
+
+- startup: time to open the client and the collection and answer the first query
+- memory: resident memory the backend added to the process, split into
+  anonymous memory (private to each uvicorn worker) and file-backed pages
+  (the page cache, shared by every worker mapping the same files)
+- p50/p95 latency of the searches and recall@k against an exact search
+
+Usage (from backend/): python -m benchmarks.bench_vector_backend [--chunks 5000 --docs 50]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import numpy as np
+from benchmarks.common import BACKEND_DIR
+
+BACKENDS = (("chroma", "chroma", None), ("numpy float16", "numpy", "float16"), ("numpy int8", "numpy", "int8"))
+
+BUILD_SCRIPT = """
+import json, os, sys, time, numpy as np
+import vector_store
+work_dir, batch = sys.argv[1], int(sys.argv[2])
+vectors = np.load(f"{work_dir}/corpus.npy")
+docs = np.load(f"{work_dir}/docs.npy")
+start = time.perf_counter()
+collection = vector_store.get_collection("bench")
+for i in range(0, len(vectors), batch):
+    ids = [f"{docs[j]}_{j}" for j in range(i, min(i + batch, len(vectors)))]
+    collection.upsert(ids=ids, embeddings=vectors[i:i + batch].tolist(), documents=[f"chunk {j}" for j in ids],
+                      metadatas=[{"doc_id": str(docs[j]), "page": j} for j in range(i, i + len(ids))])
+seconds = time.perf_counter() - start
+if vector_store.VECTOR_BACKEND == "numpy":
+    size = collection.stats()["bytes"]
+else:
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(vector_store.CHROMA_DB_DIR)
+               for name in names)
+print(json.dumps({"seconds": seconds, "bytes": size}))
+"""
+
+SERVE_SCRIPT = """
+import json, sys, time, numpy as np
+import vector_store
+
+def memory():
+    fields = {}
+    with open("/proc/self/status") as status:
+        for line in status:
+            key, _, value = line.partition(":")
+            if key in ("RssAnon", "RssFile"):
+                fields[key] = int(value.split()[0]) / 1024
+    return fields
+
+work_dir, n_results = sys.argv[1], int(sys.argv[2])
+queries = np.load(f"{work_dir}/queries.npy").tolist()
+filters = [str(doc_id) for doc_id in np.load(f"{work_dir}/filters.npy")]
+baseline = memory()
+start = time.perf_counter()
+collection = vector_store.get_collection("bench", create=False)
+collection.query(query_embeddings=[queries[0]], n_results=n_results)
+startup = time.perf_counter() - start
+results = {"all": [], "filtered": []}
+latencies = {"all": [], "filtered": []}
+for query, doc_id in zip(queries, filters):
+    for kind, where in (("all", None), ("filtered", {"doc_id": doc_id})):
+        query_start = time.perf_counter()
+        result = collection.query(query_embeddings=[query], n_results=n_results, where=where)
+        latencies[kind].append(time.perf_counter() - query_start)
+        results[kind].append(result["ids"][0])
+used = memory()
+print(json.dumps({"startup": startup, "latencies": latencies, "results": results,
+                  "anon": used["RssAnon"] - baseline["RssAnon"], "file": used["RssFile"] - baseline["RssFile"]}))
+"""
+
+def exact_top_k(vectors: np.ndarray, docs: np.ndarray, queries: np.ndarray, filters: np.ndarray, k: int):
+    ids = np.array([f"{doc}_{i}" for i, doc in enumerate(docs)])
+    norms = np.einsum("ij,ij->i", vectors, vectors)
+    top = {"all": [], "filtered": []}
+    for query, doc_id in zip(queries, filters):
+        distances = norms - 2 * vectors @ query
+        top["all"].append(set(ids[np.argsort(distances)[:k]]))
+        masked = np.where(docs == doc_id, distances, np.inf)
+        top["filtered"].append(set(ids[np.argsort(masked)[:min(k, int((docs == doc_id).sum()))]]))
+    return top
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=40, help="chunks per upsert, like one embedding request")
+    parser.add_argument("--n-results", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    centroids = rng.normal(size=(args.docs, args.dimensions))
+    docs = rng.integers(0, args.docs, size=args.chunks)
+    vectors = centroids[docs] + rng.normal(scale=1.5, size=(args.chunks, args.dimensions))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    picked = rng.integers(0, args.chunks, size=args.queries)
+    queries = vectors[picked] + rng.normal(scale=0.03, size=(args.queries, args.dimensions)).astype(np.float32)
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+    filters = docs[rng.integers(0, args.chunks, size=args.queries)]
+    exact = exact_top_k(vectors, docs, queries, filters, args.n_results)
+
+    work_dir = tempfile.mkdtemp()
+    np.save(os.path.join(work_dir, "corpus.npy"), vectors)
+    np.save(os.path.join(work_dir, "docs.npy"), docs)
+    np.save(os.path.join(work_dir, "queries.npy"), queries)
+    np.save(os.path.join(work_dir, "filters.npy"), filters)
+    print(f"{args.chunks} chunks of {args.docs} documents, {args.dimensions} dimensions, "
+          f"{args.queries} queries over everything and {args.queries} limited to one document\n")
+    try:
+        for label, backend, dtype in BACKENDS:
+            data_dir = os.path.join(work_dir, label.replace(" ", "_"))
+            env = {
+                **os.environ, "VECTOR_BACKEND": backend, "CHROMA_DB_DIR": data_dir, "NUMPY_INDEX_DIR": data_dir,
+                "NUMPY_INDEX_DTYPE": dtype or "float16", "EMBEDDING_PROVIDER": "fake",
+            }
+            output = subprocess.run([sys.executable, "-c", BUILD_SCRIPT, work_dir, str(args.batch)], cwd=BACKEND_DIR,
+                                    env=env, capture_output=True, text=True, check=True).stdout
+            build = json.loads(output.strip().splitlines()[-1])
+            output = subprocess.run([sys.executable, "-c", SERVE_SCRIPT, work_dir, str(args.n_results)], cwd=BACKEND_DIR,
+                                    env=env, capture_output=True, text=True, check=True).stdout
+            served = json.loads(output.strip().splitlines()[-1])
+            print(f"{label}: build {build['seconds']:.1f}s, {build['bytes'] / 2 ** 20:.0f} MB on disk, "
+                  f"startup {served['startup'] * 1000:.0f} ms, "
+                  f"memory +{served['anon']:.0f} MB private +{served['file']:.0f} MB shared")
+            for kind in ("all", "filtered"):
+                latencies = np.array(served["latencies"][kind]) * 1000
+                recall = np.mean([len(set(found) & expected) / max(len(expected), 1)
+                                  for found, expected in zip(served["results"][kind], exact[kind])])
+                print(f"  {kind:8s} p50 {np.percentile(latencies, 50):6.2f} ms  p95 {np.percentile(latencies, 95):6.2f} ms  "
+                      f"recall@{args.n_results} {recall:.3f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
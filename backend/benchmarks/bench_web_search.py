@@ -0,0 +1,67 @@
+"""
+Web search step latency and upstream load: caching, single-flight and page fetching.
+
+Against the local fake SerpAPI (each search and result page takes
+--latency seconds) it measures:
+  - a burst of concurrent identical searches (single-flight: one request)
+  - the same search repeated (TTL cache: no request)
+  - fetching the text of the top --pages result pages, one after another
+    vs in parallel as fetch_result_pages() does
+
+Usage (from backend/): python -m benchmarks.bench_web_search [--latency 0.3 --burst 20 --pages 3]
+"""
+import argparse
+import asyncio
+import os
+import time
+import httpx
+from benchmarks.common import run_server
+
+FAKE_SEARCH_PORT = 8902
+
+async def run(search_url: str, burst: int, pages: int):
+    import web_search
+    from web_search import fetch_page_text, fetch_result_pages, page_cache, search_web
+
+    stats = lambda: httpx.get(f"{search_url}/stats").json()
+    before = stats()
+    start = time.perf_counter()
+    await asyncio.gather(*[search_web("warranty terms", "bench-key") for _ in range(burst)])
+    burst_time = time.perf_counter() - start
+    after = stats()
+    print(f"{burst} concurrent identical searches: {burst_time * 1000:7.1f} ms, "
+          f"{after['searches'] - before['searches']} upstream request(s)")
+
+    start = time.perf_counter()
+    for _ in range(burst):
+        await search_web("Warranty  terms", "bench-key")
+    print(f"{burst} repeated searches (cached):     {(time.perf_counter() - start) * 1000:7.1f} ms, "
+          f"{stats()['searches'] - after['searches']} upstream request(s)")
+
+    results = await search_web("page fetch", "bench-key", num_results=pages)
+    start = time.perf_counter()
+    for result in results:
+        await fetch_page_text(result["link"])
+    serial = time.perf_counter() - start
+    page_cache.clear()
+    start = time.perf_counter()
+    await fetch_result_pages(results, pages)
+    parallel = time.perf_counter() - start
+    print(f"fetch {pages} result pages: one by one {serial * 1000:7.1f} ms | parallel {parallel * 1000:7.1f} ms, "
+          f"{len(results[0].get('content', ''))} chars of text from the first")
+    await web_search.get_http_client().aclose()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--burst", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=3)
+    args = parser.parse_args()
+
+    env = {"FAKE_SEARCH_LATENCY": str(args.latency), "FAKE_PAGE_LATENCY": str(args.latency)}
+    with run_server("benchmarks.fake_serpapi:app", FAKE_SEARCH_PORT, env) as search_url:
+        os.environ["SERPAPI_URL"] = f"{search_url}/search.json"
+        asyncio.run(run(search_url, args.burst, args.pages))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Helpers shared by the benchmark scripts (run them from the backend/ directory)."""
+import contextlib
+import os
+import subprocess
+import sys
+import time
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Process ids of the servers started by run_server, by URL
+server_pids = {}
+
+def peak_rss_mb(pid: int) -> float:
+    """Peak resident memory of a process so far (Linux VmHWM)"""
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+@contextlib.contextmanager
+def run_server(app_path: str, port: int, env: dict = None):
+    """Start `uvicorn app_path` with a single worker and wait until it accepts requests"""
+    proc_env = {**os.environ, **(env or {})}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app_path, "--port", str(port), "--workers", "1", "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=proc_env,
+    )
+    try:
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/", timeout=0.5)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError(f"{app_path} did not start on port {port}")
+        server_pids[f"http://127.0.0.1:{port}"] = proc.pid
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server_pids.pop(f"http://127.0.0.1:{port}", None)
+        proc.terminate()
+        proc.wait()
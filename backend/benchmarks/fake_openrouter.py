@@ -0,0 +1,73 @@
+"""
+Local stand-in for the OpenRouter chat completions API used by the benchmarks.
+
+Run with: uvicorn benchmarks.fake_openrouter:app --port 8900
+Latency and response length are controlled with FAKE_LLM_LATENCY (seconds
+before the first token), FAKE_LLM_TOKENS and FAKE_LLM_TOKEN_DELAY.
+GET /stats counts streamed completions that were started, finished and
+abandoned by the caller.
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))
+TOKENS = int(os.getenv("FAKE_LLM_TOKENS", "20"))
+TOKEN_DELAY = float(os.getenv("FAKE_LLM_TOKEN_DELAY", "0.01"))
+
+app = FastAPI()
+stream_stats = {"started": 0, "completed": 0, "cancelled": 0}
+
+def _completion_id():
+    return f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake/model")
+    await asyncio.sleep(LATENCY)
+
+    if not body.get("stream"):
+        await asyncio.sleep(TOKEN_DELAY * TOKENS)
+        return {
+            "id": _completion_id(),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(["token"] * TOKENS)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": TOKENS, "total_tokens": 10 + TOKENS},
+        }
+
+    async def events():
+        completion_id = _completion_id()
+        stream_stats["started"] += 1
+        try:
+            for i in range(TOKENS):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": "token "}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(TOKEN_DELAY)
+            yield "data: [DONE]\n\n"
+        except (asyncio.CancelledError, GeneratorExit):
+            stream_stats["cancelled"] += 1
+            raise
+        stream_stats["completed"] += 1
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/stats")
+async def stats():
+    return stream_stats
@@ -0,0 +1,39 @@
+"""
+Local stand-in for the SerpAPI search endpoint used by the benchmarks.
+
+Run with: uvicorn benchmarks.fake_serpapi:app --port 8902 and point
+SERPAPI_URL at http://127.0.0.1:8902/search.json. FAKE_SEARCH_LATENCY sets
+how many seconds a search takes. Result links point at /pages/{n} on the
+same server, HTML pages served after FAKE_PAGE_LATENCY seconds. GET /stats
+counts searches and page fetches.
+"""
+import asyncio
+import os
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse
+
+LATENCY = float(os.getenv("FAKE_SEARCH_LATENCY", "0.3"))
+PAGE_LATENCY = float(os.getenv("FAKE_PAGE_LATENCY", "0.3"))
+
+app = FastAPI()
+stats = {"searches": 0, "pages": 0}
+
+@app.get("/search.json")
+async def search(request: Request, q: str = ""):
+    stats["searches"] += 1
+    await asyncio.sleep(LATENCY)
+    return {"organic_results": [
+        {"title": f"Result {i} for {q}", "snippet": f"Snippet {i} about {q}.", "link": f"{request.base_url}pages/{i}"}
+        for i in range(5)
+    ]}
+
+@app.get("/pages/{page}", response_class=HTMLResponse)
+async def page(page: int):
+    stats["pages"] += 1
+    await asyncio.sleep(PAGE_LATENCY)
+    paragraphs = "".join(f"<p>Paragraph {i} of page {page} with details on the topic.</p>" for i in range(50))
+    return f"<html><head><title>Page {page}</title><script>var x = 1;</script></head><body><nav>Menu</nav>{paragraphs}</body></html>"
+
+@app.get("/stats")
+async def get_stats():
+    return stats
@@ -0,0 +1,247 @@
+"""
+Chat history: write-behind recording of workflow turns and conversation memory.
+
+Runs of saved workflows record each turn (query and the answer the user got,
+including streamed and cut-off answers) without touching the database on the
+request path: record() only appends to an in-memory list and a background
+task writes batches with one INSERT and one commit every
+CHAT_HISTORY_FLUSH_INTERVAL seconds, or as soon as CHAT_HISTORY_BATCH_SIZE
+turns are waiting. Turns still waiting are included when an LLM node loads
+its conversation memory, so the next turn of a conversation always sees the
+previous one. Pending turns are written on shutdown (close()).
+
+Turns the database rejects (a workflow deleted meanwhile, a value it won't
+store) are logged and dropped, they would fail again on every retry. Turns
+that failed because the database is unavailable are retried every flush
+interval, up to CHAT_HISTORY_MAX_RETRIES times.
+
+Memory is scoped to a conversation (the conversation_id a chat sends with
+each run), not the workflow: people chatting with the same saved workflow
+never see each other's turns. Runs without a conversation_id get no memory.
+"""
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import insert, select
+from sqlalchemy.exc import InterfaceError, OperationalError
+import models
+from database import SessionLocal
+from tokens import count_tokens
+from tracing import span
+
+load_dotenv()
+
+CHAT_HISTORY_BATCH_SIZE = int(os.getenv("CHAT_HISTORY_BATCH_SIZE", "200"))
+CHAT_HISTORY_FLUSH_INTERVAL = float(os.getenv("CHAT_HISTORY_FLUSH_INTERVAL", "1.0"))
+# Turns kept in memory while the database can't be written, the oldest are dropped beyond it
+CHAT_HISTORY_MAX_PENDING = int(os.getenv("CHAT_HISTORY_MAX_PENDING", "10000"))
+# Consecutive failed writes (database down or locked) after which the turns that failed are dropped
+CHAT_HISTORY_MAX_RETRIES = int(os.getenv("CHAT_HISTORY_MAX_RETRIES", "60"))
+# Default token budget of an LLM node's conversation memory ("memoryTokens" overrides it)
+CHAT_MEMORY_TOKENS = int(os.getenv("CHAT_MEMORY_TOKENS", "1000"))
+
+
+# The database is unavailable (down, locked, connection lost), the same write may succeed later.
+# Anything else, e.g. an IntegrityError for a deleted workflow or a DataError, fails the same way every time.
+_TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+
+def _insert_rows(rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Write rows in one transaction, returns (rows to retry, rows the database rejected)"""
+    db = SessionLocal()
+    try:
+        try:
+            db.execute(insert(models.ChatHistory), rows)
+            db.commit()
+            return [], []
+        except _TRANSIENT_ERRORS as e:
+            db.rollback()
+            print(f"Chat history write failed, retrying later: {e}")
+            return rows, []
+        except Exception as e:
+            db.rollback()
+            if len(rows) == 1:
+                print(f"Chat history write rejected, dropped the turn: {e}")
+                return [], rows
+        # One bad row (e.g. its workflow was deleted) shouldn't lose the whole batch
+        retry, rejected = [], []
+        for row in rows:
+            try:
+                db.execute(insert(models.ChatHistory), [row])
+                db.commit()
+            except _TRANSIENT_ERRORS as e:
+                db.rollback()
+                print(f"Chat history write failed, retrying later: {e}")
+                retry.append(row)
+            except Exception as e:
+                db.rollback()
+                print(f"Chat history write rejected, dropped the turn: {e}")
+                rejected.append(row)
+        return retry, rejected
+    finally:
+        db.close()
+
+
+class ChatRecorder:
+    def __init__(self, batch_size: int = CHAT_HISTORY_BATCH_SIZE, flush_interval: float = CHAT_HISTORY_FLUSH_INTERVAL,
+                 max_pending: int = CHAT_HISTORY_MAX_PENDING, max_retries: int = CHAT_HISTORY_MAX_RETRIES):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        # Recorded turns not committed yet, only touched from the event loop
+        self.pending: List[Dict[str, Any]] = []
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        # Writes in a row that failed with a transient error
+        self._failures = 0
+        self._task: Optional[asyncio.Task] = None
+        self._has_rows: Optional[asyncio.Event] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._closing = False
+
+    def _start(self):
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._has_rows = asyncio.Event()
+            self._batch_full = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    def record(self, workflow_id: Optional[int], conversation_id: Optional[str], user_query: str, ai_response: str):
+        """Queue a turn for writing, never blocks (safe in finally blocks of cancelled tasks)"""
+        if workflow_id is None or not ai_response:
+            return
+        self._start()
+        self.pending.append({
+            "workflow_id": workflow_id,
+            "conversation_id": conversation_id,
+            "user_query": user_query,
+            "ai_response": ai_response,
+            # Set here, not by the database, so turns keep their order however they are batched
+            "created_at": datetime.now(timezone.utc),
+        })
+        self.recorded += 1
+        if len(self.pending) > self.max_pending:
+            del self.pending[0]
+            self.dropped += 1
+            print("Chat history backlog is full, dropped the oldest turn")
+        self._has_rows.set()
+        if len(self.pending) >= self.batch_size:
+            self._batch_full.set()
+
+    async def _run(self):
+        # Stopped by close() through _closing rather than cancelled, so a write is never cut short
+        while not self._closing:
+            await self._has_rows.wait()
+            if not self._closing:
+                try:
+                    # Wait for a full batch, or at most one flush interval
+                    await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            if not await self.flush() and not self._closing:
+                # Turns the database couldn't take right now are retried on the next interval
+                await asyncio.sleep(self.flush_interval)
+
+    async def flush(self) -> bool:
+        """Write every pending turn, False when some of them have to be retried"""
+        if self._flush_lock is None:
+            return True
+        async with self._flush_lock:
+            self._has_rows.clear()
+            self._batch_full.clear()
+            while self.pending:
+                batch = self.pending[:self.batch_size]
+                retry, rejected = await asyncio.to_thread(_insert_rows, batch)
+                self.written += len(batch) - len(retry) - len(rejected)
+                self.rejected += len(rejected)
+                self._failures = self._failures + 1 if retry else 0
+                if retry and self._failures >= self.max_retries:
+                    print(f"Chat history: dropped {len(retry)} turns after {self._failures} failed writes")
+                    self.dropped += len(retry)
+                    self._failures = 0
+                    retry = []
+                # Appends made meanwhile are behind the batch, remove exactly what was written or given up on
+                retry_ids = {id(row) for row in retry}
+                done_ids = {id(row) for row in batch if id(row) not in retry_ids}
+                self.pending = [row for row in self.pending if id(row) not in done_ids]
+                if retry:
+                    self._has_rows.set()
+                    return False
+        return True
+
+    async def close(self):
+        """Stop the background writer and write what is still pending"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._has_rows.set()
+        self._batch_full.set()
+        await self._task
+        self._task = None
+        # One last try for turns that failed earlier
+        if self.pending and not await self.flush():
+            print(f"Chat history: {len(self.pending)} turns could not be written")
+
+    def stats(self) -> Dict[str, int]:
+        return {"recorded": self.recorded, "written": self.written, "pending": len(self.pending), "dropped": self.dropped,
+                "rejected": self.rejected}
+
+
+chat_recorder = ChatRecorder()
+
+
+def _recent_rows(workflow_id: int, conversation_id: str, turns: int):
+    db = SessionLocal()
+    try:
+        # Served by the (workflow_id, conversation_id, created_at) index
+        return db.execute(
+            select(models.ChatHistory.user_query, models.ChatHistory.ai_response, models.ChatHistory.created_at)
+            .where(models.ChatHistory.workflow_id == workflow_id, models.ChatHistory.conversation_id == conversation_id)
+            .order_by(models.ChatHistory.created_at.desc(), models.ChatHistory.id.desc())
+            .limit(turns)
+        ).all()
+    finally:
+        db.close()
+
+
+def _aware(value: datetime) -> datetime:
+    # SQLite hands timestamps back without their timezone, they were written in UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+async def load_memory(workflow_id: Optional[int], conversation_id: Optional[str], turns: int,
+                      max_tokens: int = CHAT_MEMORY_TOKENS, recorder: ChatRecorder = chat_recorder) -> List[Dict[str, str]]:
+    """
+    The last `turns` turns of one conversation with a workflow as chat
+    messages, oldest first, keeping the most recent turns that fit
+    max_tokens. Nothing without a conversation_id.
+    """
+    if workflow_id is None or not conversation_id or turns <= 0:
+        return []
+    # Snapshot before reading: a turn leaving `pending` meanwhile has been committed before the read
+    pending = [row for row in recorder.pending
+               if row["workflow_id"] == workflow_id and row["conversation_id"] == conversation_id]
+    with span("chat_memory"):
+        rows = await asyncio.to_thread(_recent_rows, workflow_id, conversation_id, turns)
+
+    history = {(_aware(row.created_at), row.user_query): row.ai_response for row in rows}
+    for row in pending:
+        history[(row["created_at"], row["user_query"])] = row["ai_response"]
+    recent = sorted(history.items(), key=lambda item: item[0][0])[-turns:]
+
+    messages: List[Dict[str, str]] = []
+    used = 0
+    for (_, user_query), ai_response in reversed(recent):
+        tokens = count_tokens(user_query) + count_tokens(ai_response)
+        if used + tokens > max_tokens:
+            break
+        used += tokens
+        messages[:0] = [{"role": "user", "content": user_query}, {"role": "assistant", "content": ai_response}]
+    return messages
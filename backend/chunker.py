@@ -0,0 +1,176 @@
+"""
+Structure-aware, token-based chunking.
+
+Pages are split into paragraphs, oversized paragraphs into sentences and
+oversized sentences into word runs. These pieces are packed into chunks of
+at most CHUNK_TOKENS tokens, so a chunk never ends mid-sentence unless a
+single sentence is longer than a chunk. Consecutive chunks share up to
+CHUNK_OVERLAP_TOKENS tokens of trailing pieces. Pages are fed one at a time,
+so the whole document never has to be held as one string.
+"""
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Tuple
+from tokens import count_tokens
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\S+")
+
+
+class Piece:
+    """A paragraph, sentence or word run with its position in the document"""
+
+    __slots__ = ("text", "page", "start", "end", "tokens", "paragraph_start")
+
+    def __init__(self, text: str, page: int, start: int, end: int, tokens: int, paragraph_start: bool):
+        self.text = text
+        self.page = page
+        self.start = start
+        self.end = end
+        self.tokens = tokens
+        self.paragraph_start = paragraph_start
+
+
+class Chunk:
+    """Chunk text plus the metadata stored next to it in the vector store"""
+
+    __slots__ = ("text", "page_start", "page_end", "start_offset", "end_offset", "tokens")
+
+    def __init__(self, pieces: List[Piece]):
+        parts = []
+        for i, piece in enumerate(pieces):
+            if i:
+                parts.append("\n\n" if piece.paragraph_start else " ")
+            parts.append(piece.text)
+        self.text = "".join(parts)
+        # Pages are 1-based, offsets are character offsets within those pages
+        self.page_start = pieces[0].page + 1
+        self.page_end = pieces[-1].page + 1
+        self.start_offset = pieces[0].start
+        self.end_offset = pieces[-1].end
+        self.tokens = sum(piece.tokens for piece in pieces)
+
+    def metadata(self) -> Dict[str, int]:
+        return {
+            "page_start": self.page_start,
+            "page_end": self.page_end,
+            "start_offset": self.start_offset,
+            "end_offset": self.end_offset,
+            "tokens": self.tokens,
+        }
+
+
+def _spans(pattern: re.Pattern, text: str, offset: int) -> Iterator[Tuple[str, int, int]]:
+    """Non-blank pieces of text between pattern matches, with absolute offsets"""
+    position = 0
+    for match in pattern.finditer(text):
+        yield from _stripped(text[position:match.start()], offset + position)
+        position = match.end()
+    yield from _stripped(text[position:], offset + position)
+
+
+def _stripped(text: str, offset: int) -> Iterator[Tuple[str, int, int]]:
+    stripped = text.strip()
+    if stripped:
+        start = offset + text.index(stripped)
+        yield stripped, start, start + len(stripped)
+
+
+def split_page(page: int, text: str, max_tokens: int = CHUNK_TOKENS) -> Iterator[Piece]:
+    """Break a page into pieces that each fit in a chunk, largest structural unit first"""
+    for paragraph, p_start, p_end in _spans(_PARAGRAPH_BREAK, text, 0):
+        tokens = count_tokens(paragraph)
+        if tokens <= max_tokens:
+            yield Piece(paragraph, page, p_start, p_end, tokens, True)
+            continue
+        first = True
+        for sentence, s_start, s_end in _spans(_SENTENCE_END, paragraph, p_start):
+            tokens = count_tokens(sentence)
+            if tokens <= max_tokens:
+                yield Piece(sentence, page, s_start, s_end, tokens, first)
+                first = False
+                continue
+            # A single sentence longer than a chunk: fall back to runs of whole words
+            run_start = run_end = None
+            run_tokens = 0
+            for word in _WORD.finditer(sentence):
+                word_tokens = count_tokens(word.group() + " ")
+                if run_start is not None and run_tokens + word_tokens > max_tokens:
+                    yield Piece(sentence[run_start:run_end], page, s_start + run_start, s_start + run_end, run_tokens, first)
+                    first = False
+                    run_start, run_tokens = None, 0
+                if run_start is None:
+                    run_start = word.start()
+                run_end = word.end()
+                run_tokens += word_tokens
+            if run_start is not None:
+                yield Piece(sentence[run_start:run_end], page, s_start + run_start, s_start + run_end, run_tokens, first)
+                first = False
+
+
+class StreamingChunker:
+    """
+    Packs pieces into chunks as pages arrive.
+
+    feed() takes the next page and returns the chunks completed so far,
+    finish() flushes the last one. A new page starts a new chunk when the
+    current one is already at least half full, so chunks rarely straddle
+    pages without producing tiny fragments.
+    """
+
+    def __init__(self, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        self._pieces: List[Piece] = []
+        self._tokens = 0
+        # Pieces of _pieces that were already emitted as overlap, a chunk of only those is not flushed
+        self._carried = 0
+
+    def feed(self, page: int, text: str) -> List[Chunk]:
+        chunks = []
+        if self._tokens >= self.max_tokens // 2:
+            chunks.extend(self._flush())
+        for piece in split_page(page, text, self.max_tokens):
+            if self._pieces and self._tokens + piece.tokens > self.max_tokens:
+                chunks.extend(self._flush())
+                # The overlap may not leave room for an oversized piece
+                while self._pieces and self._tokens + piece.tokens > self.max_tokens:
+                    self._tokens -= self._pieces.pop(0).tokens
+                    self._carried -= 1
+            self._pieces.append(piece)
+            self._tokens += piece.tokens
+        return chunks
+
+    def finish(self) -> List[Chunk]:
+        return self._flush(carry=False)
+
+    def _flush(self, carry: bool = True) -> List[Chunk]:
+        if len(self._pieces) <= self._carried:
+            return []
+        chunk = Chunk(self._pieces)
+        # Carry trailing pieces that fit in the overlap budget into the next chunk
+        overlap = []
+        overlap_tokens = 0
+        if carry:
+            for piece in reversed(self._pieces):
+                if overlap_tokens + piece.tokens > self.overlap_tokens:
+                    break
+                overlap.insert(0, piece)
+                overlap_tokens += piece.tokens
+        self._pieces = overlap
+        self._tokens = overlap_tokens
+        self._carried = len(overlap)
+        return [chunk]
+
+
+def chunk_pages(pages: Iterable[Tuple[int, str]], max_tokens: int = CHUNK_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Iterator[Chunk]:
+    """Chunks for (page_number, text) pairs, e.g. the output of pdf_extract.iter_pdf_pages"""
+    chunker = StreamingChunker(max_tokens, overlap_tokens)
+    for page, text in pages:
+        yield from chunker.feed(page, text)
+    yield from chunker.finish()
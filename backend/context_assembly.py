@@ -0,0 +1,187 @@
+"""
+Token-budgeted prompt context for LLM nodes.
+
+Knowledge base chunks and web results are ranked together with reciprocal
+rank fusion (their own scores aren't comparable), ties broken by how many
+query terms an item contains. Duplicate and overlapping chunks are removed,
+then items are added in rank order until the model's budget is used up. An
+item that doesn't fit is cut at a sentence boundary when enough budget is
+left for it, otherwise dropped.
+"""
+import json
+import os
+import re
+from typing import Dict, List, Optional
+from tokens import count_tokens, get_encoding
+
+# Context tokens per prompt (KB chunks, web results and upstream output), overridable per model
+# with CONTEXT_TOKEN_BUDGETS='{"model/name": 8000}' and per node with contextTokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+CONTEXT_TOKEN_BUDGETS: Dict[str, int] = json.loads(os.getenv("CONTEXT_TOKEN_BUDGETS", "{}"))
+# A partly fitting item is only trimmed in if at least this many tokens are left for it
+CONTEXT_MIN_TRIM_TOKENS = int(os.getenv("CONTEXT_MIN_TRIM_TOKENS", "48"))
+
+_RRF_K = 60
+_TERM = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# Overlap between neighbouring chunks is at most a few hundred characters (chunker.CHUNK_OVERLAP_TOKENS)
+_MAX_OVERLAP_CHARS = 2000
+_MIN_OVERLAP_CHARS = 24
+
+
+class ContextItem:
+    """One candidate piece of context: a KB chunk or a web result"""
+
+    __slots__ = ("text", "source", "kind", "rank", "score", "tokens", "trimmed")
+
+    def __init__(self, text: str, source: str, kind: str, rank: int):
+        self.text = text
+        self.source = source
+        # "kb" or "web"
+        self.kind = kind
+        # Position in its own result list (0 = best)
+        self.rank = rank
+        self.score = 0.0
+        self.tokens = 0
+        self.trimmed = False
+
+    def copy(self) -> "ContextItem":
+        return ContextItem(self.text, self.source, self.kind, self.rank)
+
+
+class AssembledContext:
+    """Selected context split back into prompt sections, plus per-source token usage"""
+
+    def __init__(self, kb_items: List[ContextItem], web_items: List[ContextItem], upstream: str,
+                 upstream_tokens: int, budget: int, dropped: int):
+        self.kb_items = kb_items
+        self.web_items = web_items
+        self.upstream = upstream
+        self.budget = budget
+        self.dropped = dropped
+        self.usage = [{"source": "Previous step", "kind": "upstream", "tokens": upstream_tokens, "trimmed": False}] if upstream else []
+        usage_by_source = {}
+        for item in kb_items + web_items:
+            entry = usage_by_source.setdefault(item.source, {"source": item.source, "kind": item.kind, "tokens": 0, "trimmed": False})
+            entry["tokens"] += item.tokens
+            entry["trimmed"] = entry["trimmed"] or item.trimmed
+        self.usage.extend(usage_by_source.values())
+        self.tokens = sum(entry["tokens"] for entry in self.usage)
+
+    @property
+    def kb_context(self) -> str:
+        return "\n\n".join(item.text for item in self.kb_items)
+
+    @property
+    def web_context(self) -> str:
+        if not self.web_items:
+            return ""
+        return "Web Search Results:\n" + "\n---\n".join(item.text for item in self.web_items)
+
+
+def context_budget(model: str, override: Optional[int] = None) -> int:
+    if override:
+        return int(override)
+    return int(CONTEXT_TOKEN_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET))
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of a that is a prefix of b (0 when shorter than _MIN_OVERLAP_CHARS)"""
+    tail = a[-_MAX_OVERLAP_CHARS:]
+    probe = b[:_MIN_OVERLAP_CHARS]
+    if len(probe) < _MIN_OVERLAP_CHARS:
+        return 0
+    start = tail.find(probe)
+    while start != -1:
+        if b.startswith(tail[start:]):
+            return len(tail) - start
+        start = tail.find(probe, start + 1)
+    return 0
+
+
+def remove_overlap(text: str, kept: List[ContextItem]) -> str:
+    """text without what the already selected items cover, empty if it is a repeat"""
+    text = text.strip()
+    for other in kept:
+        if text in other.text:
+            return ""
+        # Neighbouring chunks share an overlap window on one side or the other
+        overlap = _overlap(other.text, text)
+        if overlap:
+            text = text[overlap:].lstrip()
+        overlap = _overlap(text, other.text)
+        if overlap:
+            text = text[:-overlap].rstrip()
+    return text
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of whole sentences within max_tokens, falling back to a token cut"""
+    kept = []
+    used = 0
+    for sentence in _SENTENCE_END.split(text):
+        tokens = count_tokens(sentence) + (1 if kept else 0)
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    if kept:
+        return " ".join(kept)
+    encoding = get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def rank(items: List[ContextItem], query: str) -> List[ContextItem]:
+    """Order KB and web items in one list by reciprocal rank fusion plus query-term coverage"""
+    terms = set(_TERM.findall(query.lower()))
+    for item in items:
+        # Substring checks are approximate but much cheaper than tokenizing every candidate
+        text = item.text.lower()
+        coverage = sum(term in text for term in terms) / len(terms) if terms else 0.0
+        item.score = 1.0 / (_RRF_K + item.rank + 1) + coverage * 1e-3
+    return sorted(items, key=lambda item: item.score, reverse=True)
+
+
+def assemble_context(query: str, kb_items: List[ContextItem], web_items: List[ContextItem],
+                     upstream: str, budget: int) -> AssembledContext:
+    """Pick the context for one LLM call within `budget` tokens, the given items are not modified"""
+    # Output of upstream LLM nodes is the workflow's own data and goes in first
+    upstream_tokens = count_tokens(upstream)
+    if upstream_tokens > budget:
+        upstream = trim_to_tokens(upstream, budget)
+        upstream_tokens = count_tokens(upstream)
+    remaining = budget - upstream_tokens
+
+    selected = []
+    dropped = 0
+    # Several LLM nodes can share a KB node's items, work on copies
+    ranked = rank([item.copy() for item in kb_items + web_items], query)
+    for position, item in enumerate(ranked):
+        if remaining < CONTEXT_MIN_TRIM_TOKENS:
+            # Budget is as good as used up, don't tokenize the long tail
+            dropped += len(ranked) - position
+            break
+        item.text = remove_overlap(item.text, selected)
+        if not item.text:
+            continue
+        tokens = count_tokens(item.text)
+        if tokens <= remaining:
+            item.tokens = tokens
+        elif remaining >= CONTEXT_MIN_TRIM_TOKENS:
+            item.text = trim_to_tokens(item.text, remaining)
+            item.tokens = count_tokens(item.text)
+            item.trimmed = True
+        else:
+            dropped += 1
+            continue
+        if item.tokens:
+            selected.append(item)
+            remaining -= item.tokens
+
+    return AssembledContext(
+        [item for item in selected if item.kind == "kb"],
+        [item for item in selected if item.kind == "web"],
+        upstream, upstream_tokens, budget, dropped,
+    )
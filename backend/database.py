@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 from dotenv import load_dotenv
@@ -9,24 +10,108 @@ load_dotenv()
 # In production/docker, we will set DATABASE_URL to postgres
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 
-# SQLAlchemy setup
-# check dependencies `pip install sqlalchemy`
+# Connection pool: persistent connections per worker, extra ones under bursts, seconds to wait
+# for a free connection, and connections are replaced after DB_POOL_RECYCLE seconds (before
+# server or proxy idle timeouts drop them) and checked with a ping when handed out
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+def async_url(url: str) -> str:
+    """The same database through an asyncio driver (asyncpg, aiosqlite)"""
+    scheme, _, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    if dialect in ("postgresql", "postgres"):
+        # asyncpg takes libpq's sslmode as ssl
+        return f"postgresql+asyncpg://{rest.replace('sslmode=', 'ssl=')}"
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    return url
+
+
+def engine_options(url: str):
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if url.startswith("sqlite") and (url.endswith(":memory:") or url.split("://", 1)[1] in ("", "/")):
+        # In-memory SQLite lives in a single connection, there is no pool to size
+        return options
+    options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+                   pool_recycle=DB_POOL_RECYCLE)
+    return options
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run while the chat history writer or an ingestion job commits
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
 
 connect_args = {}
 if "sqlite" in DATABASE_URL:
     connect_args = {"check_same_thread": False}
 
+# Sync engine for worker threads (ingestion, chat history writer)
 engine = create_engine(
-    DATABASE_URL, connect_args=connect_args
+    DATABASE_URL, connect_args=connect_args, **engine_options(DATABASE_URL)
 )
 
+# Async engine for the routers, so requests don't hold a threadpool thread per query
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(DATABASE_URL))
+
+if DATABASE_URL.startswith("sqlite"):
+    event.listen(engine, "connect", _sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: attributes stay loaded after commit, async sessions can't lazy load them
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
+def init_db():
+    """Create missing tables and indexes, run at startup (see main.lifespan) rather than at import"""
+    import models
+    Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, add the (nullable) columns and the indexes introduced since
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                with engine.begin() as connection:
+                    connection.execute(text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                    ))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    # Workflows saved before updated_at had a default, the workflow list pages by it
+    with engine.begin() as connection:
+        connection.execute(
+            update(models.Workflow).where(models.Workflow.updated_at.is_(None)).values(updated_at=models.Workflow.created_at)
+        )
+
+def pool_stats(pool) -> dict:
+    """Connections of a SQLAlchemy pool (in-memory SQLite pools don't keep counts)"""
+    stats = {}
+    for name in ("size", "checkedin", "checkedout"):
+        method = getattr(pool, name, None)
+        if method is not None:
+            stats[name] = method()
+    return stats
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,147 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "1") not in ("0", "false", "False")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(__file__), "embedding_cache.db"))
+# Upper bound on cached vectors, least recently used ones are evicted past it
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+
+# Only refresh last_used on hits older than this, so hot entries don't cause a write per lookup
+_TOUCH_INTERVAL = 3600
+_EVICTION_CHECK_EVERY = 1000
+
+
+def text_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding store keyed by (model name, SHA-256 of the text).
+
+    Backed by a local SQLite file in WAL mode, so every uvicorn worker can
+    share it. Vectors are stored as float32 blobs.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash BLOB NOT NULL, vector BLOB NOT NULL, last_used INTEGER NOT NULL,"
+            " PRIMARY KEY (model, hash)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+        self._inserts = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, model: str, hashes: List[bytes]) -> Dict[bytes, List[float]]:
+        if not hashes:
+            return {}
+        found = {}
+        now = int(time.time())
+        stale = []
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                part = hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT hash, vector, last_used FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(part))})",
+                    [model, *part],
+                ).fetchall()
+                for digest, blob, last_used in rows:
+                    found[digest] = array("f", blob).tolist()
+                    if now - last_used > _TOUCH_INTERVAL:
+                        stale.append((now, model, digest))
+            if stale:
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?", stale)
+            self.hits += len(found)
+            self.misses += len(set(hashes)) - len(found)
+        return found
+
+    def put_many(self, model: str, items: Dict[bytes, List[float]]):
+        if not items:
+            return
+        now = int(time.time())
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(model, digest, array("f", vector).tobytes(), now) for digest, vector in items.items()],
+            )
+            self._conn.execute("COMMIT")
+            self._inserts += len(items)
+            if self._inserts >= _EVICTION_CHECK_EVERY:
+                self._inserts = 0
+                self._evict()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Drop a little extra so we don't evict again on the very next insert
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE (model, hash) IN (SELECT model, hash FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self.evictions += excess
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+class CachedEmbedder:
+    """Embedder wrapper that only sends texts missing from the cache to the provider"""
+
+    def __init__(self, embedder, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+        self.model_name = embedder.model_name
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model_name, hashes)
+
+        # Duplicate texts inside one request are embedded once
+        missing = {}
+        for digest, text in zip(hashes, texts):
+            if digest not in vectors and digest not in missing:
+                missing[digest] = text
+        if missing:
+            embedded = self.embedder.embed(list(missing.values()))
+            new_vectors = dict(zip(missing.keys(), embedded))
+            self.cache.put_many(self.model_name, new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[digest] for digest in hashes]
+
+
+_cache: Optional[EmbeddingCache] = None
+
+def get_embedding_cache(create: bool = True) -> Optional[EmbeddingCache]:
+    """The cache (None when disabled), create=False doesn't open it when nothing has used it yet"""
+    global _cache
+    if _cache is None and EMBEDDING_CACHE_ENABLED and create:
+        _cache = EmbeddingCache()
+    return _cache
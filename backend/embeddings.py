@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from embedding_cache import CachedEmbedder, get_embedding_cache
+from tokens import count_tokens
+
+load_dotenv()
+
+# "openai" (default) or "fake" for local benchmarks without API calls
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+# Token budget per embedding request, requests in flight per document and retries on 429/5xx
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "20000"))
+EMBED_BATCH_MAX_INPUTS = int(os.getenv("EMBED_BATCH_MAX_INPUTS", "2048"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+
+
+class EmbeddingRateLimitError(Exception):
+    """Raised by embedders when the provider asks us to slow down (HTTP 429)"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class EmbeddingUnavailableError(Exception):
+    """Raised when no embedding provider is configured"""
+
+
+class OpenAIEmbedder:
+    """Embeddings from the OpenAI API (blocking, call it from a worker thread)"""
+
+    def __init__(self, api_key: str, model_name: str = EMBEDDING_MODEL):
+        from openai import OpenAI
+        self.model_name = model_name
+        # Retries are handled by EmbeddingWriter so they can respect our own backoff and concurrency
+        self.client = OpenAI(api_key=api_key, max_retries=0)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        import openai
+        try:
+            response = self.client.embeddings.create(model=self.model_name, input=texts)
+        except openai.RateLimitError as e:
+            retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+            raise EmbeddingRateLimitError(str(e), float(retry_after) if retry_after else None) from e
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            raise EmbeddingRateLimitError(str(e)) from e
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class FakeEmbedder:
+    """
+    Deterministic local embedder for benchmarks.
+
+    Hashes words into a fixed number of dimensions (the hashing trick), so
+    texts sharing words are close and retrieval quality can be compared
+    without an API. FAKE_EMBED_LATENCY simulates a round-trip per request
+    and FAKE_EMBED_429_RATE the fraction of requests rejected with a 429.
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.model_name = f"fake-hash-{dimensions}"
+        self.dimensions = dimensions
+        self.latency = float(os.getenv("FAKE_EMBED_LATENCY", "0"))
+        self.rate_limit_rate = float(os.getenv("FAKE_EMBED_429_RATE", "0"))
+        self.requests = 0
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.rate_limit_rate and random.random() < self.rate_limit_rate:
+            raise EmbeddingRateLimitError("fake rate limit", retry_after=self.latency or 0.01)
+        return [self._vector(text) for text in texts]
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder():
+    """Process-wide embedder selected by EMBEDDING_PROVIDER, behind the embedding cache unless disabled"""
+    global _embedder
+    if _embedder is None:
+        # Built on first use, possibly by the startup warm-up thread and a request at once
+        with _embedder_lock:
+            if _embedder is None:
+                if EMBEDDING_PROVIDER == "fake":
+                    embedder = FakeEmbedder()
+                else:
+                    openai_api_key = os.getenv("OPENAI_API_KEY")
+                    if not openai_api_key:
+                        raise EmbeddingUnavailableError("OPENAI_API_KEY not found. Vector store will not work correctly.")
+                    embedder = OpenAIEmbedder(openai_api_key)
+                cache = get_embedding_cache()
+                _embedder = CachedEmbedder(embedder, cache) if cache else embedder
+    return _embedder
+
+def set_embedder(embedder):
+    """Swap the process-wide embedder (benchmarks plug in FakeEmbedder variants here)"""
+    global _embedder
+    _embedder = embedder
+
+
+def pack_batches(texts: List[str], max_tokens: int = EMBED_BATCH_TOKENS, max_inputs: int = EMBED_BATCH_MAX_INPUTS):
+    """Group consecutive texts into batches of at most max_tokens tokens, returns lists of indexes"""
+    batches = []
+    current = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_inputs):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class EmbeddingWriter:
+    """
+    Embedding stage of the ingestion pipeline.
+
+    Packs chunks into token-budgeted batches, embeds up to `concurrency`
+    batches at once (in worker threads, the embedders are blocking), retries
+    rate-limited batches with exponential backoff and jitter, and upserts
+    each embedded batch into Chroma in one call.
+    """
+
+    def __init__(self, embedder=None, batch_tokens: int = EMBED_BATCH_TOKENS,
+                 concurrency: int = EMBED_CONCURRENCY, max_retries: int = EMBED_MAX_RETRIES):
+        self.embedder = embedder
+        self.batch_tokens = batch_tokens
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retries = 0
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        embedder = self.embedder or get_embedder()
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await asyncio.to_thread(embedder.embed, texts)
+            except EmbeddingRateLimitError as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                delay = e.retry_after if e.retry_after is not None else min(30.0, 0.5 * 2 ** attempt)
+                await asyncio.sleep(delay * (1 + random.random() * 0.25))
+
+    async def write(self, collection, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def write_batch(indexes: List[int]):
+            async with semaphore:
+                texts = [documents[i] for i in indexes]
+                embeddings = await self.embed(texts)
+                await asyncio.to_thread(
+                    collection.upsert,
+                    ids=[ids[i] for i in indexes],
+                    embeddings=embeddings,
+                    documents=texts,
+                    metadatas=[metadatas[i] for i in indexes],
+                )
+
+        tasks = [asyncio.create_task(write_batch(batch)) for batch in pack_batches(documents, self.batch_tokens)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # One batch failed for good, don't keep embedding the rest of the document
+            for task in tasks:
+                task.cancel()
+            raise
+
+
+embedding_writer = EmbeddingWriter()
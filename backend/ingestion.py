@@ -0,0 +1,392 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Set
+import database
+import models
+from chunker import StreamingChunker
+from pdf_extract import iter_pdf_pages, get_page_count
+from r2_client import get_r2_client, get_transfer_config, R2_BUCKET_NAME
+from vector_store import DEFAULT_COLLECTION, DocumentReindex, add_chunks_to_vector_store
+
+# Workers per pipeline stage (store, extract, embed) and how many uploads may wait in the queue
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "100"))
+# Chunks handed to the embedding writer at a time (it splits them into token-budgeted
+# requests and runs those concurrently), progress is reported per hand-off
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "256"))
+# Extracted pages buffered between the extract and embed stages of one job
+INGEST_PAGE_BUFFER = int(os.getenv("INGEST_PAGE_BUFFER", "200"))
+# Finished jobs kept around for the status endpoint
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))
+# Uploads are copied to a temp file (in UPLOAD_TMP_DIR, default the system temp dir) in
+# UPLOAD_CHUNK_SIZE pieces and rejected beyond UPLOAD_MAX_MB
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_MAX_MB = int(os.getenv("UPLOAD_MAX_MB", "500"))
+
+UPLOADS_DIR = os.path.join(os.path.dirname(__file__), "..", "uploads")
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue can't take another upload"""
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds UPLOAD_MAX_MB"""
+
+
+def spool_upload(source, suffix: str = "", max_bytes: int = UPLOAD_MAX_MB * 1024 * 1024):
+    """
+    Copy an upload stream to a temp file piece by piece, hashing it on the
+    way, so it is never held in memory. Returns (path, size, sha256).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=UPLOAD_TMP_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"File is larger than {max_bytes // (1024 * 1024)} MB")
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, size, digest.hexdigest()
+
+
+class IngestionJob:
+    """Progress of one document through the store -> extract -> embed pipeline"""
+
+    def __init__(self, document_id: int, filename: str, storage_key: str, content_type: str, path: str,
+                 size: int = 0, sha256: Optional[str] = None, collection: str = DEFAULT_COLLECTION,
+                 replace: bool = False, previous_file_path: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.document_id = document_id
+        self.filename = filename
+        # Vector store collection of the document's knowledge base
+        self.collection = collection
+        self.storage_key = storage_key
+        self.content_type = content_type
+        # Temp file holding the upload until it is stored and extracted (see spool_upload)
+        self.path: Optional[str] = path
+        # A new version of an indexed document: only changed chunks are embedded (see DocumentReindex)
+        # and the previous file is deleted once the new one is stored
+        self.replace = replace
+        self.previous_file_path = previous_file_path
+        self.reindex: Optional[dict] = None
+        self.size = size
+        self.sha256 = sha256
+        # (page_number, text) pairs stream from the extract stage to the embed stage, None marks the end
+        self.pages: Optional[asyncio.Queue] = None
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.pages_total = 0
+        self.pages_done = 0
+        self.chunks_total = 0
+        self.chunks_done = 0
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    def set_status(self, status: str, error: str = None):
+        self.status = status
+        self.error = error
+        self.updated_at = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def remove_file(self):
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "document_id": self.document_id,
+            "filename": self.filename,
+            "collection": self.collection,
+            "size": self.size,
+            "sha256": self.sha256,
+            "status": self.status,
+            "error": self.error,
+            "pages_total": self.pages_total,
+            "pages_done": self.pages_done,
+            "chunks_total": self.chunks_total,
+            "chunks_done": self.chunks_done,
+            "reindex": self.reindex,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+def expected_file_path(storage_key: str) -> str:
+    """Where store_file will put the upload unless R2 fails, so the Document row can be created up front"""
+    if R2_BUCKET_NAME:
+        public_url_base = os.getenv("R2_PUBLIC_URL_BASE")
+        return f"{public_url_base}/{storage_key}" if public_url_base else storage_key
+    return f"local://{storage_key}"
+
+
+def store_file(job: IngestionJob):
+    """Put the raw upload to R2, falling back to local storage, returns the stored path/URL"""
+    if R2_BUCKET_NAME:
+        try:
+            # Streamed from the temp file, as a concurrent multipart upload when it is large
+            extra_args = {"ContentType": job.content_type}
+            if job.sha256:
+                extra_args["Metadata"] = {"sha256": job.sha256}
+            get_r2_client().upload_file(job.path, R2_BUCKET_NAME, job.storage_key, ExtraArgs=extra_args,
+                                        Config=get_transfer_config())
+            print(f"Uploaded to R2: {job.storage_key}")
+            return expected_file_path(job.storage_key)
+        except Exception as e:
+            print(f"R2 Upload Error (falling back to local): {e}")
+    else:
+        print("R2 not configured, using local storage")
+
+    # Fallback: Save to local uploads directory
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    local_path = os.path.join(UPLOADS_DIR, job.storage_key)
+    shutil.copyfile(job.path, local_path)
+    print(f"Saved locally: {local_path}")
+    return f"local://{job.storage_key}"
+
+
+def delete_stored_file(file_path: str):
+    """Delete a stored upload (an R2 object or a local file) by the file_path store_file returned"""
+    try:
+        if file_path.startswith("local://"):
+            os.remove(os.path.join(UPLOADS_DIR, file_path[len("local://"):]))
+        elif R2_BUCKET_NAME:
+            public_url_base = os.getenv("R2_PUBLIC_URL_BASE")
+            key = file_path[len(public_url_base) + 1:] if public_url_base and file_path.startswith(public_url_base) else file_path
+            get_r2_client().delete_object(Bucket=R2_BUCKET_NAME, Key=key)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Failed to delete stored file {file_path}: {e}")
+
+
+def existing_document_ids(doc_ids: List[str]) -> Set[str]:
+    """Which of these vector store doc_ids still have a row in the documents table"""
+    ids = [int(doc_id) for doc_id in doc_ids if doc_id.isdigit()]
+    found = set()
+    db = database.SessionLocal()
+    try:
+        for start in range(0, len(ids), 500):
+            rows = db.query(models.Document.id).filter(models.Document.id.in_(ids[start:start + 500])).all()
+            found.update(str(row[0]) for row in rows)
+    finally:
+        db.close()
+    return found
+
+
+def update_document_path(document_id: int, file_path: str):
+    db = database.SessionLocal()
+    try:
+        db.query(models.Document).filter(models.Document.id == document_id).update({"file_path": file_path})
+        db.commit()
+    finally:
+        db.close()
+
+
+class IngestionPipeline:
+    """
+    Background document ingestion running in the API process.
+
+    Uploads are queued and flow through three stages, each with its own
+    queue and INGEST_WORKERS workers: store (R2 or local disk), extract
+    (PyMuPDF in a process pool) and embed (chunk + vector store). A job is
+    handed to the embed stage as soon as extraction starts and its pages
+    stream across in order, so embedding overlaps extraction. Meanwhile the
+    next document can already be stored.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS, queue_size: int = INGEST_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._queues = None
+        self._tasks = []
+
+    def _ensure_started(self):
+        if self._queues is not None:
+            return
+        self._queues = {
+            "store": asyncio.Queue(self.queue_size),
+            # Small hand-off queues so a slow stage pushes back on the ones before it
+            "extract": asyncio.Queue(self.workers * 2),
+            "embed": asyncio.Queue(self.workers * 2),
+        }
+        # The extract stage hands jobs to the embed queue itself, before it has finished
+        stages = [("store", self._store, "extract"), ("extract", self._extract, None), ("embed", self._embed, None)]
+        for name, handler, next_stage in stages:
+            for _ in range(self.workers):
+                self._tasks.append(asyncio.create_task(self._worker(name, handler, next_stage)))
+
+    def is_full(self) -> bool:
+        return self._queues is not None and self._queues["store"].full()
+
+    def submit(self, job: IngestionJob) -> IngestionJob:
+        self._ensure_started()
+        try:
+            self._queues["store"].put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("Ingestion queue is full, try again later")
+        with self._lock:
+            self.jobs[job.id] = job
+            self._trim_history()
+        return job
+
+    def stats(self):
+        """Jobs waiting in each stage's queue, and jobs not finished yet"""
+        queued = {stage: queue.qsize() for stage, queue in (self._queues or {}).items()}
+        with self._lock:
+            active = sum(1 for job in self.jobs.values() if not job.finished)
+        return {"store_queued": queued.get("store", 0), "extract_queued": queued.get("extract", 0),
+                "embed_queued": queued.get("embed", 0), "active_jobs": active}
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def active_job(self, document_id: int) -> Optional[IngestionJob]:
+        """The unfinished job of a document, a replace or delete has to wait for it"""
+        with self._lock:
+            return next((job for job in self.jobs.values() if job.document_id == document_id and not job.finished), None)
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - INGEST_JOB_HISTORY)]:
+            del self.jobs[job_id]
+
+    async def _worker(self, stage: str, handler, next_stage: Optional[str]):
+        queue = self._queues[stage]
+        while True:
+            job = await queue.get()
+            try:
+                await handler(job)
+                if next_stage and not job.finished:
+                    await self._queues[next_stage].put(job)
+            except Exception as e:
+                print(f"Ingestion Error ({stage}) for document {job.document_id}: {e}")
+                job.remove_file()
+                job.set_status("failed", f"{stage} failed: {e}")
+            finally:
+                queue.task_done()
+
+    async def _store(self, job: IngestionJob):
+        job.set_status("storing")
+        file_path = await asyncio.to_thread(store_file, job)
+        if file_path != expected_file_path(job.storage_key):
+            await asyncio.to_thread(update_document_path, job.document_id, file_path)
+        if job.previous_file_path and job.previous_file_path != file_path:
+            await asyncio.to_thread(delete_stored_file, job.previous_file_path)
+
+    async def _extract(self, job: IngestionJob):
+        if job.content_type != "application/pdf":
+            job.remove_file()
+            if job.replace:
+                # Nothing to index any more, drop the previous version's chunks
+                reindex = DocumentReindex(str(job.document_id), job.collection)
+                await reindex.load()
+                job.reindex = await reindex.finish()
+            job.set_status("completed")
+            return
+
+        job.set_status("extracting")
+        # Extraction workers open the spooled upload by path, MuPDF reads the pages it needs from disk
+        path = job.path
+        job.pages = asyncio.Queue(INGEST_PAGE_BUFFER)
+        try:
+            job.pages_total = await asyncio.to_thread(get_page_count, path)
+            await self._queues["embed"].put(job)
+            async for page_number, text in iter_pdf_pages(path, page_count=job.pages_total):
+                if job.status == "failed":
+                    # The embed stage gave up on this job, stop extracting
+                    return
+                await job.pages.put((page_number, text))
+                job.pages_done += 1
+        except Exception as e:
+            job.set_status("failed", f"extract failed: {e}")
+            raise
+        finally:
+            await job.pages.put(None)
+            job.remove_file()
+        job.set_status("embedding")
+
+    async def _drain_pages(self, job: IngestionJob):
+        while await job.pages.get() is not None:
+            pass
+
+    async def _embed(self, job: IngestionJob):
+        metadata = {"filename": job.filename}
+        doc_id = str(job.document_id)
+        chunker = StreamingChunker()
+        batch = []
+        reindex = DocumentReindex(doc_id, job.collection) if job.replace else None
+
+        async def flush():
+            if reindex is not None:
+                await reindex.add([chunk.text for chunk in batch], metadata, [chunk.metadata() for chunk in batch])
+            else:
+                await add_chunks_to_vector_store(
+                    doc_id, [chunk.text for chunk in batch], metadata, job.chunks_done,
+                    chunk_metadatas=[chunk.metadata() for chunk in batch], collection=job.collection,
+                )
+            job.chunks_done += len(batch)
+            job.updated_at = time.time()
+            batch.clear()
+
+        async def add(chunks):
+            for chunk in chunks:
+                batch.append(chunk)
+                job.chunks_total += 1
+                if len(batch) >= INGEST_EMBED_BATCH:
+                    await flush()
+
+        # Chunks are cut as pages arrive, the document is never assembled into one string
+        try:
+            if reindex is not None:
+                await reindex.load()
+            while True:
+                page = await job.pages.get()
+                if page is None:
+                    break
+                await add(chunker.feed(*page))
+        except Exception as e:
+            # Unblock the extractor still feeding this job
+            job.set_status("failed", f"embed failed: {e}")
+            asyncio.create_task(self._drain_pages(job))
+            raise
+
+        if job.status == "failed":
+            return
+        await add(chunker.finish())
+        if batch:
+            await flush()
+        if reindex is not None:
+            job.reindex = await reindex.finish()
+            print(f"Re-indexed doc {job.document_id}: {job.reindex}")
+        else:
+            print(f"Added {job.chunks_done} chunks to vector store for doc {job.document_id}")
+        job.set_status("completed")
+
+
+ingestion_pipeline = IngestionPipeline()
@@ -0,0 +1,207 @@
+"""
+On-disk BM25 index of the chunks in each vector store collection.
+
+Every collection gets an SQLite FTS5 table (the inverted index, ranked
+with FTS5's built-in bm25()) and a side table mapping chunk ids to their
+document and metadata. It is written alongside Chroma during ingestion and
+lets queries match exact part numbers and error codes that embeddings blur.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence
+
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", os.path.join(os.path.dirname(__file__), "lexical_index.db"))
+# The lexical-only fast path needs the best hit to beat the runner-up by this BM25 factor
+LEXICAL_CONFIDENCE_RATIO = float(os.getenv("LEXICAL_CONFIDENCE_RATIO", "1.5"))
+
+# Words and identifiers such as "E-1042", "XJ-900" or "v2.1.3"
+_TERM = re.compile(r"\w+(?:[-./]\w+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it my of on or the this to what when where which "
+    "who why with you your".split()
+)
+
+
+def query_terms(query: str) -> List[str]:
+    return [term for term in _TERM.findall(query.lower()) if term not in _STOPWORDS]
+
+
+def identifiers(terms: List[str]) -> List[str]:
+    """Terms that look like codes or part numbers (contain a digit), the ones embeddings match worst"""
+    return [term for term in terms if len(term) >= 3 and any(ch.isdigit() for ch in term)]
+
+
+def match_expression(terms: List[str]) -> str:
+    """FTS5 query OR-ing the terms, identifiers become phrases of their parts ("e-1042" -> "e 1042")"""
+    phrases = []
+    for term in dict.fromkeys(terms):
+        parts = re.findall(r"\w+", term)
+        phrases.append('"' + " ".join(parts) + '"')
+    return " OR ".join(phrases)
+
+
+def contains_identifier(text: str, identifier: str) -> bool:
+    parts = re.findall(r"\w+", identifier)
+    return re.search(r"\b" + r"\W+".join(map(re.escape, parts)) + r"\b", text, re.IGNORECASE) is not None
+
+
+class LexicalHit:
+    __slots__ = ("id", "document", "metadata", "score")
+
+    def __init__(self, chunk_id: str, document: str, metadata: Dict, score: float):
+        self.id = chunk_id
+        self.document = document
+        self.metadata = metadata
+        # bm25() is negative, more negative is better; stored flipped so higher is better
+        self.score = score
+
+
+class LexicalIndex:
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._tables = set()
+
+    def _ensure_tables(self, collection: str):
+        # Collection names are limited to [a-zA-Z0-9._-], so quoting them is enough
+        if collection in self._tables:
+            return
+        self._conn.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS "{collection}_fts" USING fts5(text, tokenize="porter unicode61")')
+        self._conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{collection}_chunks" ('
+            " chunk_id TEXT PRIMARY KEY, doc_id TEXT NOT NULL, metadata TEXT NOT NULL, fts_rowid INTEGER NOT NULL UNIQUE)"
+        )
+        self._conn.execute(f'CREATE INDEX IF NOT EXISTS "{collection}_chunks_doc_id" ON "{collection}_chunks" (doc_id)')
+        self._tables.add(collection)
+
+    def _exists(self, collection: str) -> bool:
+        if collection in self._tables:
+            return True
+        row = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f"{collection}_fts",)
+        ).fetchone()
+        return row is not None
+
+    def upsert(self, collection: str, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        with self._lock:
+            self._ensure_tables(collection)
+            self._conn.execute("BEGIN")
+            try:
+                for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                    row = self._conn.execute(
+                        f'SELECT fts_rowid FROM "{collection}_chunks" WHERE chunk_id = ?', (chunk_id,)
+                    ).fetchone()
+                    if row:
+                        self._conn.execute(f'DELETE FROM "{collection}_fts" WHERE rowid = ?', row)
+                    rowid = self._conn.execute(f'INSERT INTO "{collection}_fts" (text) VALUES (?)', (document,)).lastrowid
+                    self._conn.execute(
+                        f'INSERT OR REPLACE INTO "{collection}_chunks" (chunk_id, doc_id, metadata, fts_rowid) VALUES (?, ?, ?, ?)',
+                        (chunk_id, str(metadata.get("doc_id", "")), json.dumps(metadata), rowid),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete_document(self, collection: str, doc_id: str):
+        with self._lock:
+            if not self._exists(collection):
+                return
+            self._ensure_tables(collection)
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    f'DELETE FROM "{collection}_fts" WHERE rowid IN (SELECT fts_rowid FROM "{collection}_chunks" WHERE doc_id = ?)',
+                    (str(doc_id),),
+                )
+                self._conn.execute(f'DELETE FROM "{collection}_chunks" WHERE doc_id = ?', (str(doc_id),))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete_chunks(self, collection: str, chunk_ids: Sequence[str]):
+        with self._lock:
+            if not chunk_ids or not self._exists(collection):
+                return
+            self._ensure_tables(collection)
+            self._conn.execute("BEGIN")
+            try:
+                for start in range(0, len(chunk_ids), 500):
+                    batch = list(chunk_ids[start:start + 500])
+                    marks = ",".join("?" * len(batch))
+                    self._conn.execute(
+                        f'DELETE FROM "{collection}_fts" WHERE rowid IN'
+                        f' (SELECT fts_rowid FROM "{collection}_chunks" WHERE chunk_id IN ({marks}))',
+                        batch,
+                    )
+                    self._conn.execute(f'DELETE FROM "{collection}_chunks" WHERE chunk_id IN ({marks})', batch)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def collections(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        return [name[:-len("_chunks")] for (name,) in rows if name.endswith("_chunks")]
+
+    def doc_ids(self, collection: str) -> List[str]:
+        """Every document with chunks in a collection (read from the doc_id index)"""
+        with self._lock:
+            if not self._exists(collection):
+                return []
+            self._ensure_tables(collection)
+            return [doc_id for (doc_id,) in self._conn.execute(f'SELECT DISTINCT doc_id FROM "{collection}_chunks"')]
+
+    def search(self, collection: str, terms: List[str], n_results: int,
+               doc_ids: Optional[Sequence[str]] = None) -> List[LexicalHit]:
+        if not terms:
+            return []
+        with self._lock:
+            if not self._exists(collection):
+                return []
+            params: list = [match_expression(terms)]
+            doc_filter = ""
+            if doc_ids:
+                doc_filter = f" AND c.doc_id IN ({','.join('?' * len(doc_ids))})"
+                params.extend(doc_ids)
+            params.append(n_results)
+            rows = self._conn.execute(
+                f'SELECT c.chunk_id, f.text, c.metadata, bm25("{collection}_fts") AS score'
+                f' FROM "{collection}_fts" f JOIN "{collection}_chunks" c ON c.fts_rowid = f.rowid'
+                f' WHERE "{collection}_fts" MATCH ?{doc_filter} ORDER BY score LIMIT ?',
+                params,
+            ).fetchall()
+        return [LexicalHit(chunk_id, text, json.loads(metadata), -score) for chunk_id, text, metadata, score in rows]
+
+
+def is_confident(terms: List[str], hits: List[LexicalHit]) -> bool:
+    """
+    Whether the lexical results can answer the query alone: it asks for an
+    identifier, the best hit contains every identifier and clearly outranks
+    the next one.
+    """
+    codes = identifiers(terms)
+    if not codes or not hits:
+        return False
+    if not all(contains_identifier(hits[0].document, code) for code in codes):
+        return False
+    return len(hits) == 1 or hits[0].score >= hits[1].score * LEXICAL_CONFIDENCE_RATIO
+
+
+_index: Optional[LexicalIndex] = None
+_index_lock = threading.Lock()
+
+def get_lexical_index() -> LexicalIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LexicalIndex()
+        return _index
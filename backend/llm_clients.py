@@ -0,0 +1,111 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+import httpx
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+load_dotenv()
+
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# Registry bounds: at most LLM_CLIENT_POOL_SIZE clients, dropped after LLM_CLIENT_IDLE_TTL seconds unused
+LLM_CLIENT_POOL_SIZE = int(os.getenv("LLM_CLIENT_POOL_SIZE", "512"))
+LLM_CLIENT_IDLE_TTL = float(os.getenv("LLM_CLIENT_IDLE_TTL", "900"))
+
+# HTTP/2 multiplexes many streams over one connection, but needs the optional `h2` package
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_http_client = None
+
+def get_shared_http_client() -> httpx.AsyncClient:
+    """One keep-alive connection pool shared by every OpenRouter client, whatever its API key"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=60),
+            timeout=httpx.Timeout(600.0, connect=5.0),
+        )
+    return _http_client
+
+
+def warm_up():
+    """Import the openai package and its chat resources, which the SDK otherwise loads on the first LLM call"""
+    from openai import AsyncOpenAI
+    AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key="warm-up", http_client=get_shared_http_client()).chat.completions
+
+
+def _key_hash(api_key: str) -> str:
+    # Never keep raw API keys as dict keys (they'd show up in debug dumps)
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class ClientRegistry:
+    """
+    Bounded registry of AsyncOpenAI clients keyed by (base_url, api_key hash).
+
+    Clients are thin wrappers holding the key; they all share one httpx
+    transport, so a tenant's first request reuses warm connections (and
+    TLS sessions) opened by any other tenant. Evicting a client never
+    closes the shared transport.
+    """
+
+    def __init__(self, max_size: int = LLM_CLIENT_POOL_SIZE, idle_ttl: float = LLM_CLIENT_IDLE_TTL):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, api_key: str, base_url: str = OPENROUTER_BASE_URL) -> "AsyncOpenAI":
+        key = (base_url, _key_hash(api_key))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                self.hits += 1
+                entry[1] = now
+                self._clients.move_to_end(key)
+                return entry[0]
+
+            self.misses += 1
+            # The openai package is imported by the first LLM call, not at startup
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=get_shared_http_client())
+            self._clients[key] = [client, now]
+            self._evict(now)
+            return client
+
+    def _evict(self, now: float):
+        # Least recently used first, so idle clients are always at the front
+        while self._clients:
+            key, (_, last_used) = next(iter(self._clients.items()))
+            if len(self._clients) <= self.max_size and now - last_used < self.idle_ttl:
+                break
+            del self._clients[key]
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._clients),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "http2": HTTP2_AVAILABLE,
+            }
+
+
+client_registry = ClientRegistry()
@@ -1,15 +1,50 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine, Base
+from database import async_engine, engine, init_db, pool_stats
 from routers import workflows, documents, workflow_run
+from chat_history import chat_recorder
+from batch_runs import batch_runs
+from embedding_cache import get_embedding_cache
+from ingestion import ingestion_pipeline
+from llm_clients import client_registry
+from pdf_extract import shutdown_process_pool
+from plan_cache import plan_cache
+from query_cache import query_embedding_cache, retrieval_cache
+from response_cache import get_response_cache
+from startup import STARTUP_WARMUP, readiness, warm_up
+from tracing import render_metrics
+from web_search import page_cache, search_cache
 
-# Create Tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create missing tables and indexes
+    await asyncio.to_thread(init_db)
+    readiness.database = True
+    # Heavy clients are built on first use, warm them up while the server already accepts connections
+    warm_up_task = None
+    if STARTUP_WARMUP:
+        readiness.warming = True
+        warm_up_task = asyncio.create_task(warm_up())
+    readiness.mark()
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    # Running batches stop here and can be resumed after the restart
+    for batch in list(batch_runs.values()):
+        await batch.cancel()
+    # Write the chat turns still waiting in the write-behind buffer
+    await chat_recorder.close()
+    await async_engine.dispose()
+    shutdown_process_pool()
 
 app = FastAPI(
     title="AI Workflow Builder API",
     description="Backend for the AI Workflow Builder application",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -32,3 +67,51 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe: 503 until the database is set up and the startup warm-up finished"""
+    return JSONResponse(readiness.status(), status_code=200 if readiness.ready else 503)
+
+def sqlite_cache_stats():
+    """
+    Stats of the on-disk embedding and response caches, None for one nothing
+    has opened yet. Counting their rows holds the cache lock, call it in a thread.
+    """
+    embedding_cache = get_embedding_cache(create=False)
+    response_cache = get_response_cache(create=False)
+    return (embedding_cache.stats() if embedding_cache else None, response_cache.stats() if response_cache else None)
+
+@app.get("/health/caches")
+async def cache_stats():
+    embeddings, responses = await asyncio.to_thread(sqlite_cache_stats)
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "retrieval": retrieval_cache.stats(),
+        "web_search": search_cache.stats(),
+        "web_pages": page_cache.stats(),
+        "embeddings": embeddings,
+        "responses": responses,
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Latency histograms, token counters, cache and pool state in the Prometheus text format"""
+    embeddings, responses = await asyncio.to_thread(sqlite_cache_stats)
+    caches = {
+        "query_embeddings": query_embedding_cache.stats(),
+        "retrieval": retrieval_cache.stats(),
+        "web_search": search_cache.stats(),
+        "web_pages": page_cache.stats(),
+        "plans": plan_cache.stats(),
+        "llm_clients": client_registry.stats(),
+        "embeddings": embeddings,
+        "responses": responses,
+    }
+    pools = {
+        "db": pool_stats(engine.pool),
+        "db_async": pool_stats(async_engine.pool),
+        "ingestion": ingestion_pipeline.stats(),
+        "chat_history": {"pending": chat_recorder.stats()["pending"]},
+    }
+    return PlainTextResponse(render_metrics(caches, pools), media_type="text/plain; version=0.0.4")
@@ -1,8 +1,14 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
+from datetime import datetime, timezone
 from database import Base
 
+
+def utcnow():
+    # Set in Python so SQLite stores the same microsecond format the keyset cursors compare against
+    return datetime.now(timezone.utc)
+
 class Workflow(Base):
     __tablename__ = "workflows"
 
@@ -10,11 +16,14 @@ class Workflow(Base):
     name = Column(String, index=True)
     description = Column(String, nullable=True)
     data = Column(JSON)  # Stores the React Flow nodes and edges configuration
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
 
     chats = relationship("ChatHistory", back_populates="workflow")
 
+    # The workflow list pages by most recently updated
+    __table_args__ = (Index("ix_workflows_updated_at", "updated_at", "id"),)
+
 
 class Document(Base):
     __tablename__ = "documents"
@@ -24,16 +33,29 @@ class Document(Base):
     file_path = Column(String) # Path to the file on disk or URL
     content_type = Column(String) 
     file_size = Column(Integer)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Vector store collection the document is indexed in, and the sha256 of the stored file
+    # (a replace with the same content is a no-op); NULL for documents uploaded before they were kept
+    collection = Column(String, nullable=True)
+    sha256 = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
+
+    __table_args__ = (Index("ix_documents_created_at", "created_at", "id"),)
 
 
 class ChatHistory(Base):
     __tablename__ = "chat_history"
+    # History pages read one workflow's turns newest first, conversation memory one conversation's
+    __table_args__ = (
+        Index("ix_chat_history_workflow_created", "workflow_id", "created_at"),
+        Index("ix_chat_history_conversation_created", "workflow_id", "conversation_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     workflow_id = Column(Integer, ForeignKey("workflows.id"))
+    # Chat the turn belongs to (one per open chat window), turns recorded before it have none
+    conversation_id = Column(String(64), nullable=True)
     user_query = Column(Text)
     ai_response = Column(Text)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
 
     workflow = relationship("Workflow", back_populates="chats")
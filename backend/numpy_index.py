@@ -0,0 +1,491 @@
+"""
+In-process vector index on NumPy, the VECTOR_BACKEND=numpy alternative to Chroma.
+
+Each collection is a directory under NUMPY_INDEX_DIR: immutable segment
+files holding quantized embeddings (float16, or int8 with a scale per row)
+that are read through memory maps, and an SQLite database of the chunks
+(id, doc_id, segment and row, text, metadata). An upsert writes a new
+segment, a delete only drops database rows, and segments are merged once
+there are more than NUMPY_INDEX_MAX_SEGMENTS or one is mostly deleted
+rows. Queries scan the live rows with matrix products and pick the top k
+with argpartition. Distances are squared L2, Chroma's default space, so
+results rank and merge the same with either backend.
+
+Segment files are never modified, so uvicorn workers opening the same
+directory share their pages through the OS page cache instead of each
+holding a copy of the index, and a worker picks up another's writes
+through the generation number kept in the database.
+
+NumpyIndex and NumpyCollection implement the part of chromadb's client and
+collection API that vector_store.py uses (get_or_create_collection,
+get_collection, list_collections; upsert, update, get, delete, query,
+count). `where` filters can only select doc_ids.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from itertools import groupby
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+NUMPY_INDEX_DIR = os.getenv("NUMPY_INDEX_DIR", os.path.join(os.path.dirname(__file__), "vector_index"))
+# "float16" (half of float32) or "int8" (a quarter, scaled per row). A collection keeps the one it was created with.
+NUMPY_INDEX_DTYPE = os.getenv("NUMPY_INDEX_DTYPE", "float16")
+NUMPY_INDEX_MAX_SEGMENTS = int(os.getenv("NUMPY_INDEX_MAX_SEGMENTS", "8"))
+
+DTYPES = ("float16", "int8")
+# Rows converted to float32 per matrix product, bounds the scratch memory of a query
+_SCAN_ROWS = 8192
+# Files of merged segments are kept this long for workers still reading them
+_RETIRED_GRACE = 60.0
+# Ids per SQLite statement
+_ID_BATCH = 500
+
+
+class NotFoundError(Exception):
+    """Raised by NumpyIndex.get_collection for a collection that doesn't exist"""
+
+
+def quantize(embeddings, dtype: str):
+    """
+    Stored form of float embeddings: the vectors in dtype, and per row its
+    squared norm (taken before quantization) and the int8 scale (1 for float16)
+    """
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    stats = np.empty((len(vectors), 2), dtype=np.float32)
+    stats[:, 0] = np.einsum("ij,ij->i", vectors, vectors)
+    if dtype == "int8":
+        scale = np.abs(vectors).max(axis=1) / 127
+        scale[scale == 0] = 1
+        stats[:, 1] = scale
+        return np.round(vectors / scale[:, None]).astype(np.int8), stats
+    stats[:, 1] = 1
+    return vectors.astype(np.float16), stats
+
+
+def _doc_ids(where: Optional[Dict]) -> Optional[List[str]]:
+    """doc_ids selected by a {"doc_id": id} or {"doc_id": {"$in": [...]}} filter, None without one"""
+    if not where:
+        return None
+    if set(where) != {"doc_id"}:
+        raise ValueError(f"Unsupported where filter: {where}")
+    value = where["doc_id"]
+    if isinstance(value, dict):
+        if set(value) != {"$in"}:
+            raise ValueError(f"Unsupported where filter: {where}")
+        return [str(doc_id) for doc_id in value["$in"]]
+    return [str(value)]
+
+
+def _placeholders(values: Sequence) -> str:
+    return ", ".join("?" * len(values))
+
+
+class _Segment:
+    """Memory-mapped vectors and row stats of one segment"""
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        self.vectors = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        self.stats = np.load(os.path.join(directory, f"{name}.stats.npy"), mmap_mode="r")
+
+
+class _Block:
+    """The live rows of one segment in a view, with their ids and doc_id codes"""
+
+    def __init__(self, segment: _Segment, rows: np.ndarray, ids: np.ndarray, docs: np.ndarray):
+        self.segment = segment
+        self.rows = rows
+        self.ids = ids
+        self.docs = docs
+        # Rows are sorted and unique, so all of them are live when there are as many as the segment has
+        self.complete = len(rows) == len(segment.vectors)
+
+    def distances(self, rows: Optional[np.ndarray], queries: np.ndarray, query_norms: np.ndarray) -> np.ndarray:
+        """Squared L2 distances (rows x queries) of the given rows, or all live rows when None"""
+        segment = self.segment
+        count = len(self.rows) if rows is None else len(rows)
+        distances = np.empty((count, len(queries)), dtype=np.float32)
+        for start in range(0, count, _SCAN_ROWS):
+            end = min(start + _SCAN_ROWS, count)
+            if rows is None and self.complete:
+                # Slices of a memory map read the rows in place, no fancy-index copy
+                vectors, stats = segment.vectors[start:end], segment.stats[start:end]
+            else:
+                part = (self.rows if rows is None else rows)[start:end]
+                vectors, stats = segment.vectors[part], segment.stats[part]
+            dots = vectors.astype(np.float32) @ queries.T
+            dots *= stats[:, 1:2]
+            distances[start:end] = stats[:, 0:1] + query_norms - 2 * dots
+        return np.maximum(distances, 0, out=distances)
+
+
+class _View:
+    """The live rows of a collection at one generation"""
+
+    def __init__(self, generation: int, blocks: List[_Block], doc_codes: Dict[str, int]):
+        self.generation = generation
+        self.blocks = blocks
+        self.doc_codes = doc_codes
+
+
+class NumpyCollection:
+    def __init__(self, directory: str, name: str, dtype: str = NUMPY_INDEX_DTYPE):
+        self.name = name
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "chunks.db"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Other worker processes may be writing to the same collection
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, doc_id TEXT NOT NULL, segment TEXT NOT NULL,"
+            " row INTEGER NOT NULL, document TEXT, metadata TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_doc_id ON chunks (doc_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_segment ON chunks (segment, row)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS segments (name TEXT PRIMARY KEY, rows INTEGER NOT NULL, retired REAL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('generation', '0'), ('dtype', ?)", (dtype,))
+        self.dtype = self._setting("dtype")
+        self._segments: Dict[str, _Segment] = {}
+        self._view: Optional[_View] = None
+
+    def _setting(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _segment(self, name: str) -> _Segment:
+        segment = self._segments.get(name)
+        if segment is None:
+            segment = self._segments[name] = _Segment(self.directory, name)
+        return segment
+
+    def _save(self, name: str, vectors: np.ndarray, stats: np.ndarray):
+        for suffix, array in ((".npy", vectors), (".stats.npy", stats)):
+            path = os.path.join(self.directory, name + suffix)
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(path + ".tmp", path)
+
+    def _remove_files(self, name: str):
+        self._segments.pop(name, None)
+        for suffix in (".npy", ".stats.npy"):
+            try:
+                os.remove(os.path.join(self.directory, name + suffix))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Still mapped by a reader on platforms that don't allow removing it, retried next time
+                print(f"Could not remove segment file {name}{suffix}: {e}")
+
+    def _write(self, apply, segments: Sequence[str] = ()):
+        """
+        Run apply() in a write transaction, which other processes wait for,
+        and bump the generation. Files of the given new segments are removed
+        if it fails.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                apply()
+                self._conn.execute("UPDATE settings SET value = CAST(value AS INTEGER) + 1 WHERE key = 'generation'")
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                for name in segments:
+                    self._remove_files(name)
+                raise
+
+    def upsert(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict]] = None):
+        if not len(ids):
+            return
+        if len(set(ids)) != len(ids):
+            raise ValueError("Upsert ids must be unique")
+        vectors, stats = quantize(embeddings, self.dtype)
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [{}] * len(ids)
+        name = uuid.uuid4().hex
+
+        def apply():
+            dimensions = self._setting("dimensions")
+            if dimensions is None:
+                self._conn.execute("INSERT INTO settings (key, value) VALUES ('dimensions', ?)", (str(vectors.shape[1]),))
+            elif int(dimensions) != vectors.shape[1]:
+                raise ValueError(f"Collection {self.name} expects {dimensions} dimensional embeddings, got {vectors.shape[1]}")
+            self._save(name, vectors, stats)
+            self._conn.execute("INSERT INTO segments (name, rows) VALUES (?, ?)", (name, len(ids)))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, doc_id, segment, row, document, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                [(chunk_id, str((metadata or {}).get("doc_id", "")), name, row, document, json.dumps(metadata or {}))
+                 for row, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas))],
+            )
+            self._merge_segments()
+
+        self._write(apply, [name])
+
+    def add(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+            metadatas: Optional[List[Dict]] = None):
+        self.upsert(ids, embeddings, documents, metadatas)
+
+    def update(self, ids: List[str], metadatas: Optional[List[Dict]] = None, documents: Optional[List[str]] = None):
+        """Merge metadata into (like Chroma) and replace the text of existing chunks, unknown ids are skipped"""
+        def apply():
+            for i, chunk_id in enumerate(ids):
+                row = self._conn.execute("SELECT metadata FROM chunks WHERE id = ?", (chunk_id,)).fetchone()
+                if row is None:
+                    continue
+                metadata = dict(json.loads(row[0]), **(metadatas[i] if metadatas else {}))
+                self._conn.execute(
+                    "UPDATE chunks SET doc_id = ?, metadata = ? WHERE id = ?",
+                    (str(metadata.get("doc_id", "")), json.dumps(metadata), chunk_id),
+                )
+                if documents:
+                    self._conn.execute("UPDATE chunks SET document = ? WHERE id = ?", (documents[i], chunk_id))
+
+        self._write(apply)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        doc_ids = _doc_ids(where)
+
+        def apply():
+            for start in range(0, len(ids or []), _ID_BATCH):
+                batch = ids[start:start + _ID_BATCH]
+                self._conn.execute(f"DELETE FROM chunks WHERE id IN ({_placeholders(batch)})", batch)
+            if doc_ids:
+                self._conn.execute(f"DELETE FROM chunks WHERE doc_id IN ({_placeholders(doc_ids)})", doc_ids)
+            self._merge_segments()
+
+        self._write(apply)
+
+    def _merge_segments(self):
+        """
+        Inside a write: retire segments without live rows, merge the smaller
+        half of the segments into one when there are more than
+        NUMPY_INDEX_MAX_SEGMENTS (so big segments are rarely rewritten), and
+        rewrite segments that are more than half deleted rows.
+        """
+        now = time.time()
+        segments = self._conn.execute(
+            "SELECT s.name, s.rows, COUNT(c.id) AS live FROM segments s LEFT JOIN chunks c ON c.segment = s.name"
+            " WHERE s.retired IS NULL GROUP BY s.name ORDER BY live DESC"
+        ).fetchall()
+        retired = [name for name, _, live in segments if not live]
+        segments = [segment for segment in segments if segment[2]]
+        merge = [segment for segment in segments if segment[2] * 2 < segment[1]]
+        if len(segments) > NUMPY_INDEX_MAX_SEGMENTS:
+            merge += [segment for segment in segments[NUMPY_INDEX_MAX_SEGMENTS // 2:] if segment not in merge]
+        if merge:
+            names = [name for name, _, _ in merge]
+            rows = self._conn.execute(
+                f"SELECT id, segment, row FROM chunks WHERE segment IN ({_placeholders(names)}) ORDER BY segment, row", names
+            ).fetchall()
+            vectors, stats = [], []
+            for name, group in groupby(rows, key=lambda row: row[1]):
+                positions = np.array([row[2] for row in group], dtype=np.int64)
+                segment = self._segment(name)
+                vectors.append(segment.vectors[positions])
+                stats.append(segment.stats[positions])
+            merged = uuid.uuid4().hex
+            self._save(merged, np.concatenate(vectors), np.concatenate(stats))
+            try:
+                self._conn.execute("INSERT INTO segments (name, rows) VALUES (?, ?)", (merged, len(rows)))
+                self._conn.executemany(
+                    "UPDATE chunks SET segment = ?, row = ? WHERE id = ?",
+                    [(merged, position, row[0]) for position, row in enumerate(rows)],
+                )
+            except BaseException:
+                self._remove_files(merged)
+                raise
+            retired += names
+        if retired:
+            self._conn.execute(f"UPDATE segments SET retired = ? WHERE name IN ({_placeholders(retired)})", [now] + retired)
+        # Files retired a while ago are no longer read by anyone
+        expired = [row[0] for row in self._conn.execute(
+            "SELECT name FROM segments WHERE retired < ?", (now - _RETIRED_GRACE,)
+        ).fetchall()]
+        if expired:
+            self._conn.execute(f"DELETE FROM segments WHERE name IN ({_placeholders(expired)})", expired)
+            for name in expired:
+                self._remove_files(name)
+        # Files of segments never committed (a writer died half-way)
+        known = {row[0] for row in self._conn.execute("SELECT name FROM segments").fetchall()}
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if (filename.endswith((".npy", ".tmp")) and filename.split(".")[0] not in known
+                    and os.path.getmtime(path) < now - _RETIRED_GRACE):
+                os.remove(path)
+
+    def _current_view(self) -> _View:
+        """The view of the live rows, rebuilt when this or another process wrote to the collection"""
+        with self._lock:
+            generation = int(self._setting("generation"))
+            if self._view is not None and self._view.generation == generation:
+                return self._view
+            self._conn.execute("BEGIN")
+            try:
+                generation = int(self._setting("generation"))
+                rows = self._conn.execute("SELECT segment, row, id, doc_id FROM chunks ORDER BY segment, row").fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+            doc_codes: Dict[str, int] = {}
+            blocks = []
+            for name, group in groupby(rows, key=lambda row: row[0]):
+                group = list(group)
+                blocks.append(_Block(
+                    self._segment(name),
+                    np.fromiter((row[1] for row in group), dtype=np.int64, count=len(group)),
+                    np.array([row[2] for row in group], dtype=object),
+                    np.fromiter((doc_codes.setdefault(row[3], len(doc_codes)) for row in group), dtype=np.int32,
+                                count=len(group)),
+                ))
+            live = {block.segment.name for block in blocks}
+            for name in [name for name in self._segments if name not in live]:
+                del self._segments[name]
+            self._view = _View(generation, blocks, doc_codes)
+            return self._view
+
+    def _chunks(self, ids: Sequence[str]) -> Dict[str, tuple]:
+        """id -> (document, metadata) of existing chunks"""
+        chunks = {}
+        with self._lock:
+            for start in range(0, len(ids), _ID_BATCH):
+                batch = list(ids[start:start + _ID_BATCH])
+                for chunk_id, document, metadata in self._conn.execute(
+                    f"SELECT id, document, metadata FROM chunks WHERE id IN ({_placeholders(batch)})", batch
+                ):
+                    chunks[chunk_id] = (document, json.loads(metadata))
+        return chunks
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict] = None, include=None) -> Dict[str, list]:
+        """Nearest n_results chunks of each query embedding, in Chroma's result shape"""
+        view = self._current_view()
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        doc_ids = _doc_ids(where)
+        codes = None
+        if doc_ids is not None:
+            codes = np.array([view.doc_codes[doc_id] for doc_id in doc_ids if doc_id in view.doc_codes], dtype=np.int32)
+        distances, ids = [], []
+        for block in view.blocks:
+            if codes is None:
+                distances.append(block.distances(None, queries, query_norms))
+                ids.append(block.ids)
+                continue
+            mask = np.isin(block.docs, codes)
+            if mask.any():
+                distances.append(block.distances(block.rows[mask], queries, query_norms))
+                ids.append(block.ids[mask])
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if not ids:
+            for key in results:
+                results[key] = [[] for _ in queries]
+            return results
+        distances = np.concatenate(distances)
+        ids = np.concatenate(ids)
+        k = min(n_results, len(ids))
+        tops = []
+        for column in distances.T:
+            top = np.argpartition(column, k - 1)[:k] if k < len(column) else np.arange(len(column))
+            top = top[np.argsort(column[top], kind="stable")]
+            tops.append((ids[top].tolist(), column[top].tolist()))
+        chunks = self._chunks(list({chunk_id for top_ids, _ in tops for chunk_id in top_ids}))
+        for top_ids, top_distances in tops:
+            # A chunk deleted since the view was built is left out
+            hits = [(chunk_id, distance) for chunk_id, distance in zip(top_ids, top_distances) if chunk_id in chunks]
+            results["ids"].append([chunk_id for chunk_id, _ in hits])
+            results["documents"].append([chunks[chunk_id][0] for chunk_id, _ in hits])
+            results["metadatas"].append([chunks[chunk_id][1] for chunk_id, _ in hits])
+            results["distances"].append([distance for _, distance in hits])
+        return results
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include=("metadatas", "documents")) -> Dict[str, Any]:
+        doc_ids = _doc_ids(where)
+        clauses, params = [], []
+        if doc_ids is not None:
+            clauses.append(f"doc_id IN ({_placeholders(doc_ids)})")
+            params += doc_ids
+        sql = "SELECT id, document, metadata FROM chunks" + (" WHERE " + " AND ".join(clauses) if clauses else "")
+        with self._lock:
+            if ids is None:
+                rows = self._conn.execute(
+                    sql + " ORDER BY rowid LIMIT ? OFFSET ?", params + [-1 if limit is None else limit, offset or 0]
+                ).fetchall()
+            else:
+                rows = []
+                for start in range(0, len(ids), _ID_BATCH):
+                    batch = list(ids[start:start + _ID_BATCH])
+                    rows += self._conn.execute(
+                        sql + (" AND " if clauses else " WHERE ") + f"id IN ({_placeholders(batch)})", params + batch
+                    ).fetchall()
+                rows = rows[offset or 0:][:limit]
+        return {
+            "ids": [row[0] for row in rows],
+            "documents": [row[1] for row in rows] if "documents" in include else None,
+            "metadatas": [json.loads(row[2]) for row in rows] if "metadatas" in include else None,
+        }
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """Chunks, segments and bytes of segment files in use (merged ones waiting for removal aside)"""
+        with self._lock:
+            segments = [row[0] for row in self._conn.execute("SELECT name FROM segments WHERE retired IS NULL")]
+            chunks = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        size = sum(os.path.getsize(os.path.join(self.directory, name + suffix))
+                   for name in segments for suffix in (".npy", ".stats.npy"))
+        return {"chunks": chunks, "segments": len(segments), "bytes": size}
+
+
+class NumpyIndex:
+    """The collections under one directory, with the chromadb client methods vector_store.py uses"""
+
+    def __init__(self, path: str = NUMPY_INDEX_DIR, dtype: str = NUMPY_INDEX_DTYPE):
+        if dtype not in DTYPES:
+            raise ValueError(f"NUMPY_INDEX_DTYPE must be one of {', '.join(DTYPES)}, got {dtype}")
+        self.path = path
+        self.dtype = dtype
+        os.makedirs(path, exist_ok=True)
+        self._collections: Dict[str, NumpyCollection] = {}
+        self._lock = threading.Lock()
+
+    def _exists(self, name: str) -> bool:
+        return os.path.exists(os.path.join(self.path, name, "chunks.db"))
+
+    def _open(self, name: str, create: bool) -> NumpyCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                if not create and not self._exists(name):
+                    raise NotFoundError(f"Collection {name} does not exist")
+                collection = self._collections[name] = NumpyCollection(os.path.join(self.path, name), name, self.dtype)
+            return collection
+
+    def get_or_create_collection(self, name: str, embedding_function=None) -> NumpyCollection:
+        return self._open(name, create=True)
+
+    def get_collection(self, name: str, embedding_function=None) -> NumpyCollection:
+        return self._open(name, create=False)
+
+    def create_collection(self, name: str, embedding_function=None) -> NumpyCollection:
+        if self._exists(name):
+            raise ValueError(f"Collection {name} already exists")
+        return self._open(name, create=True)
+
+    def list_collections(self) -> List[NumpyCollection]:
+        return [self._open(name, create=False) for name in sorted(os.listdir(self.path)) if self._exists(name)]
@@ -0,0 +1,46 @@
+"""
+Keyset pagination for list endpoints.
+
+Lists are ordered newest first by a timestamp column with the id as tie
+breaker. A page ends with an opaque cursor holding the last row's
+(timestamp, id), and the next page seeks to the rows before it through the
+column's index, so a page deep into a long list costs the same as the
+first one (OFFSET reads and discards every row before the page).
+"""
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import or_
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def seek(statement, timestamp_column, id_column, cursor: Optional[str], limit: int):
+    """Add the cursor position, newest-first order and limit (one extra row tells if there is a next page)"""
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        # The plain <= bound lets the index seek straight to the page
+        statement = statement.where(
+            timestamp_column <= timestamp,
+            or_(timestamp_column < timestamp, id_column < row_id),
+        )
+    return statement.order_by(timestamp_column.desc(), id_column.desc()).limit(limit + 1)
+
+
+def page(rows: List[Any], limit: int, timestamp_attr: str):
+    """(items, next_cursor) from the rows of a seek() query"""
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor(getattr(last, timestamp_attr), last.id)
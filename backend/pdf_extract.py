@@ -0,0 +1,85 @@
+"""
+Parallel PDF text extraction.
+
+PyMuPDF's get_text() is CPU-bound, so large documents are split into page
+ranges that are extracted in a process pool. Workers open the document from
+a file path (a temp file for uploads) instead of receiving pickled bytes.
+This module is imported by the spawned workers, keep its imports light.
+"""
+import asyncio
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, List, Optional, Tuple
+
+PDF_EXTRACT_PROCESSES = int(os.getenv("PDF_EXTRACT_PROCESSES", str(os.cpu_count() or 2)))
+# Pages per shard: big enough to amortise opening the document in each task
+PDF_SHARD_PAGES = int(os.getenv("PDF_SHARD_PAGES", "50"))
+
+_process_pool = None
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # spawn, not fork: the API process runs threads (uvicorn, chroma) that must not be forked
+        _process_pool = ProcessPoolExecutor(
+            max_workers=PDF_EXTRACT_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_pool
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+
+def get_page_count(path: str) -> int:
+    # PyMuPDF is imported when a PDF is first opened, the API doesn't load it at startup
+    import fitz
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+def extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """Text of pages [start, end), runs inside a pool worker"""
+    import fitz
+    with fitz.open(path) as doc:
+        return [doc[i].get_text() for i in range(start, end)]
+
+async def iter_pdf_pages(path: str, shard_pages: int = PDF_SHARD_PAGES,
+                         page_count: Optional[int] = None) -> AsyncIterator[Tuple[int, str]]:
+    """
+    Yield (page_number, text) in page order while later shards are still extracting.
+
+    At most two shards per worker are in flight, so a huge document never
+    buffers more than a handful of shards of text ahead of the consumer.
+    Pass page_count when the caller already opened the document to count
+    pages, so a large PDF isn't parsed once more for it.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    if page_count is None:
+        page_count = await asyncio.to_thread(get_page_count, path)
+    ranges = iter([(start, min(start + shard_pages, page_count)) for start in range(0, page_count, shard_pages)])
+
+    pending = deque()
+    def submit_next():
+        page_range = next(ranges, None)
+        if page_range:
+            pending.append(loop.run_in_executor(pool, extract_page_range, path, *page_range))
+
+    for _ in range(PDF_EXTRACT_PROCESSES * 2):
+        submit_next()
+
+    page_number = 0
+    try:
+        while pending:
+            texts = await pending.popleft()
+            submit_next()
+            for text in texts:
+                yield page_number, text
+                page_number += 1
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List
+
+# Maximum number of compiled workflow plans kept in memory per worker
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "256"))
+
+
+def content_version(nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]]) -> str:
+    """Stable hash of a nodes/edges payload, used as the plan version for ad-hoc graphs"""
+    payload = json.dumps({"nodes": nodes, "edges": edges}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """
+    LRU of compiled workflow plans keyed by workflow id.
+
+    Each id holds a single (version, plan) entry, so a new version replaces
+    the old plan instead of accumulating stale ones. The version is the
+    workflow's updated_at for saved workflows or a content hash otherwise.
+    """
+
+    def __init__(self, max_size: int = PLAN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, workflow_id: str, version: str):
+        with self._lock:
+            entry = self._entries.get(workflow_id)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(workflow_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, workflow_id: str, version: str, plan):
+        with self._lock:
+            self._entries[workflow_id] = (version, plan)
+            self._entries.move_to_end(workflow_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, workflow_id: str, version: str, build: Callable[[], Any]):
+        plan = self.get(workflow_id, version)
+        if plan is None:
+            plan = build()
+            self.put(workflow_id, version, plan)
+        return plan
+
+    def invalidate(self, workflow_id):
+        with self._lock:
+            self._entries.pop(str(workflow_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+plan_cache = PlanCache()
@@ -0,0 +1,105 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+# Query embeddings and retrieval results kept in memory per worker, and how long they stay valid.
+# Other workers only see a re-index once their entries expire, so keep the result TTL short.
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "4096"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+
+
+def normalize_query(text: str) -> str:
+    """Case and whitespace-insensitive form of a query, so trivially different repeats share entries"""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class TTLCache:
+    """Thread-safe LRU whose entries also expire after ttl seconds"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._put(key, value)
+
+    def _put(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard_where(self, predicate):
+        """Drop every entry whose key matches predicate"""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class RetrievalCache(TTLCache):
+    """
+    Top-k results keyed by (normalized query, collection, doc_ids, n_results).
+
+    doc_ids is a sorted tuple of the documents a query was filtered to, or
+    None for a search over the whole collection. invalidate_doc() is called
+    whenever a document is (re-)indexed and drops every entry of that
+    collection whose results could include the document. A search that started before an
+    invalidation doesn't store its (possibly stale) results: callers read
+    `generation` before searching and pass it to put_if_current().
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        super().__init__(max_size, ttl)
+        self.generation = 0
+
+    def put_if_current(self, key: Hashable, value: Any, generation: int):
+        with self._lock:
+            if generation == self.generation:
+                self._put(key, value)
+
+    def invalidate_doc(self, doc_id, collection: str):
+        doc_id = str(doc_id)
+        with self._lock:
+            self.generation += 1
+        self.discard_where(lambda key: key[1] == collection and (key[2] is None or doc_id in key[2]))
+
+
+# (embedding model, normalized query) -> query embedding
+query_embedding_cache = TTLCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL)
+retrieval_cache = RetrievalCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
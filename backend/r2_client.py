@@ -1,5 +1,5 @@
 import os
-import boto3
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,12 +10,44 @@ R2_SECRET_ACCESS_KEY = os.getenv("R2_SECRET_ACCESS_KEY")
 R2_BUCKET_NAME = os.getenv("R2_BUCKET_NAME")
 
 # R2 Endpoint URL: https://<account_id>.r2.cloudflarestorage.com
-R2_ENDPOINT_URL = f"https://{R2_ACCOUNT_ID}.r2.cloudflarestorage.com" if R2_ACCOUNT_ID else None
+# (R2_ENDPOINT_URL points at any other S3-compatible endpoint, e.g. a local stand-in)
+R2_ENDPOINT_URL = os.getenv("R2_ENDPOINT_URL") or (f"https://{R2_ACCOUNT_ID}.r2.cloudflarestorage.com" if R2_ACCOUNT_ID else None)
 
-r2_client = boto3.client(
-    's3',
-    endpoint_url=R2_ENDPOINT_URL,
-    aws_access_key_id=R2_ACCESS_KEY_ID,
-    aws_secret_access_key=R2_SECRET_ACCESS_KEY,
-    region_name="auto" # R2 has no regions, 'auto' is standard
-)
+# Files above the threshold are uploaded as multipart uploads of R2_MULTIPART_CHUNK_MB parts,
+# R2_UPLOAD_CONCURRENCY parts at a time, read from disk part by part
+R2_MULTIPART_THRESHOLD_MB = int(os.getenv("R2_MULTIPART_THRESHOLD_MB", "16"))
+R2_MULTIPART_CHUNK_MB = int(os.getenv("R2_MULTIPART_CHUNK_MB", "8"))
+R2_UPLOAD_CONCURRENCY = int(os.getenv("R2_UPLOAD_CONCURRENCY", "4"))
+
+# boto3 is imported and the client built on first use (an upload), not when the API starts
+_r2_client = None
+_r2_transfer_config = None
+_lock = threading.Lock()
+
+def get_r2_client():
+    global _r2_client, _r2_transfer_config
+    if _r2_client is None:
+        # Building clients from boto3's default session isn't thread-safe
+        with _lock:
+            if _r2_client is None:
+                import boto3
+                from boto3.s3.transfer import TransferConfig
+                _r2_transfer_config = TransferConfig(
+                    multipart_threshold=R2_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+                    multipart_chunksize=R2_MULTIPART_CHUNK_MB * 1024 * 1024,
+                    max_concurrency=R2_UPLOAD_CONCURRENCY,
+                    use_threads=True,
+                )
+                _r2_client = boto3.client(
+                    's3',
+                    endpoint_url=R2_ENDPOINT_URL,
+                    aws_access_key_id=R2_ACCESS_KEY_ID,
+                    aws_secret_access_key=R2_SECRET_ACCESS_KEY,
+                    region_name="auto" # R2 has no regions, 'auto' is standard
+                )
+    return _r2_client
+
+def get_transfer_config():
+    """Multipart settings for upload_file, see the R2_MULTIPART_* settings"""
+    get_r2_client()
+    return _r2_transfer_config
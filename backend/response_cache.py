@@ -0,0 +1,163 @@
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Iterator, List, Optional
+from query_cache import normalize_query
+
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(os.path.dirname(__file__), "response_cache.db"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+# Default lifetime of a cached answer, nodes can override it with cacheTtl
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+# Most recent entries compared against a query when a node allows similar-query matches
+RESPONSE_CACHE_SCAN_LIMIT = int(os.getenv("RESPONSE_CACHE_SCAN_LIMIT", "500"))
+# Size of the SSE content chunks a cached answer is replayed in
+RESPONSE_REPLAY_CHUNK_CHARS = int(os.getenv("RESPONSE_REPLAY_CHUNK_CHARS", "40"))
+
+
+def _sha256(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def replay_chunks(text: str, size: int = RESPONSE_REPLAY_CHUNK_CHARS) -> Iterator[str]:
+    """Split a cached answer into stream-sized pieces, breaking after whitespace where possible"""
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            space = text.rfind(" ", start, end)
+            if space > start:
+                end = space + 1
+        yield text[start:end]
+        start = end
+
+
+class ResponseCache:
+    """
+    Local store of LLM node answers.
+
+    Entries live in a bucket keyed by (model, system prompt, hash of the
+    retrieved context) and are looked up by exact normalized query first.
+    When the caller passes a similarity threshold and the query embedding,
+    the bucket's entries are also compared by cosine similarity, so a
+    rephrased question over the same context can reuse an answer.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " bucket TEXT NOT NULL, query TEXT NOT NULL, embedding BLOB, response TEXT NOT NULL,"
+            " created_at INTEGER NOT NULL, expires_at INTEGER NOT NULL,"
+            " PRIMARY KEY (bucket, query))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_expires_at ON responses (expires_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_bucket_created ON responses (bucket, created_at)")
+        self._puts = 0
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def bucket(model: str, system_prompt: str, context: str) -> str:
+        return _sha256(model, system_prompt, _sha256(context))
+
+    def get(self, bucket: str, query: str, embedding: Optional[List[float]] = None,
+            similarity: Optional[float] = None) -> Optional[str]:
+        query = normalize_query(query)
+        now = int(time.time())
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE bucket = ? AND query = ? AND expires_at > ?",
+                (bucket, query, now),
+            ).fetchone()
+            if row:
+                self.hits += 1
+                return row[0]
+
+            if embedding is not None and similarity is not None:
+                rows = self._conn.execute(
+                    "SELECT embedding, response FROM responses"
+                    " WHERE bucket = ? AND expires_at > ? AND embedding IS NOT NULL"
+                    " ORDER BY created_at DESC LIMIT ?",
+                    (bucket, now, RESPONSE_CACHE_SCAN_LIMIT),
+                ).fetchall()
+                best, best_score = None, similarity
+                for blob, response in rows:
+                    score = _cosine(embedding, array("f", blob))
+                    if score >= best_score:
+                        best, best_score = response, score
+                if best is not None:
+                    self.semantic_hits += 1
+                    return best
+
+            self.misses += 1
+            return None
+
+    def put(self, bucket: str, query: str, response: str, ttl: int = RESPONSE_CACHE_TTL,
+            embedding: Optional[List[float]] = None):
+        now = int(time.time())
+        blob = array("f", embedding).tobytes() if embedding is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (bucket, query, embedding, response, created_at, expires_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (bucket, normalize_query(query), blob, response, now, now + ttl),
+            )
+            self._puts += 1
+            if self._puts >= 100:
+                self._puts = 0
+                self._evict(now)
+
+    def _evict(self, now: int):
+        self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            # Oldest answers go first, trimmed a little below the bound
+            self._conn.execute(
+                "DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY created_at LIMIT ?)",
+                (count - int(self.max_entries * 0.9),),
+            )
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            hits = self.hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_response_cache(create: bool = True) -> Optional[ResponseCache]:
+    """Opened on first use, so deployments that never enable caching don't create the file"""
+    global _cache
+    with _cache_lock:
+        if _cache is None and create:
+            _cache = ResponseCache()
+        return _cache
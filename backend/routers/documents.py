@@ -1,107 +1,204 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
-from sqlalchemy.orm import Session
-import models, schemas, database
-from r2_client import r2_client, R2_BUCKET_NAME, R2_ACCOUNT_ID
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query, Response
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import models, schemas
+from database import get_async_db
+from pagination import page, seek
+from ingestion import (ingestion_pipeline, IngestionJob, QueueFullError, UploadTooLargeError, delete_stored_file,
+                       existing_document_ids, expected_file_path, spool_upload)
+from vector_store import (DEFAULT_COLLECTION, collection_name, compact, delete_document_chunks, document_collections,
+                          list_collections)
+import asyncio
 import os
-import fitz  # PyMuPDF
 import uuid
-import boto3
+from typing import Optional
 
 router = APIRouter(
     prefix="/documents",
     tags=["documents"],
 )
 
-def get_db():
-    db = database.SessionLocal()
+# Documents with a replace or delete request in progress (until its ingestion job is submitted)
+_changing = set()
+
+def claim_document(document_id: int):
+    """Replace and delete need the document to themselves: no other request and no unfinished ingestion job"""
+    if document_id in _changing or ingestion_pipeline.active_job(document_id) is not None:
+        raise HTTPException(status_code=409, detail="Document is being ingested or changed, try again later")
+    _changing.add(document_id)
+
+async def get_document_or_404(document_id: int, db: AsyncSession) -> models.Document:
+    document = await db.get(models.Document, document_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return document
+
+async def document_collection_names(document: models.Document):
+    """Collections the document is indexed in, looked up for documents uploaded before it was recorded"""
+    if document.collection:
+        return [document.collection]
+    return await asyncio.to_thread(document_collections, str(document.id))
+
+@router.post("/upload", response_model=schemas.DocumentUpload, status_code=202)
+async def upload_document(file: UploadFile = File(...), knowledge_base: Optional[str] = Form(None),
+                          db: AsyncSession = Depends(get_async_db)):
+    """
+    Accept an upload and queue storage, text extraction and embedding in the background.
+    Documents uploaded with a knowledge_base name are indexed into that knowledge base's own collection.
+    """
+    if ingestion_pipeline.is_full():
+        raise HTTPException(status_code=503, detail="Ingestion queue is full, try again later")
+
+    # 1. Copy the upload (already spooled to disk by the multipart parser) into the job's own
+    # temp file in a worker thread, hashing it on the way instead of reading it into memory
+    file_ext = os.path.splitext(file.filename)[1]
     try:
-        yield db
-    finally:
-        db.close()
+        path, size, sha256 = await asyncio.to_thread(spool_upload, file.file, file_ext)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
-@router.post("/upload", response_model=schemas.Document)
-async def upload_document(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    # 1. Read file content
-    file_content = await file.read()
-    
     # Generate unique filename to avoid collisions
-    file_ext = os.path.splitext(file.filename)[1]
     unique_filename = f"{uuid.uuid4()}{file_ext}"
-    
-    # 2. Try R2 upload, fallback to local storage
-    public_url = unique_filename  # Default
-    use_local = False
-    
-    # Check if R2 is configured
-    if R2_BUCKET_NAME and r2_client:
-        try:
-            r2_client.put_object(
-                Bucket=R2_BUCKET_NAME,
-                Key=unique_filename,
-                Body=file_content,
-                ContentType=file.content_type
-            )
-            
-            public_url_base = os.getenv("R2_PUBLIC_URL_BASE")
-            if public_url_base:
-                public_url = f"{public_url_base}/{unique_filename}"
-            print(f"Uploaded to R2: {unique_filename}")
-        except Exception as e:
-            print(f"R2 Upload Error (falling back to local): {e}")
-            use_local = True
-    else:
-        print("R2 not configured, using local storage")
-        use_local = True
-    
-    # Fallback: Save to local uploads directory
-    if use_local:
-        uploads_dir = os.path.join(os.path.dirname(__file__), "..", "uploads")
-        os.makedirs(uploads_dir, exist_ok=True)
-        local_path = os.path.join(uploads_dir, unique_filename)
-        
-        with open(local_path, "wb") as f:
-            f.write(file_content)
-        
-        public_url = f"local://{unique_filename}"
-        print(f"Saved locally: {local_path}")
-
-    # 3. Extract Text (In-memory for now)
-    text_content = ""
-    if file.content_type == "application/pdf":
-        try:
-           with fitz.open(stream=file_content, filetype="pdf") as doc:
-                for page in doc:
-                    text_content += page.get_text()
-        except Exception as e:
-            print(f"Text Extraction Error: {e}")
-            # Non-blocking
 
-    # 4. Create DB Entry
+    # 2. Create DB Entry (file_path is corrected by the store stage if R2 falls back to local)
     db_document = models.Document(
         filename=file.filename,
-        file_path=public_url, # Store URL or Key
+        file_path=expected_file_path(unique_filename), # Store URL or Key
         content_type=file.content_type,
-        file_size=len(file_content)
+        file_size=size,
+        collection=collection_name(knowledge_base),
+        sha256=sha256,
     )
     db.add(db_document)
-    db.commit()
-    db.refresh(db_document)
+    try:
+        await db.commit()
+    except BaseException:
+        os.remove(path)
+        raise
+
+    # 3. Queue storage, extraction and vector store embedding, the job owns the temp file from here
+    job = IngestionJob(
+        document_id=db_document.id,
+        filename=file.filename,
+        storage_key=unique_filename,
+        content_type=file.content_type,
+        path=path,
+        size=size,
+        sha256=sha256,
+        collection=db_document.collection,
+    )
+    try:
+        ingestion_pipeline.submit(job)
+    except QueueFullError as e:
+        job.remove_file()
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return schemas.DocumentUpload.model_validate(db_document).model_copy(update={"job_id": job.id, "status": job.status})
+
+@router.put("/{document_id}", response_model=schemas.DocumentUpload, status_code=202)
+async def replace_document(document_id: int, response: Response, file: UploadFile = File(...),
+                           db: AsyncSession = Depends(get_async_db)):
+    """
+    Upload a new version of a document. It keeps its id, so workflows using it keep working, and its
+    collection. Only chunks whose content changed are embedded, chunks that are gone are deleted.
+    A file with the same sha256 as the stored one changes nothing (200, status "unchanged").
+    """
+    document = await get_document_or_404(document_id, db)
+    if ingestion_pipeline.is_full():
+        raise HTTPException(status_code=503, detail="Ingestion queue is full, try again later")
+    claim_document(document_id)
+    try:
+        file_ext = os.path.splitext(file.filename)[1]
+        try:
+            path, size, sha256 = await asyncio.to_thread(spool_upload, file.file, file_ext)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        if sha256 == document.sha256:
+            os.remove(path)
+            response.status_code = 200
+            return schemas.DocumentUpload.model_validate(document).model_copy(update={"status": "unchanged"})
+
+        collections = await document_collection_names(document)
+        previous_file_path = document.file_path
+        unique_filename = f"{uuid.uuid4()}{file_ext}"
+        document.filename = file.filename
+        document.file_path = expected_file_path(unique_filename)
+        document.content_type = file.content_type
+        document.file_size = size
+        document.sha256 = sha256
+        document.collection = collections[0] if collections else DEFAULT_COLLECTION
+        try:
+            await db.commit()
+        except BaseException:
+            os.remove(path)
+            raise
 
-    # 5. Trigger Vector Store Embedding
-    # We execute this synchronously for now, but in prod this should be a background task (Celery/redis-queue)
-    if text_content:
+        job = IngestionJob(
+            document_id=document.id,
+            filename=file.filename,
+            storage_key=unique_filename,
+            content_type=file.content_type,
+            path=path,
+            size=size,
+            sha256=sha256,
+            collection=document.collection,
+            replace=True,
+            previous_file_path=previous_file_path,
+        )
         try:
-            from vector_store import add_document_to_vector_store
-            add_document_to_vector_store(
-                doc_id=str(db_document.id), 
-                text=text_content, 
-                metadata={"filename": file.filename}
-            )
+            ingestion_pipeline.submit(job)
+        except QueueFullError as e:
+            job.remove_file()
+            raise HTTPException(status_code=503, detail=str(e))
+    finally:
+        _changing.discard(document_id)
+
+    return schemas.DocumentUpload.model_validate(document).model_copy(update={"job_id": job.id, "status": job.status})
+
+@router.delete("/{document_id}")
+async def delete_document(document_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Delete a document: its row, its chunks (vector store and BM25 index) and its stored file"""
+    document = await get_document_or_404(document_id, db)
+    claim_document(document_id)
+    try:
+        collections = await document_collection_names(document)
+        file_path = document.file_path
+        # The row goes first: chunks left behind by a failure below are orphans, which /documents/compact removes
+        await db.execute(delete(models.Document).where(models.Document.id == document_id))
+        await db.commit()
+        chunks_removed = 0
+        try:
+            for collection in collections:
+                chunks_removed += await asyncio.to_thread(delete_document_chunks, str(document_id), collection)
         except Exception as e:
-            print(f"Vector Store Indexing Error: {e}")
+            print(f"Failed to remove the chunks of document {document_id}, left for compaction: {e}")
+        await asyncio.to_thread(delete_stored_file, file_path)
+    finally:
+        _changing.discard(document_id)
+    return {"ok": True, "chunks_removed": chunks_removed}
+
+@router.post("/compact", response_model=schemas.CompactionReport)
+async def compact_vector_store(dry_run: bool = Query(False)):
+    """Remove chunks whose document no longer exists, from every collection and the BM25 index"""
+    return await asyncio.to_thread(compact, existing_document_ids, dry_run)
+
+@router.get("/collections", response_model=list[schemas.Collection])
+def read_collections():
+    """Vector store collections (the shared one and one per knowledge base) with their chunk counts"""
+    return list_collections()
 
-    return db_document
+@router.get("/jobs/{job_id}", response_model=schemas.IngestionJob)
+def read_ingestion_job(job_id: str):
+    job = ingestion_pipeline.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job.to_dict()
 
-@router.get("/", response_model=list[schemas.Document])
-def read_documents(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(models.Document).offset(skip).limit(limit).all()
+@router.get("/", response_model=schemas.DocumentPage)
+async def read_documents(limit: int = Query(100, ge=1, le=500), cursor: Optional[str] = None,
+                         db: AsyncSession = Depends(get_async_db)):
+    """Documents, newest first, paged by keyset (created_at, id)"""
+    statement = seek(select(models.Document), models.Document.created_at, models.Document.id, cursor, limit)
+    documents = (await db.execute(statement)).scalars().all()
+    items, next_cursor = page(documents, limit, "created_at")
+    return schemas.DocumentPage(items=items, next_cursor=next_cursor)
@@ -1,341 +1,250 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Depends, Request, UploadFile, File, Form
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional, AsyncGenerator
-import os
-from sqlalchemy.orm import Session
-from database import get_db
-import traceback
-from vector_store import query_vector_store
-from openai import OpenAI
-import json
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 import asyncio
+import traceback
+from contextlib import aclosing
+from workflow_engine import WorkflowGraph, WorkflowExecutor, WorkflowError, LLMCallError
+from plan_cache import plan_cache, content_version
+from streaming import STREAM_QUEUE_SIZE, coalesce, sse_event
+from chat_history import chat_recorder
+from batch_runs import (BatchConflictError, BatchInputError, BatchNotFoundError, batch_stream, get_batch, read_queries,
+                        start_batch)
+from tracing import finish_run, node_finished
+import models
 
 router = APIRouter()
 
-# Initialize Clients
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
-
-# OpenRouter client using OpenAI SDK
-client = None
-if OPENROUTER_API_KEY:
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=OPENROUTER_API_KEY,
-    )
-
 class WorkflowRunRequest(BaseModel):
     workflow_id: str
     query: str
-    nodes: List[Dict[str, Any]]
-    edges: List[Dict[str, Any]]
+    # Optional: when omitted the saved workflow graph is loaded by workflow_id
+    nodes: Optional[List[Dict[str, Any]]] = None
+    edges: Optional[List[Dict[str, Any]]] = None
+    # Seconds the run may take (default RUN_TIMEOUT), it then finishes with what it has
+    timeout: Optional[float] = None
+    # Return the run's timing breakdown (per node and upstream call), in a final "timings" event when streamed
+    timings: bool = False
+    # The chat this turn belongs to: LLM node memory only includes earlier turns of the same conversation
+    conversation_id: Optional[str] = None
 
 class WorkflowRunResponse(BaseModel):
     response: str
     sources: List[str] = []
+    # Tokens each source contributed to the answering LLM's prompt
+    context_usage: List[Dict[str, Any]] = []
+    timings: Optional[Dict[str, Any]] = None
+
+def saved_workflow_id(request: WorkflowRunRequest) -> Optional[int]:
+    """
+    Id of the saved workflow a run belongs to, None for unsaved ones (their
+    turns aren't recorded). Only runs of the graph resolve_graph loaded by id
+    count: a graph sent in the body may not match any saved workflow.
+    """
+    if request.nodes is not None:
+        return None
+    try:
+        return int(request.workflow_id)
+    except ValueError:
+        return None
 
-def find_node_by_id(nodes: List[Dict], node_id: str):
-    for node in nodes:
-        if node["id"] == node_id:
-            return node
-    return None
+async def resolve_graph(request: WorkflowRunRequest, db: AsyncSession) -> WorkflowGraph:
+    """Return the compiled plan for a run, from the plan cache when the workflow is unchanged"""
+    if request.nodes is not None:
+        nodes = request.nodes
+        edges = request.edges or []
+        version = content_version(nodes, edges)
+        return plan_cache.get_or_build(request.workflow_id, version, lambda: WorkflowGraph(nodes, edges))
+
+    try:
+        workflow_id = int(request.workflow_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="nodes/edges are required for unsaved workflows")
+
+    # Only read the version columns, the data blob is loaded when the plan isn't cached yet
+    row = (await db.execute(
+        select(models.Workflow.created_at, models.Workflow.updated_at).where(models.Workflow.id == workflow_id)
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    version = str(row.updated_at or row.created_at)
+
+    graph = plan_cache.get(str(workflow_id), version)
+    if graph is None:
+        data = await db.scalar(select(models.Workflow.data).where(models.Workflow.id == workflow_id)) or {}
+        graph = WorkflowGraph(data.get("nodes", []), data.get("edges", []))
+        plan_cache.put(str(workflow_id), version, graph)
+    return graph
+
+def timings(request: WorkflowRunRequest, executor: WorkflowExecutor) -> Optional[Dict[str, Any]]:
+    """The run's timing breakdown when the request asked for it"""
+    if not request.timings or executor.trace is None:
+        return None
+    return executor.trace.summary()
+
+async def wait_for_disconnect(http_request: Request):
+    """Return once the client has gone away, the request body must already have been read"""
+    while True:
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def run_unless_disconnected(http_request: Request, executor: WorkflowExecutor):
+    """executor.run(), cancelled when the client disconnects first (returns None then)"""
+    run = asyncio.create_task(executor.run())
+    disconnect = asyncio.create_task(wait_for_disconnect(http_request))
+    try:
+        done, _ = await asyncio.wait({run, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        if not run.done():
+            run.cancel()
+    if run not in done:
+        print("Client disconnected, cancelled the run")
+        return None
+    return run.result()
 
-def get_next_nodes(edges: List[Dict], current_node_id: str):
-    next_node_ids = []
-    for edge in edges:
-        if edge["source"] == current_node_id:
-            next_node_ids.append(edge["target"])
-    return next_node_ids
 
 @router.post("/run_workflow", response_model=WorkflowRunResponse)
-async def run_workflow(request: WorkflowRunRequest, db: Session = Depends(get_db)):
+async def run_workflow(request: WorkflowRunRequest, http_request: Request, db: AsyncSession = Depends(get_async_db)):
     try:
-        nodes = request.nodes
-        edges = request.edges
-        user_query = request.query
-        
-        context = ""
-        sources = []
-        
-        # Find Knowledge Base Nodes
-        kb_nodes = [n for n in nodes if n["type"] == "knowledgeBase"]
-        llm_nodes = [n for n in nodes if n["type"] == "llmEngine"]
-        
-        if not llm_nodes:
-            return WorkflowRunResponse(response="Error: No LLM Engine node found in workflow.", sources=[])
-        
-        target_llm_node = llm_nodes[0] # Assuming single LLM for now
-        
-        # Check if any KB node is connected to this LLM node
-        connected_kb_node = None
-        for edge in edges:
-            if edge["target"] == target_llm_node["id"]:
-                source_node = find_node_by_id(nodes, edge["source"])
-                if source_node and source_node["type"] == "knowledgeBase":
-                    connected_kb_node = source_node
-                    break
-        
-        # Execute Knowledge Base Retrieval
-        if connected_kb_node:
-            print(f"Executing KB Node: {connected_kb_node['id']}")
-            kb_data = connected_kb_node.get("data", {})
-            file_info = kb_data.get("file")
-            
-            if file_info:
-                doc_id = file_info.get('id')
-                results = query_vector_store(user_query, n_results=3, doc_id=doc_id)
-                if results and "documents" in results:
-                     # Flatten results
-                    docs = results["documents"][0] # Chroma returns list of lists
-                    metadatas = results["metadatas"][0]
-                    
-                    context_parts = []
-                    seen_sources = set()
-                    for i, doc in enumerate(docs):
-                        context_parts.append(doc)
-                        filename = metadatas[i].get("filename", "Unknown File")
-                        if filename not in seen_sources:
-                            sources.append(filename)
-                            seen_sources.add(filename)
-                    
-                    context = "\n\n".join(context_parts)
-                    print(f"Retrieved Context: {len(context)} chars")
-
-        # Execute LLM Node
-        print(f"Executing LLM Node: {target_llm_node['id']}")
-        llm_data = target_llm_node.get("data", {})
-        
-        model = llm_data.get("model", "google/gemini-2.0-flash-exp:free") # Default to free one
-        api_key = llm_data.get("apiKey") or OPENROUTER_API_KEY
-        system_prompt = llm_data.get("prompt", "You are a helpful AI assistant.")
-        temperature = float(llm_data.get("temperature", 0.7))
-        use_web_search = llm_data.get("useWebSearch", False)
-        serp_api_key = llm_data.get("serpApiKey") or SERPAPI_API_KEY
-        
-        # Web Search Integration
-        web_context = ""
-        if use_web_search:
-            if not serp_api_key:
-                web_context = "[Web Search Failed: No SERP API Key provided]"
-            else:
-                try:
-                    from serpapi import GoogleSearch
-                    print("Executing Web Search...")
-                    search = GoogleSearch({
-                        "q": user_query,
-                        "api_key": serp_api_key
-                    })
-                    search_results = search.get_dict()
-                    organic_results = search_results.get("organic_results", [])
-                    
-                    web_snippets = []
-                    for res in organic_results[:3]:
-                        title = res.get("title", "")
-                        snippet = res.get("snippet", "")
-                        link = res.get("link", "")
-                        web_snippets.append(f"Title: {title}\nSnippet: {snippet}\nLink: {link}")
-                        sources.append(f"Web: {title}")
-                    
-                    web_context = "\n\nWeb Search Results:\n" + "\n---\n".join(web_snippets)
-                except Exception as e:
-                    print(f"SerpAPI Error: {e}")
-                    web_context = f"\n[Web Search Error: {str(e)}]"
-
-        # Construct Final Prompt
-        final_system_message = system_prompt
-        final_user_message = f"User Query: {user_query}"
-        
-        if context:
-            final_user_message += f"\n\nContext from Knowledge Base:\n{context}"
-            
-        if web_context:
-            final_user_message += f"\n\n{web_context}"
-
-        # Call OpenRouter
-        # We need to make sure we use the right client if the user provided a custom key
-        runtime_client = client
-        if api_key and api_key != OPENROUTER_API_KEY:
-            runtime_client = OpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                api_key=api_key,
-            )
-            
-        if not runtime_client:
-             return WorkflowRunResponse(response="Error: OpenRouter API Key is missing. Please configure it in the node or .env.", sources=[])
-
-        print(f"Calling OpenRouter with model: {model}")
         try:
-            completion = runtime_client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": final_system_message},
-                    {"role": "user", "content": final_user_message}
-                ],
-                temperature=temperature,
-            )
-            
-            ai_response = completion.choices[0].message.content
-            return WorkflowRunResponse(response=ai_response, sources=sources)
-            
-        except Exception as e:
-            print(f"OpenRouter Error: {e}")
-            return WorkflowRunResponse(response=f"Error calling AI Provider: {str(e)}", sources=sources)
+            graph = await resolve_graph(request, db)
+        except WorkflowError as e:
+            return WorkflowRunResponse(response=f"Error: {str(e)}", sources=[])
+        finally:
+            # A run can take minutes, give the connection back to the pool instead of holding it
+            await db.close()
+
+        executor = WorkflowExecutor(graph, request.query, timeout=request.timeout, workflow_id=saved_workflow_id(request),
+                                    conversation_id=request.conversation_id)
+        try:
+            result = await run_unless_disconnected(http_request, executor)
+        except LLMCallError as e:
+            finish_run(executor.trace, "run", "error")
+            return WorkflowRunResponse(response=str(e), sources=[], timings=timings(request, executor))
+        except Exception:
+            finish_run(executor.trace, "run", "error")
+            raise
+        if result is None:
+            finish_run(executor.trace, "run", "cancelled")
+            # Nobody is listening any more, 499 as in "client closed request"
+            return Response(status_code=499)
+        finish_run(executor.trace, "run", "ok")
+        ai_response, sources = result
+        # Written behind by a background task, no database round-trip here
+        chat_recorder.record(executor.workflow_id, executor.conversation_id, request.query, ai_response)
+        return WorkflowRunResponse(response=ai_response, sources=sources, context_usage=executor.context_usage,
+                                   timings=timings(request, executor))
 
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def generate_stream(request: WorkflowRunRequest) -> AsyncGenerator[str, None]:
-    """Generator function that yields SSE formatted chunks"""
+async def produce_events(request: WorkflowRunRequest, graph: WorkflowGraph, events: asyncio.Queue):
+    """Run the workflow, putting SSE frames on `events` as they become available (None when finished)"""
+    async def on_event(event):
+        await events.put(sse_event(event))
+
     try:
-        nodes = request.nodes
-        edges = request.edges
-        user_query = request.query
-        
-        context = ""
-        sources = []
-        
-        # Find Knowledge Base Nodes
-        kb_nodes = [n for n in nodes if n["type"] == "knowledgeBase"]
-        llm_nodes = [n for n in nodes if n["type"] == "llmEngine"]
-        
-        if not llm_nodes:
-            yield f"data: {json.dumps({'type': 'error', 'content': 'No LLM Engine node found in workflow.'})}\n\n"
-            return
-        
-        target_llm_node = llm_nodes[0]
-        
-        # Check if any KB node is connected to this LLM node
-        connected_kb_node = None
-        for edge in edges:
-            if edge["target"] == target_llm_node["id"]:
-                source_node = find_node_by_id(nodes, edge["source"])
-                if source_node and source_node["type"] == "knowledgeBase":
-                    connected_kb_node = source_node
-                    break
-        
-        # Execute Knowledge Base Retrieval
-        if connected_kb_node:
-            kb_data = connected_kb_node.get("data", {})
-            file_info = kb_data.get("file")
-            
-            if file_info:
-                # Pass doc_id to filter results to only this file
-                doc_id = file_info.get('id')
-                results = query_vector_store(user_query, n_results=3, doc_id=doc_id)
-                if results and "documents" in results:
-                    docs = results["documents"][0]
-                    metadatas = results["metadatas"][0]
-                    
-                    context_parts = []
-                    seen_sources = set()
-                    for i, doc in enumerate(docs):
-                        context_parts.append(doc)
-                        filename = metadatas[i].get("filename", "Unknown File")
-                        if filename not in seen_sources:
-                            sources.append(filename)
-                            seen_sources.add(filename)
-                    
-                    context = "\n\n".join(context_parts)
-
-        # Execute LLM Node
-        llm_data = target_llm_node.get("data", {})
-        
-        model = llm_data.get("model", "google/gemini-2.0-flash-exp:free")
-        api_key = llm_data.get("apiKey") or OPENROUTER_API_KEY
-        system_prompt = llm_data.get("prompt", "You are a helpful AI assistant.")
-        temperature = float(llm_data.get("temperature", 0.7))
-        use_web_search = llm_data.get("useWebSearch", False)
-        serp_api_key = llm_data.get("serpApiKey") or SERPAPI_API_KEY
-        
-        # Web Search Integration
-        web_context = ""
-        if use_web_search:
-            if not serp_api_key:
-                web_context = "[Web Search Failed: No SERP API Key provided]"
-            else:
-                try:
-                    from serpapi import GoogleSearch
-                    search = GoogleSearch({
-                        "q": user_query,
-                        "api_key": serp_api_key
-                    })
-                    search_results = search.get_dict()
-                    organic_results = search_results.get("organic_results", [])
-                    
-                    web_snippets = []
-                    for res in organic_results[:3]:
-                        title = res.get("title", "")
-                        snippet = res.get("snippet", "")
-                        link = res.get("link", "")
-                        web_snippets.append(f"Title: {title}\nSnippet: {snippet}\nLink: {link}")
-                        sources.append(f"Web: {title}")
-                    
-                    web_context = "\n\nWeb Search Results:\n" + "\n---\n".join(web_snippets)
-                except Exception as e:
-                    web_context = f"\n[Web Search Error: {str(e)}]"
-
-        # Construct Final Prompt
-        final_system_message = system_prompt
-        final_user_message = f"User Query: {user_query}"
-        
-        if context:
-            final_user_message += f"\n\nContext from Knowledge Base:\n{context}"
-            
-        if web_context:
-            final_user_message += f"\n\n{web_context}"
-
-        # Send sources first
-        if sources:
-            yield f"data: {json.dumps({'type': 'sources', 'content': sources})}\n\n"
-
-        # Set up runtime client
-        runtime_client = client
-        if api_key and api_key != OPENROUTER_API_KEY:
-            runtime_client = OpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                api_key=api_key,
-            )
-            
-        if not runtime_client:
-            yield f"data: {json.dumps({'type': 'error', 'content': 'OpenRouter API Key is missing.'})}\n\n"
-            return
+        # Progress and sources are sent while the nodes upstream of the answering LLM run
+        executor = WorkflowExecutor(graph, request.query, on_event=on_event, timeout=request.timeout,
+                                    workflow_id=saved_workflow_id(request), conversation_id=request.conversation_id)
+        await stream_answer(executor, events, request)
+    except Exception as e:
+        traceback.print_exc()
+        await events.put(sse_event({"type": "error", "content": str(e)}))
+    # Not reached when the run is cancelled, nobody is reading then
+    await events.put(None)
 
-        # Stream the response
-        try:
-            stream = runtime_client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": final_system_message},
-                    {"role": "user", "content": final_user_message}
-                ],
-                temperature=temperature,
-                stream=True,
-            )
-            
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    yield f"data: {json.dumps({'type': 'content', 'content': content})}\n\n"
-                    await asyncio.sleep(0)  # Yield control to event loop
-            
-            yield f"data: {json.dumps({'type': 'done'})}\n\n"
-                
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
 
+async def stream_answer(executor: WorkflowExecutor, events: asyncio.Queue, request: WorkflowRunRequest):
+    try:
+        llm_call = await executor.prepare_stream()
+    except LLMCallError as e:
+        finish_run(executor.trace, "stream", "error")
+        await events.put(sse_event({"type": "error", "content": str(e)}))
+        return
+
+    if llm_call.sources:
+        await events.put(sse_event({"type": "sources", "content": llm_call.sources}))
+    if llm_call.context_usage:
+        await events.put(sse_event({"type": "context", "content": llm_call.context_usage}))
+
+    # Stream the response, tiny deltas coalesced into larger frames, until the node's deadline
+    parts = []
+    status = "cancelled"
+    try:
+        # aclosing: a cancelled run closes the provider stream right away
+        async with asyncio.timeout_at(llm_call.deadline), aclosing(coalesce(llm_call.stream())) as contents:
+            async for content in contents:
+                await events.put(sse_event({"type": "content", "content": content}))
+                parts.append(content)
+        status = "done"
+    except TimeoutError:
+        status = "timeout"
+        # What was streamed so far stays, the client learns the answer was cut off
+        print(f"Streamed answer of node {llm_call.node_id} timed out")
+        await events.put(sse_event({"type": "error", "content": "The workflow ran out of time, the answer is incomplete."}))
     except Exception as e:
-        traceback.print_exc()
-        yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
+        status = "error"
+        await events.put(sse_event({"type": "error", "content": str(e)}))
+    finally:
+        # The answer as far as the client got it, also when it was cut off or the client left
+        chat_recorder.record(executor.workflow_id, executor.conversation_id, executor.user_query, "".join(parts))
+        node_finished(llm_call.node_id, "llmEngine", status, llm_call.started)
+        finish_run(executor.trace, "stream", "ok" if status == "done" else status)
+    # The breakdown comes last so it covers the whole answer, "done" still ends the stream
+    breakdown = timings(request, executor)
+    if breakdown:
+        await events.put(sse_event({"type": "timings", "content": breakdown}))
+    if status == "done":
+        await events.put(sse_event({"type": "done"}))
+
+
+async def generate_stream(request: WorkflowRunRequest, graph: WorkflowGraph) -> AsyncGenerator[str, None]:
+    """
+    Yield SSE frames of a workflow run. The run is a separate task writing to
+    a bounded queue, so a slow client makes it wait (backpressure), and when
+    the client disconnects the response is cancelled and so is the run,
+    including the upstream LLM request.
+    """
+    events: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    producer = asyncio.create_task(produce_events(request, graph, events))
+    try:
+        while True:
+            frame = await events.get()
+            if frame is None:
+                break
+            yield frame
+    finally:
+        if not producer.done():
+            print("Stream closed before the run finished, cancelling it")
+            producer.cancel()
 
 
 @router.post("/run_workflow_stream")
-async def run_workflow_stream(request: WorkflowRunRequest):
+async def run_workflow_stream(request: WorkflowRunRequest, db: AsyncSession = Depends(get_async_db)):
     """Streaming endpoint that returns Server-Sent Events"""
+    # Resolve the plan before streaming starts so the DB session isn't held by the stream
+    try:
+        graph = await resolve_graph(request, db)
+        events = generate_stream(request, graph)
+    except WorkflowError as e:
+        events = iter([sse_event({"type": "error", "content": str(e)})])
+    finally:
+        await db.close()
+
     return StreamingResponse(
-        generate_stream(request),
+        events,
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -343,3 +252,61 @@ async def run_workflow_stream(request: WorkflowRunRequest):
             "X-Accel-Buffering": "no",
         }
     )
+
+
+@router.post("/run_workflow_batch")
+async def run_workflow_batch(workflow_id: str = Form(...), file: UploadFile = File(...),
+                             concurrency: Optional[int] = Form(None), timeout: Optional[float] = Form(None),
+                             resume: Optional[str] = Form(None), db: AsyncSession = Depends(get_async_db)):
+    """
+    Run a saved workflow over a JSONL file of queries. Streams NDJSON: a
+    "batch" line with the batch id, a "result" line per query as it finishes,
+    then a "summary". The batch goes on if the client disconnects; pass its
+    id as `resume` with the same file to run the queries still missing.
+    """
+    try:
+        queries, digest = await asyncio.to_thread(read_queries, file.file)
+    except BatchInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        graph = await resolve_graph(WorkflowRunRequest(workflow_id=workflow_id, query=""), db)
+    except WorkflowError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await db.close()
+
+    try:
+        batch = start_batch(workflow_id, graph, queries, digest, concurrency, timeout, resume)
+    except BatchNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except BatchConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return StreamingResponse(batch_stream(batch), media_type="application/x-ndjson", headers={"X-Batch-Id": batch.id})
+
+
+def batch_or_404(batch_id: str):
+    try:
+        return get_batch(batch_id)
+    except BatchNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/run_workflow_batch/{batch_id}")
+async def batch_progress(batch_id: str):
+    """Status and counts of a batch (completed, failed, skipped on resume, queries per second)"""
+    return batch_or_404(batch_id).progress()
+
+
+@router.get("/run_workflow_batch/{batch_id}/results")
+async def batch_results(batch_id: str):
+    """Every result line of a batch as NDJSON, following a running batch until it ends"""
+    batch = batch_or_404(batch_id)
+    return StreamingResponse(batch.follow(), media_type="application/x-ndjson")
+
+
+@router.delete("/run_workflow_batch/{batch_id}")
+async def cancel_batch(batch_id: str):
+    """Stop a running batch, it can be resumed later"""
+    batch = batch_or_404(batch_id)
+    await batch.cancel()
+    return batch.progress()
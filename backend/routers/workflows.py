@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-import models, schemas, database
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+import models, schemas
+from database import get_async_db
+from pagination import page, seek
+from plan_cache import plan_cache
 
 router = APIRouter(
     prefix="/workflows",
@@ -9,56 +13,71 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-# Dependency
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def get_workflow_or_404(workflow_id: int, db: AsyncSession) -> models.Workflow:
+    db_workflow = await db.get(models.Workflow, workflow_id)
+    if db_workflow is None:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    return db_workflow
 
 @router.post("/", response_model=schemas.Workflow)
-def create_workflow(workflow: schemas.WorkflowCreate, db: Session = Depends(get_db)):
+async def create_workflow(workflow: schemas.WorkflowCreate, db: AsyncSession = Depends(get_async_db)):
     db_workflow = models.Workflow(
         name=workflow.name,
         description=workflow.description,
         data=workflow.data
     )
     db.add(db_workflow)
-    db.commit()
-    db.refresh(db_workflow)
+    await db.commit()
     return db_workflow
 
-@router.get("/", response_model=List[schemas.Workflow])
-def read_workflows(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    workflows = db.query(models.Workflow).offset(skip).limit(limit).all()
-    return workflows
+@router.get("/", response_model=schemas.WorkflowPage)
+async def read_workflows(limit: int = Query(100, ge=1, le=500), cursor: Optional[str] = None,
+                         db: AsyncSession = Depends(get_async_db)):
+    """Workflows, most recently updated first, without their data JSON (GET /workflows/{id} has it)"""
+    statement = select(
+        models.Workflow.id, models.Workflow.name, models.Workflow.description,
+        models.Workflow.created_at, models.Workflow.updated_at,
+    )
+    rows = (await db.execute(seek(statement, models.Workflow.updated_at, models.Workflow.id, cursor, limit))).all()
+    items, next_cursor = page(rows, limit, "updated_at")
+    return schemas.WorkflowPage(items=items, next_cursor=next_cursor)
 
 @router.get("/{workflow_id}", response_model=schemas.Workflow)
-def read_workflow(workflow_id: int, db: Session = Depends(get_db)):
-    db_workflow = db.query(models.Workflow).filter(models.Workflow.id == workflow_id).first()
-    if db_workflow is None:
-        raise HTTPException(status_code=404, detail="Workflow not found")
-    return db_workflow
+async def read_workflow(workflow_id: int, db: AsyncSession = Depends(get_async_db)):
+    return await get_workflow_or_404(workflow_id, db)
 
 @router.put("/{workflow_id}", response_model=schemas.Workflow)
-def update_workflow(workflow_id: int, workflow: schemas.WorkflowUpdate, db: Session = Depends(get_db)):
-    db_workflow = db.query(models.Workflow).filter(models.Workflow.id == workflow_id).first()
-    if db_workflow is None:
-        raise HTTPException(status_code=404, detail="Workflow not found")
-    
+async def update_workflow(workflow_id: int, workflow: schemas.WorkflowUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_workflow = await get_workflow_or_404(workflow_id, db)
+
     db_workflow.name = workflow.name
     db_workflow.description = workflow.description
     db_workflow.data = workflow.data
-    db.commit()
-    db.refresh(db_workflow)
+    await db.commit()
+    plan_cache.invalidate(workflow_id)
     return db_workflow
 
+@router.get("/{workflow_id}/history", response_model=schemas.ChatHistoryPage)
+async def read_workflow_history(workflow_id: int, limit: int = Query(20, ge=1, le=100), cursor: Optional[str] = None,
+                                db: AsyncSession = Depends(get_async_db)):
+    """Recorded turns of a workflow, newest first, paged by keyset (created_at, id) rather than offset"""
+    await get_workflow_or_404(workflow_id, db)
+    statement = select(models.ChatHistory).where(models.ChatHistory.workflow_id == workflow_id)
+    # Seeks in the (workflow_id, created_at) index
+    statement = seek(statement, models.ChatHistory.created_at, models.ChatHistory.id, cursor, limit)
+    chats = (await db.execute(statement)).scalars().all()
+    items, next_cursor = page(chats, limit, "created_at")
+    return schemas.ChatHistoryPage(items=items, next_cursor=next_cursor)
+
 @router.delete("/{workflow_id}")
-def delete_workflow(workflow_id: int, db: Session = Depends(get_db)):
-    db_workflow = db.query(models.Workflow).filter(models.Workflow.id == workflow_id).first()
-    if db_workflow is None:
-        raise HTTPException(status_code=404, detail="Workflow not found")
-    db.delete(db_workflow)
-    db.commit()
+async def delete_workflow(workflow_id: int, db: AsyncSession = Depends(get_async_db)):
+    await get_workflow_or_404(workflow_id, db)
+    # Recorded turns stay for the audit trail, detached from the workflow. Done with statements,
+    # deleting the object would load every turn through the relationship first.
+    await db.execute(
+        update(models.ChatHistory).where(models.ChatHistory.workflow_id == workflow_id).values(workflow_id=None)
+    )
+    await db.execute(delete(models.Workflow).where(models.Workflow.id == workflow_id))
+    await db.commit()
+    plan_cache.invalidate(workflow_id)
     return {"ok": True}
@@ -22,6 +22,22 @@ class Workflow(WorkflowBase):
     class Config:
         from_attributes = True
 
+class WorkflowSummary(BaseModel):
+    """List entry of a workflow, without the (potentially large) data JSON"""
+    id: int
+    name: str
+    description: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class WorkflowPage(BaseModel):
+    items: List[WorkflowSummary]
+    # Pass as `cursor` to get the next page, None on the last page
+    next_cursor: Optional[str] = None
+
 # Document Schemas
 class DocumentBase(BaseModel):
     filename: str
@@ -34,11 +50,53 @@ class DocumentCreate(DocumentBase):
 class Document(DocumentBase):
     id: int
     file_path: str
+    collection: Optional[str] = None
+    sha256: Optional[str] = None
     created_at: datetime
 
     class Config:
         from_attributes = True
 
+class DocumentPage(BaseModel):
+    items: List[Document]
+    next_cursor: Optional[str] = None
+
+class DocumentUpload(Document):
+    job_id: Optional[str] = None
+    status: Optional[str] = None
+
+class Collection(BaseModel):
+    name: str
+    count: int
+
+class CompactedCollection(BaseModel):
+    documents: List[str]
+    chunks: int
+
+class CompactionReport(BaseModel):
+    dry_run: bool
+    collections: Dict[str, CompactedCollection]
+    documents_removed: int
+    chunks_removed: int
+
+class IngestionJob(BaseModel):
+    id: str
+    document_id: int
+    filename: str
+    collection: Optional[str] = None
+    size: int = 0
+    sha256: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+    pages_total: int
+    pages_done: int
+    chunks_total: int
+    chunks_done: int
+    # Replacements only: chunks kept as they were, with updated metadata, embedded, deleted
+    reindex: Optional[Dict[str, int]] = None
+    created_at: float
+    updated_at: float
+
 # Chat Schemas
 class ChatRequest(BaseModel):
     query: str
@@ -52,6 +110,7 @@ class ChatHistoryBase(BaseModel):
     user_query: str
     ai_response: str
     workflow_id: int
+    conversation_id: Optional[str] = None
 
 class ChatHistory(ChatHistoryBase):
     id: int
@@ -59,3 +118,8 @@ class ChatHistory(ChatHistoryBase):
 
     class Config:
         from_attributes = True
+
+class ChatHistoryPage(BaseModel):
+    items: List[ChatHistory]
+    # Pass as `cursor` to get the next (older) page, None on the last page
+    next_cursor: Optional[str] = None
@@ -0,0 +1,101 @@
+"""
+Startup warm-up and readiness.
+
+The heavy clients (the vector store, the OpenAI SDK behind the embedder
+and LLM nodes, boto3 for R2, PyMuPDF, the web search provider), the
+tiktoken encoding and the BM25 index are built on first use, so importing the app
+takes a fraction of what it used to and the server accepts connections
+right away. Once it does, warm_up() builds
+them one by one in a worker thread so the first requests don't pay for
+it, and GET /health/ready answers 503 until the database is set up and
+the warm-up finished. A component that fails to warm up (e.g. no
+OPENAI_API_KEY) is reported but doesn't hold readiness back: requests
+that need it fail as they would have anyway.
+
+STARTUP_WARMUP=0 skips the warm-up, the server is then ready as soon as
+the database is, and each client is built by the first request needing it.
+"""
+import asyncio
+import importlib
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+from dotenv import load_dotenv
+from embeddings import get_embedder
+from lexical_index import get_lexical_index
+from llm_clients import warm_up as warm_up_llm_clients
+from r2_client import R2_BUCKET_NAME, get_r2_client
+from tokens import get_encoding
+from vector_store import get_client
+from web_search import get_search_provider
+
+load_dotenv()
+
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") not in ("0", "false", "False")
+
+
+def _warm_r2():
+    if not R2_BUCKET_NAME:
+        return "skipped"
+    get_r2_client()
+
+
+# In order: what a workflow run needs first comes first
+WARMUPS: Dict[str, Callable[[], Optional[str]]] = {
+    "vector_store": get_client,
+    "embeddings": get_embedder,
+    "lexical_index": get_lexical_index,
+    "tokens": get_encoding,
+    "llm": warm_up_llm_clients,
+    "web_search": get_search_provider,
+    "r2": _warm_r2,
+    "pdf": lambda: importlib.import_module("fitz"),
+}
+
+
+class Readiness:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.database = False
+        self.warming = False
+        # component -> {"status": "pending" | "ready" | "skipped" | "error", "ms", "error"}
+        self.components: Dict[str, Dict[str, Any]] = {}
+        self.ready_ms: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.database and not self.warming
+
+    def mark(self):
+        if self.ready and self.ready_ms is None:
+            self.ready_ms = round((time.perf_counter() - self.started) * 1000, 1)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.ready else "starting",
+            "database": self.database,
+            "components": self.components,
+            "ready_ms": self.ready_ms,
+        }
+
+
+readiness = Readiness()
+
+
+async def warm_up():
+    """Build every heavy client in a worker thread, one at a time"""
+    readiness.warming = True
+    readiness.components.update((name, {"status": "pending"}) for name in WARMUPS)
+    try:
+        for name, warm in WARMUPS.items():
+            started = time.perf_counter()
+            try:
+                status = await asyncio.to_thread(warm)
+                readiness.components[name] = {"status": status if isinstance(status, str) else "ready"}
+            except Exception as e:
+                print(f"Warm-up of {name} failed: {e}")
+                readiness.components[name] = {"status": "error", "error": str(e)}
+            readiness.components[name]["ms"] = round((time.perf_counter() - started) * 1000, 1)
+    finally:
+        readiness.warming = False
+        readiness.mark()
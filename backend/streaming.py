@@ -0,0 +1,81 @@
+"""
+Server-Sent Events helpers for streamed workflow runs.
+
+LLM providers send an answer as many tiny deltas (often a single word).
+coalesce() buffers them into frames flushed by size or time, so a client
+gets far fewer, larger events without noticeably later text. The first
+delta is always sent at once to keep time-to-first-token low. Deltas pass
+through a bounded queue: when the client reads slowly the queue fills up,
+the provider stream stops being read and TCP flow control pushes back on
+the provider instead of answers piling up in memory.
+"""
+import asyncio
+import json
+import os
+from typing import Any, AsyncGenerator, AsyncIterator, Dict
+
+# Coalesced content frames are flushed at this many characters or after this many seconds
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "256"))
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.05"))
+# Deltas/events buffered for a slow client before the producer has to wait
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "64"))
+
+_END = object()
+
+
+def sse_event(payload: Dict[str, Any]) -> str:
+    """One SSE data frame, compact JSON without ASCII escaping"""
+    return f"data: {json.dumps(payload, separators=(',', ':'), ensure_ascii=False)}\n\n"
+
+
+async def coalesce(deltas: AsyncIterator[str], max_chars: int = STREAM_FLUSH_CHARS,
+                   max_delay: float = STREAM_FLUSH_INTERVAL) -> AsyncGenerator[str, None]:
+    """
+    Join deltas into larger pieces. Closing the generator (e.g. because the
+    client went away) cancels the read of `deltas`, closing the upstream stream.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+    async def read():
+        try:
+            async for delta in deltas:
+                await queue.put(delta)
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(_END)
+
+    reader = asyncio.create_task(read())
+    loop = asyncio.get_running_loop()
+    buffer = []
+    size = 0
+    deadline = None
+    first = True
+    try:
+        while True:
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                # Upstream is slow, send what has arrived so far
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+                continue
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                if buffer:
+                    yield "".join(buffer)
+                raise item
+            buffer.append(item)
+            size += len(item)
+            if first or size >= max_chars:
+                first = False
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+            elif deadline is None:
+                deadline = loop.time() + max_delay
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        reader.cancel()
@@ -0,0 +1,32 @@
+import os
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# cl100k_base matches text-embedding-3-* and is a close enough estimate for chat models
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+
+_encoding = None
+_encoding_failed = False
+
+def get_encoding():
+    """tiktoken encoding, or None when tiktoken or its encoding files are unavailable"""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception as e:
+            print(f"WARNING: Failed to load tiktoken encoding {TOKEN_ENCODING}, estimating token counts: {e}")
+            _encoding_failed = True
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # ~4 characters per token for English text
+    return (len(text) + 3) // 4
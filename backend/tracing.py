@@ -0,0 +1,251 @@
+"""
+Tracing and latency metrics for workflow runs.
+
+span(call) times an upstream call (embedding, vector query, BM25 search,
+web search, page fetch, LLM) and node_finished() records a workflow node.
+Each measurement goes into a histogram labelled by call/node type and
+status, and, while a run is being traced (see start_run()), into that
+run's RunTrace, which a run can return as a per-run timing breakdown.
+Spans are recorded in worker threads too: asyncio.to_thread carries the
+current run over.
+
+render_metrics() writes every metric in the Prometheus text format for
+GET /metrics. Recording a span takes two clock reads, a bisect and a lock,
+a few microseconds, so tracing stays on in production (TRACING_ENABLED=0
+turns it off).
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") not in ("0", "false", "False")
+# Spans kept per run for the timing breakdown, later ones are only counted in the histograms
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _label_text(names: Sequence[str], values: Sequence[str]) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                labels = _label_text(self.labels, values)
+                lines.append(f"{self.name}{{{labels}}} {total:g}" if labels else f"{self.name} {total:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, as Prometheus histograms are exposed"""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values: str) -> int:
+        with self._lock:
+            series = self._series.get(label_values)
+            return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((values, [list(s[0]), s[1], s[2]]) for values, s in self._series.items())
+        for values, (counts, total, count) in series:
+            labels = _label_text(self.labels, values)
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total:.6f}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+run_seconds = Histogram("workflow_run_seconds", "Workflow run latency", ("endpoint", "status"))
+node_seconds = Histogram("workflow_node_seconds", "Workflow node latency", ("node_type", "status"))
+call_seconds = Histogram("upstream_call_seconds", "Latency of upstream calls made by workflow runs", ("call", "status"))
+llm_ttft_seconds = Histogram("llm_time_to_first_token_seconds", "Time to the first streamed answer token", ("model",))
+llm_tokens = Counter("llm_tokens_total", "Tokens sent to and received from LLM providers", ("model", "direction"))
+METRICS = [run_seconds, node_seconds, call_seconds, llm_ttft_seconds, llm_tokens]
+
+
+class RunTrace:
+    """Spans of one workflow run, offsets relative to its start"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.dropped = 0
+
+    def add(self, name: str, started: float, duration: float, status: str, attrs: Dict[str, Any]):
+        # list.append is atomic, spans arrive from worker threads as well
+        if len(self.spans) >= TRACE_MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append({
+            "name": name,
+            "start_ms": round((started - self.started) * 1000, 2),
+            "ms": round(duration * 1000, 2),
+            "status": status,
+            **attrs,
+        })
+
+    def summary(self) -> Dict[str, Any]:
+        """Timing breakdown: total, time per call type and every span in start order"""
+        spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        totals: Dict[str, float] = {}
+        for span in spans:
+            if span["name"] != "node":
+                totals[span["name"]] = round(totals.get(span["name"], 0) + span["ms"], 2)
+        summary = {"total_ms": round((time.perf_counter() - self.started) * 1000, 2), "calls_ms": totals, "spans": spans}
+        if self.dropped:
+            summary["dropped_spans"] = self.dropped
+        return summary
+
+
+current_trace: ContextVar[Optional[RunTrace]] = ContextVar("current_trace", default=None)
+
+
+def start_run() -> Optional[RunTrace]:
+    """Trace the current task (and the tasks and threads it starts) as one run"""
+    if not TRACING_ENABLED:
+        return None
+    trace = RunTrace()
+    current_trace.set(trace)
+    return trace
+
+
+def finish_run(trace: Optional[RunTrace], endpoint: str, status: str):
+    if trace is not None:
+        run_seconds.observe(time.perf_counter() - trace.started, endpoint, status)
+
+
+def _status(error: BaseException) -> str:
+    if isinstance(error, TimeoutError):
+        return "timeout"
+    if isinstance(error, Exception):
+        return "error"
+    return "cancelled"
+
+
+@contextmanager
+def span(call: str, **attrs):
+    """
+    Time a block as an upstream call. Yields the span's attributes, which the
+    block may add to (token counts, hit/miss); they show in the run breakdown.
+    """
+    if not TRACING_ENABLED:
+        yield attrs
+        return
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield attrs
+    except BaseException as e:
+        status = _status(e)
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        call_seconds.observe(duration, call, status)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add(call, started, duration, status, attrs)
+
+
+def node_finished(node_id: str, node_type: str, status: str, started: float):
+    """Record a workflow node that ran from `started` (perf_counter) until now"""
+    if not TRACING_ENABLED:
+        return
+    duration = time.perf_counter() - started
+    node_seconds.observe(duration, node_type or "unknown", status)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add("node", started, duration, status, {"node": node_id, "node_type": node_type})
+
+
+def record_llm_usage(model: str, prompt_tokens: int, completion_tokens: int):
+    if TRACING_ENABLED:
+        llm_tokens.inc(model, "prompt", amount=prompt_tokens)
+        llm_tokens.inc(model, "completion", amount=completion_tokens)
+
+
+def record_ttft(model: str, seconds: float):
+    if TRACING_ENABLED:
+        llm_ttft_seconds.observe(seconds, model)
+
+
+def _gauge_lines(name: str, help: str, labels: Sequence[str], samples: List[Tuple[Sequence[str], float]],
+                 kind: str = "gauge") -> List[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for values, value in samples:
+        label_text = _label_text(labels, values)
+        lines.append(f"{name}{{{label_text}}} {value:g}" if label_text else f"{name} {value:g}")
+    return lines
+
+
+def render_metrics(caches: Dict[str, Optional[Dict[str, Any]]], pools: Dict[str, Dict[str, float]]) -> str:
+    """
+    Every metric in the Prometheus text format, plus cache counters (stats()
+    dicts with hits/misses/entries, None for caches that are off) and pool
+    gauges ({pool: {stat: value}}) collected at scrape time.
+    """
+    lines: List[str] = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    present = {name: stats for name, stats in caches.items() if stats}
+    lines.extend(_gauge_lines("cache_hits_total", "Cache hits", ("cache",),
+                              [((name,), stats.get("hits", 0)) for name, stats in present.items()], "counter"))
+    lines.extend(_gauge_lines("cache_misses_total", "Cache misses", ("cache",),
+                              [((name,), stats.get("misses", 0)) for name, stats in present.items()], "counter"))
+    lines.extend(_gauge_lines("cache_entries", "Entries held by a cache", ("cache",),
+                              [((name,), stats["entries"]) for name, stats in present.items() if "entries" in stats]))
+    lines.extend(_gauge_lines("pool_state", "Connection pool and queue state", ("pool", "stat"),
+                              [((pool, stat), value) for pool, stats in pools.items() for stat, value in stats.items()]))
+    return "\n".join(lines) + "\n"
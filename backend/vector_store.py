@@ -1,69 +1,545 @@
-import chromadb
-from chromadb.utils import embedding_functions
+import asyncio
+import hashlib
 import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 from dotenv import load_dotenv
+from chunker import chunk_pages
+from embeddings import get_embedder, embedding_writer, EMBEDDING_PROVIDER
+from lexical_index import get_lexical_index, is_confident, query_terms
+from query_cache import normalize_query, query_embedding_cache, retrieval_cache
+from tracing import span
 
 load_dotenv()
 
-# Initialize ChromaDB
+# "chroma" (default) or "numpy": numpy_index.py, quantized embeddings in memory-mapped files that
+# uvicorn workers share. Both store their data apart, switching means uploading the documents again.
+VECTOR_BACKENDS = ("chroma", "numpy")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
 # Using a local persistent directory for now. In production this might be a server.
-CHROMA_DB_DIR = os.path.join(os.path.dirname(__file__), "chroma_db")
-client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+CHROMA_DB_DIR = os.getenv("CHROMA_DB_DIR", os.path.join(os.path.dirname(__file__), "chroma_db"))
 
-# Setup OpenAI Embedding Function
-openai_api_key = os.getenv("OPENAI_API_KEY")
-embedding_fn = None
+_client = None
+_client_lock = threading.Lock()
 
-if openai_api_key:
-    try:
-        embedding_fn = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=openai_api_key,
-            model_name="text-embedding-3-small"
-        )
-    except Exception as e:
-        print(f"WARNING: Failed to initialize OpenAI embeddings: {e}")
-else:
+def get_client():
+    """
+    Vector store client of VECTOR_BACKEND, opened on first use (importing chromadb alone takes most
+    of a second). The numpy backend implements the part of Chroma's client API used here.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if VECTOR_BACKEND not in VECTOR_BACKENDS:
+                    raise ValueError(f"Unknown vector backend: {VECTOR_BACKEND}")
+                if VECTOR_BACKEND == "numpy":
+                    from numpy_index import NumpyIndex
+                    _client = NumpyIndex()
+                else:
+                    import chromadb
+                    _client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+    return _client
+
+# Embeddings are computed by embeddings.get_embedder() (batched, retried) and passed to
+# the vector store explicitly, so collections are created without an embedding function.
+if EMBEDDING_PROVIDER == "openai" and not os.getenv("OPENAI_API_KEY"):
     print("WARNING: OPENAI_API_KEY not found. Vector store will not work correctly.")
 
-# collection = client.get_or_create_collection(name="documents", embedding_function=embedding_fn)
+# Documents uploaded without a knowledge base share this collection and are filtered by doc_id.
+# Each named knowledge base (or tenant) gets its own collection, so its queries don't filter a global index.
+DEFAULT_COLLECTION = "documents"
+KB_COLLECTION_PREFIX = "kb_"
 
-def get_collection():
-    return client.get_or_create_collection(
-        name="documents", 
-        embedding_function=embedding_fn
-    )
+# "vector" (embeddings only), "hybrid" (BM25 fused with vectors, answered from BM25 alone when
+# it is confident) or "lexical" (BM25 only, no embedding call). KB nodes override it with retrievalMode.
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Hybrid mode fuses this many times n_results candidates from each side
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "3"))
+_RRF_K = 60
 
-def add_document_to_vector_store(doc_id: str, text: str, metadata: dict = None):
-    collection = get_collection()
-    
-    # Simple chunking (can be improved)
-    chunk_size = 1000
-    chunks = [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
-    
-    ids = [f"{doc_id}_{i}" for i in range(len(chunks))]
-    metadatas = [metadata or {} for _ in range(len(chunks))]
-    for m in metadatas:
-        m["doc_id"] = str(doc_id)
-        
-    collection.add(
-        documents=chunks,
-        ids=ids,
-        metadatas=metadatas
+def collection_name(knowledge_base: Optional[str] = None) -> str:
+    """Chroma collection name for a knowledge base (3-63 chars of [a-zA-Z0-9._-])"""
+    if not knowledge_base:
+        return DEFAULT_COLLECTION
+    slug = re.sub(r"[^a-zA-Z0-9._-]+", "-", knowledge_base.strip()).strip("-._")[:60]
+    if not slug:
+        slug = hashlib.sha256(knowledge_base.encode("utf-8")).hexdigest()[:16]
+    return KB_COLLECTION_PREFIX + slug
+
+_collections = {}
+_collections_lock = threading.Lock()
+
+def get_collection(name: str = DEFAULT_COLLECTION, create: bool = True):
+    """Collection handle (cached), None when it doesn't exist and create is False"""
+    with _collections_lock:
+        collection = _collections.get(name)
+        if collection is None:
+            client = get_client()
+            if VECTOR_BACKEND == "numpy":
+                from numpy_index import NotFoundError
+            else:
+                from chromadb.errors import NotFoundError
+            try:
+                if create:
+                    collection = client.get_or_create_collection(name=name, embedding_function=None)
+                else:
+                    collection = client.get_collection(name=name, embedding_function=None)
+            except NotFoundError:
+                return None
+            _collections[name] = collection
+        return collection
+
+def list_collections():
+    return [{"name": collection.name, "count": collection.count()} for collection in get_client().list_collections()]
+
+CHUNK_SIZE = 1000
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE):
+    """Fixed-size character splitter, superseded by chunker.py (kept for comparison benchmarks)"""
+    return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
+
+async def add_chunks_to_vector_store(doc_id: str, chunks: list, metadata: dict = None, start_index: int = 0,
+                                     chunk_metadatas: list = None, collection: str = DEFAULT_COLLECTION):
+    """Embed and upsert a run of chunks into a collection, ids continue from start_index"""
+    name = collection
+    collection = get_collection(name)
+
+    ids = [f"{doc_id}_{i}" for i in range(start_index, start_index + len(chunks))]
+    metadatas = [
+        dict(metadata or {}, **(chunk_metadatas[i] if chunk_metadatas else {}), doc_id=str(doc_id),
+             chunk_hash=chunk_hash(chunks[i]))
+        for i in range(len(chunks))
+    ]
+
+    # The BM25 index lives next to the collection and gets the same ids. It is written first (no API
+    # call), so hybrid and lexical retrieval find the chunks while they are embedded or if that fails.
+    await asyncio.to_thread(get_lexical_index().upsert, name, ids, chunks, metadatas)
+    retrieval_cache.invalidate_doc(doc_id, name)
+    await embedding_writer.write(collection, ids, chunks, metadatas)
+    retrieval_cache.invalidate_doc(doc_id, name)
+
+async def add_document_to_vector_store(doc_id: str, text: str, metadata: dict = None, collection: str = DEFAULT_COLLECTION):
+    chunks = list(chunk_pages([(0, text)]))
+    await add_chunks_to_vector_store(
+        doc_id, [chunk.text for chunk in chunks], metadata, chunk_metadatas=[chunk.metadata() for chunk in chunks],
+        collection=collection,
     )
     print(f"Added {len(chunks)} chunks to vector store for doc {doc_id}")
 
-def query_vector_store(query_text: str, n_results: int = 5, doc_id: str = None):
-    collection = get_collection()
+def chunk_hash(text: str) -> str:
+    """Content hash kept in every chunk's metadata, re-indexing compares it to skip unchanged chunks"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+# Chroma rejects get/update/delete calls with more ids than its max batch size (5461 with SQLite)
+_ID_BATCH = 5000
+
+def _batches(items: list, size: int = _ID_BATCH):
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+class DocumentReindex:
+    """
+    Re-index of a document already in a collection that only embeds the
+    chunks whose content changed.
+
+    load() reads the content hashes of the document's stored chunks (chunks
+    indexed before hashes were stored are hashed from their text). Each
+    add() matches the new chunks against them: a match keeps its id and
+    embedding and only has its metadata updated when that changed (e.g. a
+    page shift), new content is embedded and upserted. finish() deletes the
+    stored chunks nothing matched. add() takes batches, so the re-index
+    streams along with extraction like a first upload does.
+    """
+
+    def __init__(self, doc_id: str, collection: str = DEFAULT_COLLECTION):
+        self.doc_id = str(doc_id)
+        self.collection = collection
+        # content hash -> [(chunk id, stored metadata)] not matched yet
+        self._stored: Dict[str, List[Tuple[str, dict]]] = {}
+        self._taken = set()
+        self.unchanged = 0
+        self.updated = 0
+        self.added = 0
+        self.removed = 0
+
+    def _load(self):
+        chroma_collection = get_collection(self.collection)
+        stored = chroma_collection.get(where={"doc_id": self.doc_id}, include=["metadatas"])
+        legacy = [chunk_id for chunk_id, metadata in zip(stored["ids"], stored["metadatas"])
+                  if not (metadata or {}).get("chunk_hash")]
+        texts = {}
+        for batch in _batches(legacy):
+            result = chroma_collection.get(ids=batch, include=["documents"])
+            texts.update(zip(result["ids"], result["documents"]))
+        for chunk_id, metadata in zip(stored["ids"], stored["metadatas"]):
+            metadata = metadata or {}
+            digest = metadata.get("chunk_hash") or chunk_hash(texts.get(chunk_id) or "")
+            self._stored.setdefault(digest, []).append((chunk_id, metadata))
+        self._taken = set(stored["ids"])
+
+    async def load(self):
+        await asyncio.to_thread(self._load)
+
+    def _new_id(self, digest: str) -> str:
+        chunk_id = f"{self.doc_id}_{digest[:16]}"
+        suffix = 1
+        while chunk_id in self._taken:
+            chunk_id = f"{self.doc_id}_{digest[:16]}_{suffix}"
+            suffix += 1
+        self._taken.add(chunk_id)
+        return chunk_id
+
+    async def add(self, chunks: List[str], metadata: dict = None, chunk_metadatas: list = None):
+        added_ids, added_texts, added_metadatas = [], [], []
+        updated_ids, updated_texts, updated_metadatas = [], [], []
+        for i, text in enumerate(chunks):
+            digest = chunk_hash(text)
+            chunk_metadata = dict(metadata or {}, **(chunk_metadatas[i] if chunk_metadatas else {}),
+                                  doc_id=self.doc_id, chunk_hash=digest)
+            matches = self._stored.get(digest)
+            if not matches:
+                added_ids.append(self._new_id(digest))
+                added_texts.append(text)
+                added_metadatas.append(chunk_metadata)
+                continue
+            # Prefer a stored copy whose metadata is already right
+            index = next((j for j, (_, stored) in enumerate(matches) if stored == chunk_metadata), 0)
+            chunk_id, stored = matches.pop(index)
+            if stored == chunk_metadata:
+                self.unchanged += 1
+            else:
+                updated_ids.append(chunk_id)
+                updated_texts.append(text)
+                updated_metadatas.append(chunk_metadata)
+
+        if not (added_ids or updated_ids):
+            return
+        # BM25 rows first, like add_chunks_to_vector_store: the chunks stay findable if embedding fails
+        await asyncio.to_thread(get_lexical_index().upsert, self.collection, added_ids + updated_ids,
+                                added_texts + updated_texts, added_metadatas + updated_metadatas)
+        retrieval_cache.invalidate_doc(self.doc_id, self.collection)
+        chroma_collection = get_collection(self.collection)
+        if added_ids:
+            await embedding_writer.write(chroma_collection, added_ids, added_texts, added_metadatas)
+        if updated_ids:
+            await asyncio.to_thread(chroma_collection.update, ids=updated_ids, metadatas=updated_metadatas)
+        retrieval_cache.invalidate_doc(self.doc_id, self.collection)
+        self.added += len(added_ids)
+        self.updated += len(updated_ids)
+
+    def _delete(self, chunk_ids: List[str]):
+        chroma_collection = get_collection(self.collection)
+        for batch in _batches(chunk_ids):
+            chroma_collection.delete(ids=batch)
+        get_lexical_index().delete_chunks(self.collection, chunk_ids)
+
+    async def finish(self) -> Dict[str, int]:
+        """Delete the stored chunks no new chunk matched, returns the counts"""
+        leftover = [chunk_id for matches in self._stored.values() for chunk_id, _ in matches]
+        self._stored.clear()
+        if leftover:
+            await asyncio.to_thread(self._delete, leftover)
+            retrieval_cache.invalidate_doc(self.doc_id, self.collection)
+        self.removed += len(leftover)
+        return self.stats()
+
+    def stats(self) -> Dict[str, int]:
+        return {"unchanged": self.unchanged, "updated": self.updated, "added": self.added, "removed": self.removed}
+
+def document_collections(doc_id: str) -> List[str]:
+    """Collections holding chunks of a document (for documents stored before their collection was recorded)"""
+    found = []
+    for chroma_collection in get_client().list_collections():
+        if chroma_collection.get(where={"doc_id": str(doc_id)}, limit=1, include=[])["ids"]:
+            found.append(chroma_collection.name)
+    return found
+
+def delete_document_chunks(doc_id: str, collection: str = DEFAULT_COLLECTION) -> int:
+    """Remove every chunk of a document from a collection and its BM25 index, returns how many were removed"""
+    chroma_collection = get_collection(collection, create=False)
+    removed = 0
+    if chroma_collection is not None:
+        ids = chroma_collection.get(where={"doc_id": str(doc_id)}, include=[])["ids"]
+        for batch in _batches(ids):
+            chroma_collection.delete(ids=batch)
+        removed = len(ids)
+    get_lexical_index().delete_document(collection, str(doc_id))
+    retrieval_cache.invalidate_doc(doc_id, collection)
+    return removed
+
+def _stored_doc_ids(chroma_collection) -> Counter:
+    """Chunks per doc_id in a collection, read page by page"""
+    counts = Counter()
+    offset = 0
+    while True:
+        page = chroma_collection.get(include=["metadatas"], limit=_ID_BATCH, offset=offset)
+        counts.update(str((metadata or {}).get("doc_id", "")) for metadata in page["metadatas"])
+        if len(page["ids"]) < _ID_BATCH:
+            return counts
+        offset += _ID_BATCH
+
+def compact(existing_doc_ids: Callable[[List[str]], set], dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Remove orphaned chunks: chunks in Chroma or the BM25 index whose document
+    no longer exists. Scans every collection and asks existing_doc_ids which
+    of the doc_ids found still exist (a document's row is written before its
+    chunks, so one found here and missing there is gone for good). With
+    dry_run it only reports what would be removed.
+    """
+    lexical_index = get_lexical_index()
+    lexical_collections = set(lexical_index.collections())
+    report = {"dry_run": dry_run, "collections": {}, "documents_removed": 0, "chunks_removed": 0}
+    chroma_collections = {c.name: c for c in get_client().list_collections()}
+    for name in sorted(set(chroma_collections) | lexical_collections):
+        chroma_collection = chroma_collections.get(name)
+        counts = _stored_doc_ids(chroma_collection) if chroma_collection is not None else Counter()
+        lexical_doc_ids = set(lexical_index.doc_ids(name)) if name in lexical_collections else set()
+        found = set(counts) | lexical_doc_ids
+        orphans = sorted(found - existing_doc_ids(sorted(found)))
+        if not orphans:
+            continue
+        chunks = sum(counts[doc_id] for doc_id in orphans)
+        report["collections"][name] = {"documents": orphans, "chunks": chunks}
+        report["documents_removed"] += len(orphans)
+        report["chunks_removed"] += chunks
+        if dry_run:
+            continue
+        for doc_id in orphans:
+            if chroma_collection is not None and counts[doc_id]:
+                chroma_collection.delete(where={"doc_id": doc_id})
+            lexical_index.delete_document(name, doc_id)
+            retrieval_cache.invalidate_doc(doc_id, name)
+        print(f"Compaction removed {chunks} orphaned chunks of {len(orphans)} documents from {name}")
+    return report
+
+_embed_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_embed_locks_lock = threading.Lock()
+
+def embed_query(query_text: str):
+    """Embedding of a normalized query, from the in-memory query cache when possible"""
+    embedder = get_embedder()
+    key = (embedder.model_name, query_text)
+    embedding = query_embedding_cache.get(key)
+    if embedding is not None:
+        return embedding
+    # Concurrent searches for the same query (KB fan-out) share one embedding call
+    with _embed_locks_lock:
+        lock = _embed_locks.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            embedding = query_embedding_cache.get(key)
+            if embedding is None:
+                with span("embedding", model=embedder.model_name):
+                    embedding = embedder.embed([query_text])[0]
+                query_embedding_cache.put(key, embedding)
+    finally:
+        # Also after a failed call, or every distinct failing query would leave its lock behind
+        with _embed_locks_lock:
+            _embed_locks.pop(key, None)
+    return embedding
+
+def embed_queries(query_texts: List[str]):
+    """Embeddings of normalized queries, those not in the query cache computed in one embedding call"""
+    embedder = get_embedder()
+    embeddings = {}
+    missing = []
+    for query_text in dict.fromkeys(query_texts):
+        embedding = query_embedding_cache.get((embedder.model_name, query_text))
+        if embedding is None:
+            missing.append(query_text)
+        else:
+            embeddings[query_text] = embedding
+    if missing:
+        with span("embedding", model=embedder.model_name, batch=len(missing)):
+            vectors = embedder.embed(missing)
+        for query_text, embedding in zip(missing, vectors):
+            query_embedding_cache.put((embedder.model_name, query_text), embedding)
+            embeddings[query_text] = embedding
+    return [embeddings[query_text] for query_text in query_texts]
+
+def _results(hits: List[Tuple[str, str, dict, float]]):
+    """Chroma-shaped results from (id, document, metadata, distance) tuples"""
+    return {
+        "ids": [[hit[0] for hit in hits]],
+        "documents": [[hit[1] for hit in hits]],
+        "metadatas": [[hit[2] for hit in hits]],
+        "distances": [[hit[3] for hit in hits]],
+    }
+
+def _fuse(ranked_lists: List[List[Tuple[str, str, dict]]], n_results: int):
+    """
+    Reciprocal rank fusion of (id, document, metadata) lists. BM25 scores and
+    cosine distances aren't comparable, ranks are. The fused score is mapped
+    to a pseudo-distance in [0, 1) (0 = first in every list), results from
+    several collections are merged by rank (query_collections).
+    """
+    scores = {}
+    hits = {}
+    for ranked in ranked_lists:
+        for position, hit in enumerate(ranked):
+            scores[hit[0]] = scores.get(hit[0], 0.0) + 1.0 / (_RRF_K + position + 1)
+            hits.setdefault(hit[0], hit)
+    best = sorted(scores, key=scores.get, reverse=True)[:n_results]
+    scale = (_RRF_K + 1) / max(len(ranked_lists), 1)
+    return _results([(*hits[chunk_id], 1.0 - scores[chunk_id] * scale) for chunk_id in best])
+
+def _retrieval_mode(mode: Optional[str]) -> str:
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+    return mode
+
+def _doc_filter(doc_ids: Optional[Sequence[str]], doc_id: str = None) -> Optional[tuple]:
+    ids = {str(i) for i in (doc_ids or [])}
+    if doc_id:
+        ids.add(str(doc_id))
+    return tuple(sorted(ids)) or None
+
+def _where(ids: tuple):
+    return {"doc_id": ids[0]} if len(ids) == 1 else {"doc_id": {"$in": list(ids)}}
+
+def query_vector_store(query_text: str, n_results: int = 5, doc_id: str = None,
+                       collection: str = DEFAULT_COLLECTION, doc_ids: Sequence[str] = None, mode: str = None):
+    """
+    Top-k chunks for a query in one collection, optionally limited to some documents.
+    mode is one of RETRIEVAL_MODES (default RETRIEVAL_MODE); lexical and hybrid
+    results carry pseudo-distances from rank fusion instead of cosine distances.
+    Results may be shared with other callers, don't mutate them.
+    """
+    mode = _retrieval_mode(mode)
+    query = normalize_query(query_text)
+    ids = _doc_filter(doc_ids, doc_id)
+    cache_key = (query, collection, ids, n_results, mode)
+    results = retrieval_cache.get(cache_key)
+    if results is not None:
+        return results
+    generation = retrieval_cache.generation
+
+    name = collection
+    lexical = []
+    if mode != "vector":
+        terms = query_terms(query)
+        depth = n_results * HYBRID_CANDIDATES if mode == "hybrid" else n_results
+        with span("lexical_search", collection=name) as attrs:
+            hits = get_lexical_index().search(name, terms, depth, ids)
+            attrs["hits"] = len(hits)
+        lexical = [(hit.id, hit.document, hit.metadata) for hit in hits]
+        # Exact identifier matches (part numbers, error codes) need no embedding round-trip
+        if mode == "lexical" or is_confident(terms, hits):
+            results = _fuse([lexical], n_results)
+            retrieval_cache.put_if_current(cache_key, results, generation)
+            return results
+
+    collection = get_collection(name, create=False)
+    if collection is None:
+        # No embeddings (yet, or their writing failed): hybrid answers from BM25 alone
+        results = _fuse([lexical], n_results) if mode == "hybrid" else _results([])
+        retrieval_cache.put_if_current(cache_key, results, generation)
+        return results
     
     # Build query parameters
     query_params = {
-        "query_texts": [query_text],
-        "n_results": n_results
+        "query_embeddings": [embed_query(query)],
+        "n_results": n_results * HYBRID_CANDIDATES if mode == "hybrid" else n_results
     }
     
     # Add filter by doc_id if provided
-    if doc_id:
-        query_params["where"] = {"doc_id": str(doc_id)}
+    if ids:
+        query_params["where"] = _where(ids)
     
-    results = collection.query(**query_params)
+    with span("vector_query", collection=name):
+        results = collection.query(**query_params)
+    if mode == "hybrid":
+        vector = list(zip(results["ids"][0], results["documents"][0], results["metadatas"][0]))
+        results = _fuse([lexical, vector], n_results)
+    retrieval_cache.put_if_current(cache_key, results, generation)
     return results
+
+def query_vector_store_batch(query_texts: List[str], n_results: int = 5, collection: str = DEFAULT_COLLECTION,
+                             doc_ids: Sequence[str] = None, mode: str = None):
+    """
+    query_vector_store() for many queries at once, results in the same order.
+    Queries missing from the retrieval cache are embedded in one embedding
+    call and looked up with one multi-query Chroma call, and their results
+    are put into the retrieval cache, so later single-query searches for
+    them (e.g. by a batch run's KB nodes) are cache hits.
+    """
+    mode = _retrieval_mode(mode)
+    ids = _doc_filter(doc_ids)
+    queries = [normalize_query(query_text) for query_text in query_texts]
+    results: Dict[str, dict] = {}
+    generation = retrieval_cache.generation
+    pending = []
+    for query in dict.fromkeys(queries):
+        cached = retrieval_cache.get((query, collection, ids, n_results, mode))
+        if cached is not None:
+            results[query] = cached
+        else:
+            pending.append(query)
+
+    def store(query, result):
+        results[query] = result
+        retrieval_cache.put_if_current((query, collection, ids, n_results, mode), result, generation)
+
+    lexical = {}
+    if mode != "vector" and pending:
+        depth = n_results * HYBRID_CANDIDATES if mode == "hybrid" else n_results
+        with span("lexical_search", collection=collection, batch=len(pending)):
+            for query in pending:
+                terms = query_terms(query)
+                hits = get_lexical_index().search(collection, terms, depth, ids)
+                lexical[query] = [(hit.id, hit.document, hit.metadata) for hit in hits]
+                if mode == "lexical" or is_confident(terms, hits):
+                    store(query, _fuse([lexical[query]], n_results))
+        pending = [query for query in pending if query not in results]
+
+    if pending:
+        chroma_collection = get_collection(collection, create=False)
+        if chroma_collection is None:
+            for query in pending:
+                store(query, _fuse([lexical[query]], n_results) if mode == "hybrid" else _results([]))
+            return [results[query] for query in queries]
+        query_params = {
+            "query_embeddings": embed_queries(pending),
+            "n_results": n_results * HYBRID_CANDIDATES if mode == "hybrid" else n_results,
+        }
+        if ids:
+            query_params["where"] = _where(ids)
+        with span("vector_query", collection=collection, batch=len(pending)):
+            batch = chroma_collection.query(**query_params)
+        for i, query in enumerate(pending):
+            result = {key: [batch[key][i]] for key in ("ids", "documents", "metadatas", "distances")}
+            if mode == "hybrid":
+                vector = list(zip(result["ids"][0], result["documents"][0], result["metadatas"][0]))
+                result = _fuse([lexical[query], vector], n_results)
+            store(query, result)
+    return [results[query] for query in queries]
+
+async def query_collections(query_text: str, targets: List[Tuple[str, Optional[Sequence[str]]]], n_results: int = 5,
+                            mode: str = None):
+    """
+    Search several (collection, doc_ids or None) targets concurrently and merge the hits by reciprocal
+    rank fusion: distances of different collections don't share a scale (L2 from vector searches,
+    rank-fusion pseudo-distances from hybrid and lexical ones, each with its own number of lists).
+    Returns the best n_results as dicts with document, metadata, distance and collection. With one
+    target the distances are that search's own, merged hits carry the fused pseudo-distance.
+    """
+    results = await asyncio.gather(*[
+        asyncio.to_thread(query_vector_store, query_text, n_results, None, collection, doc_ids, mode)
+        for collection, doc_ids in targets
+    ])
+
+    hits = []
+    for (collection, _), result in zip(targets, results):
+        ranked = zip(result["documents"][0], result["metadatas"][0], result["distances"][0])
+        for position, (document, metadata, distance) in enumerate(ranked):
+            if len(targets) > 1:
+                # Each chunk is in one target's list, so its fused score is 1 / (k + rank) mapped like _fuse
+                distance = 1.0 - (_RRF_K + 1) / (_RRF_K + position + 1)
+            hits.append({"document": document, "metadata": metadata, "distance": distance, "collection": collection})
+    # Stable: hits of equal rank keep the order of the targets
+    hits.sort(key=lambda hit: hit["distance"])
+    return hits[:n_results]
@@ -0,0 +1,224 @@
+"""
+Web search for webSearch nodes and the LLM node's "Web Search" toggle.
+
+Searches go through a pluggable provider (SerpAPI, or a local stub for
+tests and benchmarks), are cached per worker for WEB_SEARCH_CACHE_TTL
+seconds keyed by (provider, query, engine, locale, count), and concurrent
+identical searches share one provider request. The top result pages can
+optionally be fetched in parallel and reduced to plain text, which gives
+the LLM more than the search snippet to work with.
+"""
+import asyncio
+import os
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+import httpx
+from dotenv import load_dotenv
+from query_cache import TTLCache, normalize_query
+from tracing import span
+
+load_dotenv()
+
+SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
+SERPAPI_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search.json")
+# "serpapi", or "stub" for canned local results (no API key needed)
+WEB_SEARCH_PROVIDER = os.getenv("WEB_SEARCH_PROVIDER", "serpapi")
+WEB_SEARCH_CACHE_SIZE = int(os.getenv("WEB_SEARCH_CACHE_SIZE", "1024"))
+WEB_SEARCH_CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", "900"))
+# Fetched result pages: per-page timeout, bytes read and text characters kept
+WEB_FETCH_TIMEOUT = float(os.getenv("WEB_FETCH_TIMEOUT", "5"))
+WEB_FETCH_MAX_BYTES = int(os.getenv("WEB_FETCH_MAX_BYTES", "1000000"))
+WEB_FETCH_MAX_CHARS = int(os.getenv("WEB_FETCH_MAX_CHARS", "3000"))
+
+# Shared async HTTP client so searches reuse pooled connections instead of
+# blocking the event loop inside the serpapi SDK.
+_http_client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(15.0, connect=5.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            follow_redirects=True,
+        )
+    return _http_client
+
+
+class SerpApiProvider:
+    name = "serpapi"
+    requires_key = True
+
+    async def search(self, query: str, api_key: Optional[str], engine: str, locale: str, num_results: int):
+        params = {"engine": engine, "q": query, "api_key": api_key}
+        # "en" or "en-US": interface language, plus the country when given
+        language, _, country = locale.partition("-")
+        if language:
+            params["hl"] = language.lower()
+        if country:
+            params["gl"] = country.lower()
+        response = await get_http_client().get(SERPAPI_URL, params=params)
+        response.raise_for_status()
+        organic_results = response.json().get("organic_results", [])
+        return [
+            {"title": res.get("title", ""), "snippet": res.get("snippet", ""), "link": res.get("link", "")}
+            for res in organic_results[:num_results]
+        ]
+
+
+class StubProvider:
+    """Deterministic results without network access, STUB_SEARCH_LATENCY simulates the round-trip"""
+
+    name = "stub"
+    requires_key = False
+
+    def __init__(self):
+        self.latency = float(os.getenv("STUB_SEARCH_LATENCY", "0"))
+        self.requests = 0
+
+    async def search(self, query: str, api_key: Optional[str], engine: str, locale: str, num_results: int):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [
+            {"title": f"Result {i + 1} for {query}", "snippet": f"Stub {engine}/{locale} snippet {i + 1} about {query}.",
+             "link": f"https://example.com/{i + 1}"}
+            for i in range(num_results)
+        ]
+
+
+_PROVIDERS = {"serpapi": SerpApiProvider, "stub": StubProvider}
+_provider = None
+
+def get_search_provider():
+    global _provider
+    if _provider is None:
+        if WEB_SEARCH_PROVIDER not in _PROVIDERS:
+            raise ValueError(f"Unknown WEB_SEARCH_PROVIDER: {WEB_SEARCH_PROVIDER}")
+        _provider = _PROVIDERS[WEB_SEARCH_PROVIDER]()
+    return _provider
+
+def set_search_provider(provider):
+    """Swap the provider (e.g. a StubProvider in benchmarks), clearing cached results"""
+    global _provider
+    _provider = provider
+    search_cache.clear()
+
+
+search_cache = TTLCache(WEB_SEARCH_CACHE_SIZE, WEB_SEARCH_CACHE_TTL)
+page_cache = TTLCache(WEB_SEARCH_CACHE_SIZE, WEB_SEARCH_CACHE_TTL)
+_in_flight: Dict[tuple, asyncio.Task] = {}
+
+
+async def _single_flight(cache: TTLCache, key: tuple, fetch):
+    """Cached value for key, otherwise the result of fetch() shared by every concurrent caller"""
+    value = cache.get(key)
+    if value is not None:
+        return value
+    task = _in_flight.get(key)
+    if task is None:
+        async def run():
+            value = await fetch()
+            cache.put(key, value)
+            return value
+        task = asyncio.create_task(run())
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # Shielded: one caller giving up (deadline, disconnect) doesn't fail the others
+    return await asyncio.shield(task)
+
+
+async def _search(provider, query: str, api_key: Optional[str], engine: str, locale: str, num_results: int):
+    with span("web_search", provider=provider.name):
+        return await provider.search(query, api_key, engine, locale, num_results)
+
+
+async def search_web(query: str, api_key: Optional[str], num_results: int = 3, engine: str = "google",
+                     locale: str = "en"):
+    """Search through the configured provider, returns [{"title", "snippet", "link"}]"""
+    provider = get_search_provider()
+    key = ("search", provider.name, normalize_query(query), engine, locale.lower(), num_results)
+    results = await _single_flight(
+        search_cache, key, lambda: _search(provider, query, api_key, engine, locale, num_results)
+    )
+    # Callers may add page content, keep the cached list intact
+    return [dict(result) for result in results]
+
+
+class _TextExtractor(HTMLParser):
+    _SKIP = {"script", "style", "noscript", "svg", "head", "template"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts: List[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skipping += 1
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP and self._skipping:
+            self._skipping -= 1
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+def extract_text(html: str, max_chars: int = WEB_FETCH_MAX_CHARS) -> str:
+    """Visible text of an HTML page, whitespace collapsed and cut to max_chars"""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return re.sub(r"\s+", " ", " ".join(parser.parts)).strip()[:max_chars]
+
+
+async def _download(url: str) -> str:
+    with span("web_fetch"):
+        return await _download_text(url)
+
+
+async def _download_text(url: str) -> str:
+    async with get_http_client().stream("GET", url, timeout=WEB_FETCH_TIMEOUT) as response:
+        response.raise_for_status()
+        content_type = response.headers.get("content-type", "")
+        if "html" not in content_type and not content_type.startswith("text/"):
+            return ""
+        body = bytearray()
+        async for data in response.aiter_bytes():
+            body.extend(data)
+            if len(body) >= WEB_FETCH_MAX_BYTES:
+                break
+        text = bytes(body).decode(response.encoding or "utf-8", errors="replace")
+    if "html" not in content_type:
+        return re.sub(r"\s+", " ", text).strip()[:WEB_FETCH_MAX_CHARS]
+    # Parsing a large page takes a while, keep it off the event loop
+    return await asyncio.to_thread(extract_text, text)
+
+
+async def fetch_page_text(url: str) -> str:
+    """Text of a result page (cached), empty when it can't be fetched"""
+    try:
+        return await _single_flight(page_cache, ("page", url), lambda: _download(url))
+    except Exception as e:
+        print(f"Web page fetch failed for {url}: {e}")
+        return ""
+
+
+async def fetch_result_pages(results: List[Dict[str, str]], max_pages: int):
+    """Add the text of the first max_pages result pages as "content", fetched in parallel"""
+    targets = [result for result in results[:max_pages] if result.get("link")]
+    texts = await asyncio.gather(*[fetch_page_text(result["link"]) for result in targets])
+    for result, text in zip(targets, texts):
+        if text:
+            result["content"] = text
+    return results
+
+
+def format_web_result(result) -> str:
+    text = f"Title: {result['title']}\nSnippet: {result['snippet']}\nLink: {result['link']}"
+    if result.get("content"):
+        text += f"\nContent: {result['content']}"
+    return text
@@ -0,0 +1,595 @@
+import asyncio
+import os
+import time
+from collections import defaultdict, deque
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from chat_history import CHAT_MEMORY_TOKENS, load_memory
+from context_assembly import ContextItem, assemble_context, context_budget
+from llm_clients import client_registry, OPENROUTER_BASE_URL
+from query_cache import normalize_query
+from response_cache import RESPONSE_CACHE_TTL, ResponseCache, get_response_cache, replay_chunks
+from tokens import count_tokens
+from tracing import RunTrace, node_finished, record_llm_usage, record_ttft, span, start_run
+from vector_store import DEFAULT_COLLECTION, collection_name, embed_query, query_collections
+from web_search import fetch_result_pages, format_web_result, get_search_provider, search_web
+
+load_dotenv()
+
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
+
+DEFAULT_MODEL = "google/gemini-2.0-flash-exp:free"
+DEFAULT_SYSTEM_PROMPT = "You are a helpful AI assistant."
+# Chunks fetched per KB node, the context assembler keeps what fits the model's budget
+KB_N_RESULTS = int(os.getenv("KB_N_RESULTS", "5"))
+
+# Seconds a whole run may take, and per-node defaults (nodes override them with "timeout",
+# LLM nodes the web search with "webSearchTimeout"). Every node also stops at the run deadline.
+RUN_TIMEOUT = float(os.getenv("RUN_TIMEOUT", "300"))
+KB_TIMEOUT = float(os.getenv("KB_TIMEOUT", "30"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+WEB_SEARCH_TIMEOUT = float(os.getenv("WEB_SEARCH_TIMEOUT", "15"))
+TIMEOUT_RESPONSE = "Error: The workflow ran out of time before the AI provider answered."
+
+
+class WorkflowError(Exception):
+    """Raised when a workflow graph cannot be executed (no LLM node, cycles, ...)"""
+
+
+class LLMCallError(Exception):
+    """Raised when the AI provider call for an LLM node fails"""
+
+
+def seconds(value: Any, default: float) -> float:
+    """A timeout from node data, the default when unset or not a positive number"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+def get_runtime_client(api_key: Optional[str]):
+    # Node keys and the server key share pooled clients, so tenants reuse warm connections
+    if not api_key:
+        return None
+    return client_registry.get(api_key, OPENROUTER_BASE_URL)
+
+
+class LLMNodeConfig:
+    """Settings of an llmEngine node, resolved once when the graph is compiled"""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.model = data.get("model", DEFAULT_MODEL)
+        self.temperature = float(data.get("temperature", 0.7))
+        self.system_prompt = data.get("prompt", DEFAULT_SYSTEM_PROMPT)
+        self.api_key = data.get("apiKey") or OPENROUTER_API_KEY
+        self.use_web_search = bool(data.get("useWebSearch", False))
+        self.serp_api_key = data.get("serpApiKey") or SERPAPI_API_KEY
+        self.context_tokens = data.get("contextTokens")
+        # Opt-in answer cache, optionally matching similar queries above a cosine threshold
+        self.cache_responses = bool(data.get("cacheResponses", False))
+        self.cache_ttl = int(data.get("cacheTtl") or RESPONSE_CACHE_TTL)
+        similarity = data.get("cacheSimilarity")
+        self.cache_similarity = float(similarity) if similarity not in (None, "") else None
+        self.timeout = seconds(data.get("timeout"), LLM_TIMEOUT)
+        self.web_search_timeout = seconds(data.get("webSearchTimeout"), WEB_SEARCH_TIMEOUT)
+        # Conversation memory: the workflow's last N recorded turns, within a token budget
+        self.memory_turns = int(data.get("memoryTurns") or 0)
+        self.memory_tokens = int(data.get("memoryTokens") or CHAT_MEMORY_TOKENS)
+
+    @property
+    def client(self):
+        return get_runtime_client(self.api_key)
+
+
+class WorkflowGraph:
+    """
+    Compiled execution plan for a React Flow nodes/edges payload.
+
+    Holds the adjacency indexes, topological order, the set of nodes needed
+    for the answer and each LLM node's resolved config (whose client comes
+    from the pooled registry in llm_clients.py), so a graph can be cached and
+    executed many times. It is never mutated after construction, all per-run
+    state lives in WorkflowExecutor.
+    """
+
+    def __init__(self, nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]]):
+        self.nodes = {node["id"]: node for node in nodes}
+        self.incoming = defaultdict(list)
+        self.outgoing = defaultdict(list)
+        for edge in edges:
+            source, target = edge.get("source"), edge.get("target")
+            # Dangling edges (e.g. left over after deleting a node) are ignored
+            if source in self.nodes and target in self.nodes:
+                self.outgoing[source].append(target)
+                self.incoming[target].append(source)
+
+        self.order = self._topological_sort()
+        self.llm_nodes = [node_id for node_id in self.order if self.node_type(node_id) == "llmEngine"]
+        if not self.llm_nodes:
+            raise WorkflowError("No LLM Engine node found in workflow.")
+
+        self.result_node = self._find_result_node()
+        self.required = self._ancestors([self.result_node])
+        self.llm_configs = {
+            node_id: LLMNodeConfig(self.node_data(node_id))
+            for node_id in self.llm_nodes if node_id in self.required
+        }
+
+    def node_type(self, node_id: str) -> str:
+        return self.nodes[node_id].get("type")
+
+    def node_data(self, node_id: str) -> Dict[str, Any]:
+        return self.nodes[node_id].get("data") or {}
+
+    def _topological_sort(self) -> List[str]:
+        # Kahn's algorithm, keeping the original node order for ties
+        in_degree = {node_id: len(self.incoming[node_id]) for node_id in self.nodes}
+        ready = deque(node_id for node_id in self.nodes if in_degree[node_id] == 0)
+        order = []
+        while ready:
+            node_id = ready.popleft()
+            order.append(node_id)
+            for target in self.outgoing[node_id]:
+                in_degree[target] -= 1
+                if in_degree[target] == 0:
+                    ready.append(target)
+        if len(order) != len(self.nodes):
+            raise WorkflowError("Workflow graph contains a cycle.")
+        return order
+
+    def _find_result_node(self) -> str:
+        # The answer comes from the LLM feeding an Output node, otherwise the last LLM in the graph
+        for node_id in self.llm_nodes:
+            if any(self.node_type(target) == "output" for target in self.outgoing[node_id]):
+                return node_id
+        return self.llm_nodes[-1]
+
+    def _ancestors(self, node_ids: List[str]) -> set:
+        seen = set(node_ids)
+        stack = list(node_ids)
+        while stack:
+            for source in self.incoming[stack.pop()]:
+                if source not in seen:
+                    seen.add(source)
+                    stack.append(source)
+        return seen
+
+
+def merge_sources(*source_lists: List[str]) -> List[str]:
+    merged = []
+    seen = set()
+    for sources in source_lists:
+        for source in sources:
+            if source not in seen:
+                merged.append(source)
+                seen.add(source)
+    return merged
+
+
+def kb_search_targets(kb_data: Dict[str, Any]):
+    """
+    (collection, doc_ids) pairs a KB node searches. Named knowledge bases
+    ("collection" / "collections") are searched whole, files outside them
+    ("files", or the older single "file") are filtered by id within the
+    collection they were uploaded to.
+    """
+    names = list(kb_data.get("collections") or [])
+    if kb_data.get("collection"):
+        names.append(kb_data["collection"])
+    whole = sorted({collection_name(name) for name in names})
+
+    files = kb_data.get("files") or ([kb_data["file"]] if kb_data.get("file") else [])
+    filtered = defaultdict(list)
+    for file_info in files:
+        collection = file_info.get("collection") or DEFAULT_COLLECTION
+        if collection not in whole and file_info.get("id") is not None:
+            filtered[collection].append(str(file_info["id"]))
+    return [(collection, None) for collection in whole] + list(filtered.items())
+
+
+async def retrieve_kb_context(kb_data: Dict[str, Any], user_query: str):
+    """Query the vector store for a KB node, returns (context items, sources)"""
+    items = []
+    sources = []
+    targets = kb_search_targets(kb_data)
+    if not targets:
+        return items, sources
+
+    # Collections are searched concurrently (in worker threads, Chroma is blocking) and merged by rank
+    hits = await query_collections(user_query, targets, n_results=KB_N_RESULTS, mode=kb_data.get("retrievalMode"))
+    for i, hit in enumerate(hits):
+        filename = hit["metadata"].get("filename", "Unknown File")
+        items.append(ContextItem(hit["document"], filename, "kb", i))
+        sources.append(filename)
+
+    return items, merge_sources(sources)
+
+
+async def retrieve_web_context(user_query: str, serp_api_key: Optional[str], num_results: int = 3,
+                               engine: str = "google", locale: str = "en", fetch_pages: int = 0):
+    """Run a web search step, returns (context items, error note, sources)"""
+    if not serp_api_key and get_search_provider().requires_key:
+        return [], "[Web Search Failed: No SERP API Key provided]", []
+    try:
+        print("Executing Web Search...")
+        results = await search_web(user_query, serp_api_key, num_results, engine, locale)
+        if fetch_pages:
+            await fetch_result_pages(results, fetch_pages)
+    except Exception as e:
+        print(f"SerpAPI Error: {e}")
+        return [], f"[Web Search Error: {str(e)}]", []
+    items = [ContextItem(format_web_result(result), f"Web: {result['title']}", "web", i) for i, result in enumerate(results)]
+    return items, "", [item.source for item in items]
+
+
+class LLMCall:
+    """
+    A fully prepared chat completion request for an LLM node.
+
+    When the node enables cacheResponses, answers are stored in the response
+    cache under (model, system prompt, context) and the query, and a cached
+    answer is returned (or replayed as stream chunks) instead of calling
+    the provider.
+    """
+
+    def __init__(self, node_id: str, config: LLMNodeConfig, messages: List[Dict[str, str]], sources: List[str],
+                 query: str = "", context: str = "", context_usage: List[Dict[str, Any]] = None):
+        self.node_id = node_id
+        self.model = config.model
+        self.temperature = config.temperature
+        self.client = config.client
+        self.messages = messages
+        self.sources = sources
+        self.context_usage = context_usage or []
+        self.query = query
+        self.cache_ttl = config.cache_ttl
+        self.cache_similarity = config.cache_similarity
+        self.cache_bucket = ResponseCache.bucket(config.model, config.system_prompt, context) if config.cache_responses else None
+        self.cache_hit = False
+        self._query_embedding = None
+        # Loop time the call must finish by (streamed answers are cut off there), set by the executor
+        self.deadline: Optional[float] = None
+        # perf_counter time the node started, for tracing a streamed answer
+        self.started = time.perf_counter()
+
+    async def _cached_response(self) -> Optional[str]:
+        if not self.cache_bucket:
+            return None
+        if self.cache_similarity is not None:
+            try:
+                self._query_embedding = await asyncio.to_thread(embed_query, normalize_query(self.query))
+            except Exception as e:
+                # Similar-query matching is best effort, exact matches still work without embeddings
+                print(f"Response cache embedding error: {e}")
+        with span("response_cache") as attrs:
+            response = await asyncio.to_thread(
+                get_response_cache().get, self.cache_bucket, self.query, self._query_embedding, self.cache_similarity
+            )
+            attrs["hit"] = self.cache_hit = response is not None
+        return response
+
+    def _record_usage(self, attrs: Dict[str, Any], response: str, usage=None):
+        """Token counts of a provider call, from the provider's usage when it reports it"""
+        if usage is not None and usage.prompt_tokens is not None:
+            prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens or 0
+        else:
+            prompt_tokens = sum(count_tokens(message["content"]) for message in self.messages)
+            completion_tokens = count_tokens(response)
+            attrs["estimated"] = True
+        attrs["prompt_tokens"] = prompt_tokens
+        attrs["completion_tokens"] = completion_tokens
+        record_llm_usage(self.model, prompt_tokens, completion_tokens)
+
+    async def _store_response(self, response: str):
+        if self.cache_bucket and response:
+            await asyncio.to_thread(
+                get_response_cache().put, self.cache_bucket, self.query, response, self.cache_ttl, self._query_embedding
+            )
+
+    async def complete(self) -> str:
+        if not self.client:
+            raise LLMCallError("Error: OpenRouter API Key is missing. Please configure it in the node or .env.")
+        cached = await self._cached_response()
+        if cached is not None:
+            print(f"Response cache hit for node {self.node_id}")
+            return cached
+        print(f"Calling OpenRouter with model: {self.model}")
+        try:
+            with span("llm", model=self.model, node=self.node_id) as attrs:
+                completion = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=self.messages,
+                    temperature=self.temperature,
+                )
+                response = completion.choices[0].message.content
+                self._record_usage(attrs, response, completion.usage)
+        except Exception as e:
+            print(f"OpenRouter Error: {e}")
+            raise LLMCallError(f"Error calling AI Provider: {str(e)}") from e
+        await self._store_response(response)
+        return response
+
+    async def stream(self) -> AsyncGenerator[str, None]:
+        if not self.client:
+            raise LLMCallError("OpenRouter API Key is missing.")
+        cached = await self._cached_response()
+        if cached is not None:
+            for piece in replay_chunks(cached):
+                yield piece
+            return
+
+        parts = []
+        with span("llm", model=self.model, node=self.node_id, streamed=True) as attrs:
+            started = time.perf_counter()
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=self.messages,
+                temperature=self.temperature,
+                stream=True,
+            )
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not parts:
+                            ttft = time.perf_counter() - started
+                            attrs["ttft_ms"] = round(ttft * 1000, 2)
+                            record_ttft(self.model, ttft)
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            finally:
+                # Also runs when the client went away mid-answer, so the provider stops generating
+                await stream.close()
+                # Counted for cut-off answers too, the provider generated them
+                self._record_usage(attrs, "".join(parts))
+        # Only answers streamed to completion are cached
+        await self._store_response("".join(parts))
+
+
+class WorkflowExecutor:
+    """
+    Runs a workflow graph for one query.
+
+    Every required node gets its own task which waits only for its direct
+    predecessors, so independent branches (several KB nodes, web search,
+    upstream LLMs) run concurrently and total latency follows the critical
+    path. Node outputs are dicts passed along edges:
+    KB -> {"items", "sources"}, webSearch -> {"items", "sources", "notes"},
+    LLM -> {"response", "sources", "context_usage"}.
+
+    LLM nodes with memoryTurns get the last turns recorded for workflow_id
+    and conversation_id (saved workflows only) as prior chat messages.
+
+    An optional on_event coroutine receives progress events as nodes start
+    and finish, plus the sources found so far, so a streamed run can show
+    them before the answer starts.
+
+    Each node runs until its own timeout or the run deadline, whichever is
+    first. A KB lookup or web search that runs out of time contributes
+    nothing, an upstream LLM that does contributes an empty response, so
+    the run still finishes with what it has. Cancelling the run (client
+    disconnect) cancels every node task and their provider requests;
+    blocking vector store calls in worker threads are abandoned.
+    """
+
+    def __init__(self, graph: WorkflowGraph, user_query: str,
+                 on_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+                 timeout: Optional[float] = None, workflow_id: Optional[int] = None,
+                 conversation_id: Optional[str] = None):
+        self.graph = graph
+        self.user_query = user_query
+        self.workflow_id = workflow_id
+        self.conversation_id = conversation_id
+        self.on_event = on_event
+        self.timeout = seconds(timeout, RUN_TIMEOUT)
+        # Event loop time the run must finish by, set when it starts
+        self.deadline: Optional[float] = None
+        self.tasks: Dict[str, asyncio.Task] = {}
+        # Tokens each source contributed to the result node's prompt, set by run()
+        self.context_usage: List[Dict[str, Any]] = []
+        # Spans of this run (None with TRACING_ENABLED=0), started with the run
+        self.trace: Optional[RunTrace] = None
+        self._sources_sent: List[str] = []
+
+    async def run(self):
+        """Execute the whole graph, returns (response, sources) of the result node"""
+        output = await self._execute(stream_result=False)
+        self.context_usage = output.get("context_usage", [])
+        return output["response"], output["sources"]
+
+    async def prepare_stream(self) -> LLMCall:
+        """Execute everything upstream of the result node and return its call ready for streaming"""
+        return await self._execute(stream_result=True)
+
+    async def _emit_progress(self, node_id: str, status: str, started: float = None):
+        if not self.on_event:
+            return
+        event = {"type": "progress", "node": node_id, "nodeType": self.graph.node_type(node_id), "status": status}
+        if started is not None:
+            event["ms"] = round((time.perf_counter() - started) * 1000)
+        await self.on_event(event)
+
+    async def _finish_node(self, node_id: str, status: str, started: float):
+        node_finished(node_id, self.graph.node_type(node_id), status, started)
+        await self._emit_progress(node_id, status, started)
+
+    async def _emit_sources(self, sources: List[str]):
+        # Sources only ever grow during a run, each event carries the full list so far
+        merged = merge_sources(self._sources_sent, sources)
+        if self.on_event and len(merged) > len(self._sources_sent):
+            self._sources_sent = merged
+            await self.on_event({"type": "sources", "content": merged})
+
+    def node_deadline(self, timeout: float) -> float:
+        """Loop time a node must finish by: its own timeout, capped by the run deadline"""
+        return min(self.deadline, asyncio.get_running_loop().time() + timeout)
+
+    async def _web_search(self, config: LLMNodeConfig):
+        try:
+            async with asyncio.timeout_at(self.node_deadline(config.web_search_timeout)):
+                web_items, web_note, web_sources = await retrieve_web_context(self.user_query, config.serp_api_key)
+        except TimeoutError:
+            print("Web search timed out")
+            return [], "[Web Search Failed: timed out]", []
+        await self._emit_sources(web_sources)
+        return web_items, web_note, web_sources
+
+    async def _execute(self, stream_result: bool):
+        self.deadline = asyncio.get_running_loop().time() + self.timeout
+        # Node tasks (and the threads they use) inherit the trace, as does a streamed answer in this task
+        self.trace = start_run()
+        self.tasks = {}
+        for node_id in self.graph.order:
+            if node_id in self.graph.required:
+                self.tasks[node_id] = asyncio.create_task(
+                    self._run_node(node_id, stream_result and node_id == self.graph.result_node)
+                )
+        try:
+            return await self.tasks[self.graph.result_node]
+        finally:
+            for task in self.tasks.values():
+                if not task.done():
+                    task.cancel()
+
+    async def _run_node(self, node_id: str, prepare_only: bool = False):
+        node_type = self.graph.node_type(node_id)
+        data = self.graph.node_data(node_id)
+
+        config = self.graph.llm_configs.get(node_id)
+
+        # LLM web search and memory only depend on the query, start them before waiting on upstream nodes
+        web_task = memory_task = None
+        if config and config.use_web_search:
+            web_task = asyncio.create_task(self._web_search(config))
+        if config and config.memory_turns and self.workflow_id is not None and self.conversation_id:
+            memory_task = asyncio.create_task(load_memory(self.workflow_id, self.conversation_id, config.memory_turns,
+                                                          config.memory_tokens))
+
+        try:
+            inputs = await asyncio.gather(*[self.tasks[source] for source in self.graph.incoming[node_id]])
+        except BaseException:
+            for task in (web_task, memory_task):
+                if task:
+                    task.cancel()
+            raise
+
+        if node_type == "knowledgeBase":
+            print(f"Executing KB Node: {node_id}")
+            started = time.perf_counter()
+            await self._emit_progress(node_id, "running")
+            try:
+                async with asyncio.timeout_at(self.node_deadline(seconds(data.get("timeout"), KB_TIMEOUT))):
+                    items, sources = await retrieve_kb_context(data, self.user_query)
+            except TimeoutError:
+                print(f"KB Node {node_id} timed out")
+                await self._finish_node(node_id, "timeout", started)
+                return {"items": [], "sources": []}
+            if items:
+                print(f"Retrieved Context: {len(items)} chunks")
+            await self._finish_node(node_id, "done", started)
+            await self._emit_sources(sources)
+            return {"items": items, "sources": sources}
+
+        if node_type == "webSearch":
+            print(f"Executing Web Search Node: {node_id}")
+            started = time.perf_counter()
+            await self._emit_progress(node_id, "running")
+            try:
+                async with asyncio.timeout_at(self.node_deadline(seconds(data.get("timeout"), WEB_SEARCH_TIMEOUT))):
+                    items, note, sources = await retrieve_web_context(
+                        self.user_query, data.get("serpApiKey") or SERPAPI_API_KEY,
+                        num_results=int(data.get("numResults") or 3), engine=data.get("engine") or "google",
+                        locale=data.get("locale") or "en", fetch_pages=int(data.get("fetchPages") or 0),
+                    )
+            except TimeoutError:
+                print(f"Web Search Node {node_id} timed out")
+                await self._finish_node(node_id, "timeout", started)
+                return {"items": [], "sources": [], "notes": ["[Web Search Failed: timed out]"]}
+            await self._finish_node(node_id, "done", started)
+            await self._emit_sources(sources)
+            return {"items": items, "sources": sources, "notes": [note] if note else []}
+
+        if node_type == "llmEngine":
+            print(f"Executing LLM Node: {node_id}")
+            started = time.perf_counter()
+            await self._emit_progress(node_id, "running")
+            web_items, web_note, web_sources = await web_task if web_task else ([], "", [])
+            memory = await self._memory(memory_task) if memory_task else []
+            call = self._build_llm_call(node_id, config, inputs, web_items, web_note, web_sources, memory)
+            call.deadline = self.node_deadline(config.timeout)
+            if prepare_only:
+                # The answer is streamed by the caller, which records the node when it ends
+                call.started = started
+                return call
+            try:
+                async with asyncio.timeout_at(call.deadline):
+                    response = await call.complete()
+            except LLMCallError:
+                node_finished(node_id, node_type, "error", started)
+                raise
+            except TimeoutError:
+                print(f"LLM Node {node_id} timed out")
+                await self._finish_node(node_id, "timeout", started)
+                # Downstream nodes go on without this step, the answering node reports it
+                response = TIMEOUT_RESPONSE if node_id == self.graph.result_node else ""
+                return {"response": response, "sources": call.sources, "context_usage": call.context_usage}
+            await self._finish_node(node_id, "done", started)
+            return {"response": response, "sources": call.sources, "context_usage": call.context_usage}
+
+        # userQuery / output and unknown node types just pass their inputs through
+        return {
+            "items": [item for i in inputs for item in i.get("items", [])],
+            "notes": [note for i in inputs for note in i.get("notes", [])],
+            "response": "\n\n".join(i.get("response", "") for i in inputs if i.get("response")),
+            "sources": merge_sources(*[i.get("sources", []) for i in inputs]),
+        }
+
+    async def _memory(self, memory_task: asyncio.Task) -> List[Dict[str, str]]:
+        try:
+            return await memory_task
+        except Exception as e:
+            # The answer doesn't depend on the history being available
+            print(f"Chat memory error: {e}")
+            return []
+
+    def _build_llm_call(self, node_id, config, inputs, web_items, web_note, web_sources, memory=()) -> LLMCall:
+        input_items = [item for i in inputs for item in i.get("items", [])]
+        kb_items = [item for item in input_items if item.kind == "kb"]
+        # Results of upstream webSearch nodes join the node's own web search
+        web_items = [item for item in input_items if item.kind == "web"] + web_items
+        web_note = "\n".join([note for i in inputs for note in i.get("notes", [])] + ([web_note] if web_note else []))
+        upstream = "\n\n".join(i["response"] for i in inputs if i.get("response"))
+        budget = context_budget(config.model, config.context_tokens)
+        assembled = assemble_context(self.user_query, kb_items, web_items, upstream, budget)
+        print(f"Context for LLM Node {node_id}: {assembled.tokens}/{budget} tokens "
+              f"from {len(assembled.usage)} sources, {assembled.dropped} items dropped")
+
+        # Construct Final Prompt
+        final_system_message = config.system_prompt
+        final_user_message = f"User Query: {self.user_query}"
+
+        if assembled.kb_context:
+            final_user_message += f"\n\nContext from Knowledge Base:\n{assembled.kb_context}"
+
+        if assembled.upstream:
+            final_user_message += f"\n\nOutput from previous step:\n{assembled.upstream}"
+
+        web_context = "\n\n".join(part for part in (assembled.web_context, web_note) if part)
+        if web_context:
+            final_user_message += f"\n\n{web_context}"
+
+        sources = merge_sources(*[i.get("sources", []) for i in inputs], web_sources)
+        messages = [
+            {"role": "system", "content": final_system_message},
+            *memory,
+            {"role": "user", "content": final_user_message},
+        ]
+        cache_parts = [assembled.kb_context, assembled.upstream, web_context]
+        if memory:
+            # Earlier turns change the answer, so they are part of the cached context too
+            cache_parts.append("\n".join(f"{message['role']}: {message['content']}" for message in memory))
+        cache_context = "\n\n".join(cache_parts)
+        return LLMCall(node_id, config, messages, sources, query=self.user_query, context=cache_context,
+                       context_usage=assembled.usage)
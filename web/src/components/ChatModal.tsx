@@ -10,8 +10,16 @@ interface Message {
     role: 'user' | 'assistant';
     content: string;
     sources?: string[];
+    // What the workflow is doing before the first token arrives
+    status?: string;
 }
 
+const PROGRESS_LABELS: Record<string, string> = {
+    knowledgeBase: 'Searching knowledge base...',
+    webSearch: 'Searching the web...',
+    llmEngine: 'Generating response...',
+};
+
 interface ChatModalProps {
     isOpen: boolean;
     onClose: () => void;
@@ -21,6 +29,8 @@ const ChatModal: React.FC<ChatModalProps> = ({ isOpen, onClose }) => {
     const { id: workflowId } = useParams();
     const { toObject } = useReactFlow();
     const [messages, setMessages] = useState<Message[]>([]);
+    // One conversation per chat: LLM node memory only sees earlier turns sent with the same id
+    const [conversationId] = useState(() => `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`);
     const [inputValue, setInputValue] = useState('');
     const [isThinking, setIsThinking] = useState(false);
     const messagesEndRef = useRef<HTMLDivElement>(null);
@@ -62,6 +72,7 @@ const ChatModal: React.FC<ChatModalProps> = ({ isOpen, onClose }) => {
                 },
                 body: JSON.stringify({
                     workflow_id: workflowId || "temp",
+                    conversation_id: conversationId,
                     query: userQuery,
                     nodes: flow.nodes,
                     edges: flow.edges
@@ -87,6 +98,8 @@ const ChatModal: React.FC<ChatModalProps> = ({ isOpen, onClose }) => {
             const decoder = new TextDecoder();
             let accumulatedContent = '';
             let sources: string[] = [];
+            // SSE frames can be split across reads, keep the incomplete last line
+            let pending = '';
 
             if (!reader) {
                 throw new Error('No reader available');
@@ -96,8 +109,9 @@ const ChatModal: React.FC<ChatModalProps> = ({ isOpen, onClose }) => {
                 const { done, value } = await reader.read();
                 if (done) break;
 
-                const chunk = decoder.decode(value, { stream: true });
-                const lines = chunk.split('\n');
+                pending += decoder.decode(value, { stream: true });
+                const lines = pending.split('\n');
+                pending = lines.pop() ?? '';
 
                 for (const line of lines) {
                     if (line.startsWith('data: ')) {
@@ -113,6 +127,17 @@ const ChatModal: React.FC<ChatModalProps> = ({ isOpen, onClose }) => {
                                             : msg
                                     )
                                 );
+                            } else if (data.type === 'progress' && data.status === 'running') {
+                                const status = PROGRESS_LABELS[data.nodeType];
+                                if (status) {
+                                    setMessages((prev) =>
+                                        prev.map((msg) =>
+                                            msg.id === assistantMessageId
+                                                ? { ...msg, status }
+                                                : msg
+                                        )
+                                    );
+                                }
                             } else if (data.type === 'sources') {
                                 sources = data.content;
                                 setMessages((prev) =>
@@ -222,7 +247,7 @@ const ChatModal: React.FC<ChatModalProps> = ({ isOpen, onClose }) => {
                                                     <span className="w-2 h-2 bg-gray-400 rounded-full animate-bounce" style={{ animationDelay: '150ms' }}></span>
                                                     <span className="w-2 h-2 bg-gray-400 rounded-full animate-bounce" style={{ animationDelay: '300ms' }}></span>
                                                 </div>
-                                                <span className="text-sm text-gray-500 ml-2">Generating response...</span>
+                                                <span className="text-sm text-gray-500 ml-2">{msg.status || 'Generating response...'}</span>
                                             </div>
                                         ) : (
                                             <ReactMarkdown>{msg.content}</ReactMarkdown>
@@ -26,8 +26,8 @@ const Dashboard: React.FC = () => {
             const response = await fetch(API_ENDPOINTS.WORKFLOWS);
             if (!response.ok) throw new Error('Failed to fetch stacks');
             const data = await response.json();
-            // Backend returns list of workflows
-            setStacks(data);
+            // Backend returns a page of workflows (most recently updated first)
+            setStacks(data.items);
         } catch (error) {
             console.error(error);
         } finally {
@@ -1,6 +1,6 @@
 import React from 'react';
 import { useNavigate } from 'react-router-dom';
-import { MessageSquare, Database, BrainCircuit, MessageCircle, GripVertical, ChevronLeft, ChevronRight } from 'lucide-react';
+import { MessageSquare, Database, BrainCircuit, MessageCircle, Globe, GripVertical, ChevronLeft, ChevronRight } from 'lucide-react';
 
 interface SidebarProps {
     isCollapsed: boolean;
@@ -115,6 +115,26 @@ const Sidebar: React.FC<SidebarProps> = ({ isCollapsed, toggleSidebar }) => {
                     )}
                 </div>
 
+                {/* Web Search */}
+                <div
+                    className={`p-3 bg-white border border-gray-200 rounded-lg cursor-grab hover:border-primary hover:shadow-sm transition-all flex items-center ${isCollapsed ? 'justify-center' : 'justify-between'} group`}
+                    onDragStart={(event) => onDragStart(event, 'webSearch')}
+                    draggable
+                    title="Web Search"
+                >
+                    <div className="flex items-center gap-3">
+                        <div className="text-gray-500">
+                            <Globe size={16} />
+                        </div>
+                        {!isCollapsed && <span className="text-sm font-medium text-gray-700">Web Search</span>}
+                    </div>
+                    {!isCollapsed && (
+                        <div className="text-gray-300 group-hover:text-primary">
+                            <GripVertical size={14} />
+                        </div>
+                    )}
+                </div>
+
                 {/* Output */}
                 <div
                     className={`p-3 bg-white border border-gray-200 rounded-lg cursor-grab hover:border-primary hover:shadow-sm transition-all flex items-center ${isCollapsed ? 'justify-center' : 'justify-between'} group`}
@@ -26,48 +26,66 @@ const KnowledgeBaseNode = ({ id, data, selected }: { id: string; data: any; sele
         );
     };
 
+    // Older workflows store a single `file`, newer ones a `files` list
+    const files: any[] = data.files ?? (data.file ? [data.file] : []);
+
+    const setFiles = (update: (current: any[]) => any[]) => {
+        setNodes((nds) =>
+            nds.map((node) => {
+                if (node.id === id) {
+                    const current = node.data.files ?? (node.data.file ? [node.data.file] : []);
+                    return {
+                        ...node,
+                        data: {
+                            ...node.data,
+                            file: null,
+                            files: update(current)
+                        }
+                    };
+                }
+                return node;
+            })
+        );
+    };
+
     const handleFileClick = () => {
         fileInputRef.current?.click();
     };
 
     const handleFileChange = async (event: React.ChangeEvent<HTMLInputElement>) => {
-        const file = event.target.files?.[0];
-        if (!file) return;
+        const selected = Array.from(event.target.files ?? []);
+        if (selected.length === 0) return;
 
         setIsUploading(true);
-        const formData = new FormData();
-        formData.append('file', file);
-
         try {
-            const response = await fetch(API_ENDPOINTS.UPLOAD, {
-                method: 'POST',
-                body: formData,
-            });
+            for (const file of selected) {
+                const formData = new FormData();
+                formData.append('file', file);
+                // Files of a named knowledge base share its own vector store collection
+                if (data.collection) {
+                    formData.append('knowledge_base', data.collection);
+                }
 
-            if (!response.ok) {
-                throw new Error('Upload failed');
-            }
+                const response = await fetch(API_ENDPOINTS.UPLOAD, {
+                    method: 'POST',
+                    body: formData,
+                });
 
-            const result = await response.json();
-
-            setNodes((nds) =>
-                nds.map((node) => {
-                    if (node.id === id) {
-                        return {
-                            ...node,
-                            data: {
-                                ...node.data,
-                                file: {
-                                    name: result.filename,
-                                    id: result.id,
-                                    path: result.file_path
-                                }
-                            }
-                        };
+                if (!response.ok) {
+                    throw new Error('Upload failed');
+                }
+
+                const result = await response.json();
+                setFiles((current) => [
+                    ...current,
+                    {
+                        name: result.filename,
+                        id: result.id,
+                        path: result.file_path,
+                        collection: result.collection
                     }
-                    return node;
-                })
-            );
+                ]);
+            }
         } catch (error) {
             console.error('Error uploading file:', error);
             alert('Failed to upload file');
@@ -79,22 +97,9 @@ const KnowledgeBaseNode = ({ id, data, selected }: { id: string; data: any; sele
         }
     };
 
-    const handleRemoveFile = (e: React.MouseEvent) => {
+    const handleRemoveFile = (e: React.MouseEvent, fileId: number) => {
         e.stopPropagation();
-        setNodes((nds) =>
-            nds.map((node) => {
-                if (node.id === id) {
-                    return {
-                        ...node,
-                        data: {
-                            ...node.data,
-                            file: null
-                        }
-                    };
-                }
-                return node;
-            })
-        );
+        setFiles((current) => current.filter((file) => file.id !== fileId));
     };
 
     return (
@@ -112,45 +117,58 @@ const KnowledgeBaseNode = ({ id, data, selected }: { id: string; data: any; sele
             {/* Content */}
             <div className="p-4 space-y-4">
                 <div className="text-xs text-gray-500">
-                    Let LLM search info in your file
+                    Let LLM search info in your files
+                </div>
+
+                {/* Knowledge Base Name */}
+                <div>
+                    <label className="text-xs font-semibold text-gray-700 block mb-1">Knowledge Base</label>
+                    <input
+                        type="text"
+                        className="w-full text-xs p-2 border border-gray-200 rounded-lg bg-white focus:outline-none focus:ring-1 focus:ring-primary text-gray-700"
+                        placeholder="Optional, searches every file in it"
+                        value={data.collection || ''}
+                        onChange={(e) => updateData('collection', e.target.value)}
+                    />
                 </div>
 
                 {/* File Upload */}
                 <div>
-                    <label className="text-xs font-semibold text-gray-700 block mb-1">File for Knowledge Base</label>
+                    <label className="text-xs font-semibold text-gray-700 block mb-1">Files for Knowledge Base</label>
                     <input
                         type="file"
                         ref={fileInputRef}
                         className="hidden"
                         onChange={handleFileChange}
                         accept=".pdf,.txt,.md"
+                        multiple
                     />
 
-                    {data.file ? (
-                        <div className="flex items-center justify-between p-2 border border-green-200 bg-green-50 rounded text-green-700 text-xs">
-                            <span className="truncate max-w-[180px]" title={data.file.name}>{data.file.name}</span>
-                            <button onClick={handleRemoveFile} className="text-gray-400 hover:text-red-500">
+                    {files.map((file) => (
+                        <div key={file.id} className="flex items-center justify-between p-2 mb-1 border border-green-200 bg-green-50 rounded text-green-700 text-xs">
+                            <span className="truncate max-w-[180px]" title={file.name}>{file.name}</span>
+                            <button onClick={(e) => handleRemoveFile(e, file.id)} className="text-gray-400 hover:text-red-500">
                                 <Trash2 size={12} />
                             </button>
                         </div>
-                    ) : (
-                        <div
-                            onClick={handleFileClick}
-                            className={`border border-dashed border-green-300 bg-green-50/50 rounded-lg p-3 flex flex-col items-center justify-center cursor-pointer hover:bg-green-50 transition-colors ${isUploading ? 'opacity-50 pointer-events-none' : ''}`}
-                        >
-                            {isUploading ? (
-                                <span className="text-green-600 text-xs font-medium flex items-center gap-1">
-                                    <Loader2 size={12} className="animate-spin" />
-                                    Uploading...
-                                </span>
-                            ) : (
-                                <span className="text-green-600 text-xs font-medium flex items-center gap-1">
-                                    <Upload size={12} />
-                                    Upload File
-                                </span>
-                            )}
-                        </div>
-                    )}
+                    ))}
+
+                    <div
+                        onClick={handleFileClick}
+                        className={`border border-dashed border-green-300 bg-green-50/50 rounded-lg p-3 flex flex-col items-center justify-center cursor-pointer hover:bg-green-50 transition-colors ${isUploading ? 'opacity-50 pointer-events-none' : ''}`}
+                    >
+                        {isUploading ? (
+                            <span className="text-green-600 text-xs font-medium flex items-center gap-1">
+                                <Loader2 size={12} className="animate-spin" />
+                                Uploading...
+                            </span>
+                        ) : (
+                            <span className="text-green-600 text-xs font-medium flex items-center gap-1">
+                                <Upload size={12} />
+                                {files.length ? 'Add Files' : 'Upload Files'}
+                            </span>
+                        )}
+                    </div>
                 </div>
 
                 {/* Embedding Model */}
@@ -166,6 +184,21 @@ const KnowledgeBaseNode = ({ id, data, selected }: { id: string; data: any; sele
                     </select>
                 </div>
 
+                {/* Retrieval Mode */}
+                <div>
+                    <label className="text-xs font-semibold text-gray-700 block mb-1">Retrieval</label>
+                    <select
+                        className="w-full text-xs p-2 border border-gray-200 rounded-lg bg-white focus:outline-none focus:ring-1 focus:ring-primary text-gray-700"
+                        value={data.retrievalMode || ''}
+                        onChange={(e) => updateData('retrievalMode', e.target.value || undefined)}
+                    >
+                        <option value="">Default</option>
+                        <option value="hybrid">Hybrid (keywords + semantic)</option>
+                        <option value="vector">Semantic only</option>
+                        <option value="lexical">Keywords only</option>
+                    </select>
+                </div>
+
                 {/* API Key */}
                 <div>
                     <label className="text-xs font-semibold text-gray-700 block mb-1">API Key</label>
@@ -129,6 +129,50 @@ const LLMEngineNode = ({ id, data, selected }: { id: string; data: any; selected
                         />
                     </div>
                 )}
+
+                {/* Conversation memory: earlier turns of this (saved) workflow, 0 disables it */}
+                <div>
+                    <label className="text-xs font-semibold text-gray-700 block mb-1">Memory (turns)</label>
+                    <input
+                        type="number"
+                        min={0}
+                        step={1}
+                        className="w-full text-xs p-2 border border-gray-200 rounded-lg bg-white focus:outline-none focus:ring-1 focus:ring-primary text-gray-700"
+                        placeholder="0"
+                        value={data.memoryTurns ?? ''}
+                        onChange={(e) => updateData('memoryTurns', e.target.value === '' ? undefined : parseInt(e.target.value, 10))}
+                    />
+                </div>
+
+                {/* Response Cache Toggle */}
+                <div className="flex items-center justify-between">
+                    <span className="text-xs font-semibold text-gray-700 flex items-center gap-1">
+                        Cache Responses
+                    </span>
+                    <div
+                        className={`w-8 h-4 rounded-full relative cursor-pointer transition-colors ${data.cacheResponses ? 'bg-green-500' : 'bg-gray-300'}`}
+                        onClick={() => updateData('cacheResponses', !data.cacheResponses)}
+                    >
+                        <div className={`absolute top-0.5 w-3 h-3 bg-white rounded-full shadow-sm transition-all ${data.cacheResponses ? 'right-0.5' : 'left-0.5'}`}></div>
+                    </div>
+                </div>
+
+                {/* Similar-query matching threshold, empty means exact matches only */}
+                {data.cacheResponses && (
+                    <div>
+                        <label className="text-xs font-semibold text-gray-700 block mb-1">Match Similar Queries</label>
+                        <input
+                            type="number"
+                            max={1}
+                            min={0}
+                            step={0.01}
+                            className="w-full text-xs p-2 border border-gray-200 rounded-lg bg-white focus:outline-none focus:ring-1 focus:ring-primary text-gray-700"
+                            placeholder="Exact only (e.g. 0.95)"
+                            value={data.cacheSimilarity ?? ''}
+                            onChange={(e) => updateData('cacheSimilarity', e.target.value === '' ? undefined : parseFloat(e.target.value))}
+                        />
+                    </div>
+                )}
             </div>
 
             {/* Input Handles */}
@@ -0,0 +1,130 @@
+import { Handle, Position, useReactFlow, Node } from 'reactflow';
+import { Globe } from 'lucide-react';
+import NodeHeader from './NodeHeader';
+
+const WebSearchNode = ({ id, data, selected }: { id: string; data: any; selected: boolean }) => {
+    const { setNodes } = useReactFlow();
+
+    const updateData = (key: string, value: any) => {
+        setNodes((nds: Node[]) =>
+            nds.map((node: Node) => {
+                if (node.id === id) {
+                    return {
+                        ...node,
+                        data: {
+                            ...node.data,
+                            [key]: value,
+                        },
+                    };
+                }
+                return node;
+            })
+        );
+    };
+
+    return (
+        <div className={`w-[280px] bg-white rounded-xl shadow-card border transition-all ${selected ? 'border-primary ring-1 ring-primary' : 'border-border-color'}`}>
+            <NodeHeader
+                id={id}
+                title="Web Search"
+                icon={
+                    <div className="w-6 h-6 bg-white border border-gray-200 rounded flex items-center justify-center text-gray-600">
+                        <Globe size={14} />
+                    </div>
+                }
+            />
+
+            {/* Content */}
+            <div className="p-4 space-y-4">
+                <div className="text-xs text-gray-500">
+                    Search the web for the query and pass the results on as context
+                </div>
+
+                {/* Engine and Locale */}
+                <div className="flex gap-2">
+                    <div className="flex-1">
+                        <label className="text-xs font-semibold text-gray-700 block mb-1">Engine</label>
+                        <select
+                            className="w-full text-xs p-2 border border-gray-200 rounded-lg bg-white focus:outline-none focus:ring-1 focus:ring-primary text-gray-700"
+                            value={data.engine || 'google'}
+                            onChange={(e) => updateData('engine', e.target.value)}
+                        >
+                            <option value="google">Google</option>
+                            <option value="bing">Bing</option>
+                            <option value="duckduckgo">DuckDuckGo</option>
+                        </select>
+                    </div>
+                    <div className="w-20">
+                        <label className="text-xs font-semibold text-gray-700 block mb-1">Locale</label>
+                        <input
+                            type="text"
+                            className="w-full text-xs p-2 border border-gray-200 rounded-lg bg-white focus:outline-none focus:ring-1 focus:ring-primary text-gray-700"
+                            placeholder="en"
+                            value={data.locale || ''}
+                            onChange={(e) => updateData('locale', e.target.value)}
+                        />
+                    </div>
+                </div>
+
+                {/* Results and Page Fetching */}
+                <div className="flex gap-2">
+                    <div className="flex-1">
+                        <label className="text-xs font-semibold text-gray-700 block mb-1">Results</label>
+                        <input
+                            type="number"
+                            min={1}
+                            max={10}
+                            className="w-full text-xs p-2 border border-gray-200 rounded-lg bg-white focus:outline-none focus:ring-1 focus:ring-primary text-gray-700"
+                            value={data.numResults ?? 3}
+                            onChange={(e) => updateData('numResults', parseInt(e.target.value) || 3)}
+                        />
+                    </div>
+                    <div className="flex-1">
+                        <label className="text-xs font-semibold text-gray-700 block mb-1" title="Fetch the text of the top result pages">Read Pages</label>
+                        <input
+                            type="number"
+                            min={0}
+                            max={5}
+                            className="w-full text-xs p-2 border border-gray-200 rounded-lg bg-white focus:outline-none focus:ring-1 focus:ring-primary text-gray-700"
+                            value={data.fetchPages ?? 0}
+                            onChange={(e) => updateData('fetchPages', parseInt(e.target.value) || 0)}
+                        />
+                    </div>
+                </div>
+
+                {/* API Key */}
+                <div>
+                    <label className="text-xs font-semibold text-gray-700 block mb-1">SERP API Key</label>
+                    <input
+                        type="password"
+                        className="w-full text-xs p-2 border border-gray-200 rounded-lg bg-white focus:outline-none focus:ring-1 focus:ring-primary text-gray-700"
+                        placeholder="******************"
+                        value={data.serpApiKey || ''}
+                        onChange={(e) => updateData('serpApiKey', e.target.value)}
+                    />
+                </div>
+            </div>
+
+            {/* Handles */}
+            <div className="absolute -left-3 top-2/3 flex items-center" style={{ top: '60%' }}>
+                <Handle
+                    type="target"
+                    position={Position.Left}
+                    className="!bg-orange-400 !w-3 !h-3 !border-2 !border-white !opacity-100"
+                />
+                <span className="ml-2 text-[10px] font-medium text-gray-500 bg-transparent relative z-10 pointer-events-none">Query</span>
+            </div>
+
+            <div className="absolute -right-3 top-2/3 flex items-center" style={{ top: '60%' }}>
+                <span className="mr-2 text-[10px] font-medium text-gray-500 bg-transparent relative z-10 pointer-events-none">Context</span>
+                <Handle
+                    type="source"
+                    position={Position.Right}
+                    className="!bg-orange-400 !w-3 !h-3 !border-2 !border-white !opacity-100"
+                />
+            </div>
+        </div>
+    );
+};
+
+export default WebSearchNode;
@@ -2,10 +2,12 @@ import UserQueryNode from './UserQueryNode';
 import KnowledgeBaseNode from './KnowledgeBaseNode';
 import LLMEngineNode from './LLMEngineNode';
 import OutputNode from './OutputNode';
+import WebSearchNode from './WebSearchNode';
 
 export const nodeTypes = {
     userQuery: UserQueryNode,
     knowledgeBase: KnowledgeBaseNode,
     llmEngine: LLMEngineNode,
+    webSearch: WebSearchNode,
     output: OutputNode,
 };